@@ -0,0 +1,200 @@
+import io
+import os
+import pathlib
+import subprocess
+
+import pytest
+
+Image = pytest.importorskip("PIL.Image")
+zstd = pytest.importorskip("zstandard")
+
+try:
+    # importing the package builds the app, which needs its database up
+    from nuclei_backend.storage_service.image_compression.image_compression_utils import (
+        recompress_image,
+    )
+    from nuclei_backend.storage_service.misc_compression.misc_compression_utils import (
+        compress_misc,
+        decompress_misc,
+        train_dictionary,
+    )
+    from nuclei_backend.storage_service.video_compression import (
+        video_compression_utils as video,
+    )
+except Exception as e:  # noqa: BLE001
+    pytest.skip(f"nuclei_backend not importable here: {e}", allow_module_level=True)
+
+
+def encode(image, image_format: str, **options) -> bytes:
+    out = io.BytesIO()
+    image.save(out, image_format, **options)
+    return out.getvalue()
+
+
+def photo(size=(256, 256)):
+    # a gradient with noise, so JPEG quality makes a real difference
+    image = Image.linear_gradient("L").resize(size).convert("RGB")
+    noise = Image.frombytes("RGB", size, os.urandom(size[0] * size[1] * 3))
+    return Image.blend(image, noise, 0.2)
+
+
+def test_recompress_image_shrinks_a_high_quality_jpeg():
+    source = encode(photo(), "JPEG", quality=100)
+    result = recompress_image(source, "photo.jpg")
+    assert not result.skipped
+    assert result.format == "JPEG"
+    assert result.compressed_size < len(source)
+    assert Image.open(io.BytesIO(result.data)).size == (256, 256)
+
+
+def test_recompress_image_reads_from_disk(tmp_path):
+    path = tmp_path / "photo.jpg"
+    path.write_bytes(encode(photo(), "JPEG", quality=100))
+    result = recompress_image(path, "photo.jpg")
+    assert not result.skipped
+    assert result.original_size == path.stat().st_size
+
+
+@pytest.mark.parametrize(
+    "source, reason",
+    [
+        (b"not an image at all", "not a readable image"),
+        (encode(photo((32, 32)), "BMP"), "unsupported format"),
+        (
+            encode(
+                Image.new("RGB", (32, 32), "red"),
+                "PNG",
+                save_all=True,
+                append_images=[Image.new("RGB", (32, 32), "blue")],
+            ),
+            "animated image",
+        ),
+        (
+            encode(Image.new("L", (64, 64), 0), "PNG", optimize=True),
+            "recompression doesn't pay",
+        ),
+    ],
+)
+def test_recompress_image_keeps_the_source(source, reason):
+    result = recompress_image(source, "upload.bin")
+    assert result.skipped
+    assert result.reason.startswith(reason)
+    assert result.data is source
+    assert result.filename == "upload.bin"
+
+
+def test_ffmpeg_command_rejects_unknown_presets(tmp_path):
+    with pytest.raises(ValueError):
+        video.ffmpeg_command(tmp_path / "in.mov", tmp_path / "out.mp4", "nope")
+
+
+def test_ffmpeg_command_bounds_threads(tmp_path):
+    command = video.ffmpeg_command(tmp_path / "in.mov", tmp_path / "out.mp4", "web")
+    threads = int(command[command.index("-threads") + 1])
+    assert 1 <= threads <= (os.cpu_count() or 1)
+
+
+@pytest.fixture
+def movie(tmp_path) -> pathlib.Path:
+    source = tmp_path / "in.mov"
+    source.write_bytes(os.urandom(64 * 1024))
+    return source
+
+
+def fake_ffmpeg(monkeypatch, returncode=0, output_size=None, raises=None):
+    def run(command, **kwargs):
+        if raises is not None:
+            raise raises
+        # ffmpeg leaves a partial output behind on failure too
+        pathlib.Path(command[-1]).write_bytes(b"\0" * (output_size or 10))
+        return subprocess.CompletedProcess(
+            command, returncode, b"", b"in.mov: moov atom not found\n"
+        )
+
+    monkeypatch.setattr(video.subprocess, "run", run)
+
+
+def test_transcode_video_replaces_the_source(monkeypatch, movie, tmp_path):
+    fake_ffmpeg(monkeypatch, output_size=1024)
+    output = tmp_path / "out.mp4"
+    result = video.transcode_video(movie, output, "holiday.mov", "web")
+    assert not result.skipped
+    assert result.data == output
+    assert result.filename == "holiday.mp4"
+    assert result.bytes_saved == 63 * 1024
+
+
+@pytest.mark.parametrize(
+    "options, reason",
+    [
+        ({"returncode": 1}, "not a readable video: in.mov: moov atom not found"),
+        (
+            {"raises": subprocess.TimeoutExpired("ffmpeg", 1)},
+            "transcode timed out",
+        ),
+        ({"output_size": 64 * 1024}, "transcoding doesn't pay"),
+    ],
+)
+def test_transcode_video_keeps_the_source(monkeypatch, movie, tmp_path, options, reason):
+    fake_ffmpeg(monkeypatch, **options)
+    output = tmp_path / "out.mp4"
+    result = video.transcode_video(movie, output, "holiday.mov", "web")
+    assert result.skipped
+    assert result.reason == reason
+    assert result.data == movie
+    assert result.filename == "holiday.mov"
+    assert not output.exists()
+
+
+def test_transcode_video_without_ffmpeg_raises(monkeypatch, movie, tmp_path):
+    fake_ffmpeg(monkeypatch, raises=FileNotFoundError())
+    with pytest.raises(video.VideoTranscodeError):
+        video.transcode_video(movie, tmp_path / "out.mp4", "holiday.mov", "web")
+
+
+def documents(count: int) -> list[bytes]:
+    return [
+        (
+            b'{"id": %d, "name": "user %d", "email": "user%d@example.com", '
+            b'"roles": ["reader", "writer"], "active": true}' % (i, i, i)
+        )
+        for i in range(count)
+    ]
+
+
+def test_compress_misc_round_trips_without_a_dictionary():
+    source = b"".join(documents(200))
+    result = compress_misc(source, "users.json")
+    assert not result.skipped
+    assert result.filename == "users.json.zst"
+    assert result.dict_id == 0
+    assert decompress_misc(result.data) == source
+
+
+def test_compress_misc_round_trips_with_a_dictionary():
+    dictionary = train_dictionary(documents(500), dict_size=4096)
+    source = documents(501)[-1]
+    result = compress_misc(source, "user.json", dictionary=dictionary)
+    assert not result.skipped
+    assert result.dict_id == dictionary.dict_id()
+    assert result.compressed_size < len(zstd.ZstdCompressor().compress(source))
+    assert decompress_misc(result.data, dictionary) == source
+    with pytest.raises(zstd.ZstdError):
+        decompress_misc(result.data)
+
+
+def test_compress_misc_streams_files_on_disk(tmp_path):
+    source = tmp_path / "users.json"
+    source.write_bytes(b"".join(documents(2000)))
+    output = tmp_path / "users.json.zst"
+    result = compress_misc(source, "users.json", output=output)
+    assert result.data == output
+    assert decompress_misc(output.read_bytes()) == source.read_bytes()
+
+
+def test_compress_misc_keeps_incompressible_input():
+    source = os.urandom(4096)
+    result = compress_misc(source, "random.bin")
+    assert result.skipped
+    assert result.data is source
+    assert result.filename == "random.bin"
@@ -0,0 +1,155 @@
+import asyncio
+import uuid
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("celery")
+from fastapi import HTTPException  # noqa: E402
+from sqlalchemy.orm import Session  # noqa: E402
+
+try:
+    # importing the package builds the app, which needs its database up
+    from nuclei_backend.storage_service import compression_jobs, job_routes
+except Exception as e:  # noqa: BLE001
+    pytest.skip(f"nuclei_backend not importable here: {e}", allow_module_level=True)
+
+
+class Retry(Exception):
+    pass
+
+
+class FakeSession(Session):
+    """An unbound session, so commits fire their events without a database."""
+
+    def __init__(self, users: dict):
+        super().__init__()
+        self.users = users
+
+    def get(self, model, user_id):
+        return self.users.get(user_id)
+
+
+def fake_task(retries: int, max_retries: int = 3):
+    def retry(exc, countdown):
+        task.retried_with = (exc, countdown)
+        return Retry()
+
+    task = SimpleNamespace(
+        request=SimpleNamespace(id="job", retries=retries),
+        max_retries=max_retries,
+        retry=retry,
+        retried_with=None,
+    )
+    return task
+
+
+@pytest.fixture
+def user(monkeypatch):
+    user = SimpleNamespace(id="owner")
+    monkeypatch.setattr(
+        compression_jobs, "SessionLocal", lambda: FakeSession({user.id: user})
+    )
+    return user
+
+
+@pytest.fixture
+def spool(tmp_path):
+    path = tmp_path / "upload.bin"
+    path.write_bytes(b"payload")
+    return path
+
+
+def test_run_job_returns_the_result_and_removes_the_spool(user, spool):
+    def work(path, job_user, db):
+        assert path.read_bytes() == b"payload"
+        assert job_user is user
+        return {"ok": True}
+
+    assert compression_jobs.run_job(fake_task(0), str(spool), user.id, work) == {
+        "ok": True
+    }
+    assert not spool.exists()
+
+
+def failing(path, user, db):
+    raise RuntimeError("kubo went away")
+
+
+def test_run_job_retries_with_backoff_and_keeps_the_spool(user, spool):
+    task = fake_task(retries=1)
+    with pytest.raises(Retry):
+        compression_jobs.run_job(task, str(spool), user.id, failing)
+    exc, countdown = task.retried_with
+    assert str(exc) == "kubo went away"
+    assert countdown == compression_jobs.Config.COMPRESSION_RETRY_BACKOFF * 2
+    # the retry runs from the same spooled upload
+    assert spool.exists()
+
+
+def test_run_job_gives_up_after_max_retries_and_removes_the_spool(user, spool):
+    task = fake_task(retries=3, max_retries=3)
+    with pytest.raises(RuntimeError):
+        compression_jobs.run_job(task, str(spool), user.id, failing)
+    assert task.retried_with is None
+    assert not spool.exists()
+
+
+def test_run_job_does_not_retry_once_the_record_is_committed(user, spool):
+    def fails_after_commit(path, user, db):
+        db.commit()
+        raise RuntimeError("socket publish failed")
+
+    task = fake_task(retries=0)
+    with pytest.raises(RuntimeError):
+        compression_jobs.run_job(task, str(spool), user.id, fails_after_commit)
+    # a retry would store the record a second time
+    assert task.retried_with is None
+    assert not spool.exists()
+
+
+def test_run_job_drops_jobs_of_deleted_users(user, spool):
+    task = fake_task(retries=0)
+    with pytest.raises(compression_jobs.JobUserMissing):
+        compression_jobs.run_job(task, str(spool), "deleted", failing)
+    assert task.retried_with is None
+    assert not spool.exists()
+
+
+OWNER, OTHER = uuid.uuid4(), uuid.uuid4()
+
+
+@pytest.fixture
+def jobs(monkeypatch):
+    jobs = {
+        "mine": {"user_id": str(OWNER), "kind": "image", "file_name": "a.png"},
+        "theirs": {"user_id": str(OTHER), "kind": "image", "file_name": "b.png"},
+    }
+    monkeypatch.setattr(job_routes, "get_job", jobs.get)
+    monkeypatch.setattr(
+        job_routes, "job_status", lambda job_id: {"job_id": job_id, "state": "PENDING"}
+    )
+
+
+def job_status_of(job_id: str) -> dict:
+    return asyncio.run(
+        job_routes.get_job_status(job_id, current_user=SimpleNamespace(id=OWNER))
+    )
+
+
+def test_job_status_of_own_job(jobs):
+    assert job_status_of("mine") == {
+        "job_id": "mine",
+        "state": "PENDING",
+        "kind": "image",
+        "file_name": "a.png",
+    }
+
+
+@pytest.mark.parametrize("job_id", ["theirs", "missing"])
+def test_job_status_hides_other_users_jobs(jobs, job_id):
+    with pytest.raises(HTTPException) as raised:
+        job_status_of(job_id)
+    # someone else's job can't be told apart from a missing one
+    assert raised.value.status_code == 404
+    assert raised.value.detail == "Job not found"
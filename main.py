@@ -1,4 +1,5 @@
 import logging
+import os
 import subprocess
 
 import uvicorn
@@ -21,7 +22,7 @@ if __name__ == "__main__":
         "nuclei_backend:app",
         host="0.0.0.0",
         port=8000,
-        workers=4,
-        reload=True,
+        # size DB_POOL_SIZE/DB_MAX_OVERFLOW against this, see database/config.py
+        workers=int(os.environ.get("WEB_CONCURRENCY", 4)),
         use_colors=True,
     )
@@ -37,10 +37,17 @@ class Nuclei(FastAPI):
         from nuclei_backend.users.main import users_router
         from nuclei_backend.storage_service.main import storage_service
         from nuclei_backend.syncing_service.sync_service_main import sync_router
+        from nuclei_backend.database.main import database_router
+        from nuclei_backend.syncing_service.utils.socket_connection import (
+            socket_manager,
+        )
 
         self.include_router(storage_service)
         self.include_router(users_router)
         self.include_router(sync_router)
+        self.include_router(database_router)
+        # socket.io clients connect to /ws/socket.io for live sync changes
+        socket_manager.mount_to("/ws", self)
 
     @lru_cache(maxsize=None)
     def add_models(self):
@@ -0,0 +1,5 @@
+from fastapi import APIRouter
+
+database_router = APIRouter(prefix="/database")
+
+from .pool_routes import *  # noqa: E402, F403
@@ -0,0 +1,28 @@
+import os
+
+from fastapi import Depends
+
+from ..users.auth_utils import get_current_admin
+from ..users.user_models import User
+from . import async_engine, engine
+from .config import DatabaseConfig
+from .main import database_router
+from .pool_stats import pool_status
+
+
+@database_router.get("/pool")
+async def pool_stats(user: User = Depends(get_current_admin)):
+    """Connection pool usage for this worker's sync and async engines, admins only."""
+    return {
+        "worker_pid": os.getpid(),
+        "config": {
+            "pool_size": DatabaseConfig.POOL_SIZE,
+            "max_overflow": DatabaseConfig.MAX_OVERFLOW,
+            "pool_timeout": DatabaseConfig.POOL_TIMEOUT,
+            "pool_recycle": DatabaseConfig.POOL_RECYCLE,
+            "pool_pre_ping": DatabaseConfig.POOL_PRE_PING,
+            "statement_timeout_ms": DatabaseConfig.STATEMENT_TIMEOUT_MS,
+        },
+        "sync": pool_status(engine.pool),
+        "async": pool_status(async_engine.sync_engine.pool),
+    }
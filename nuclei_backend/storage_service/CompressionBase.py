@@ -1,14 +1,27 @@
+import io
 import pathlib
-from typing import Literal
+from typing import BinaryIO, Literal
 from uuid import uuid4
 
-from .ipfs_utils import assemble_record, produce_cid
+from ..syncing_service.utils.socket_connection import change_entry, socket_manager
+from .config import Config
+from .ipfs_utils import assemble_record, produce_cid, produce_cid_file
 
 
 class CompressionImpl:
-    def __init__(self, app_path: Literal["video", "image", "misc"]):
+    def __init__(
+        self,
+        app_path: Literal["video", "image", "misc"],
+        spool_threshold: int = Config.COMPRESSION_SPOOL_THRESHOLD,
+    ):
         print("app path ", app_path)
         self.app_path = app_path
+        self.spool_threshold = spool_threshold
+        # the input: bytes in memory mode, a path when it lives on disk
+        self.source: bytes | pathlib.Path | None = None
+        self.compression_temp_file = None
+        # codec outputs written to the temp folder, removed with the input
+        self.compression_outputs: list[pathlib.Path] = []
         self.path_variation = {
             "video": (
                 pathlib.Path(__file__).parent.joinpath("video_compression")
@@ -28,14 +41,68 @@ class CompressionImpl:
         print("saving to temp")
         temp_dir = self.path_variation[self.app_path]
         temp_dir.mkdir(exist_ok=True)
-        self.file_type = filename[int(filename.index(".")) :]
-        temp_file_identity = f"temp_file{uuid4()}{filename[int(filename.index('.')):]}"
+        self.file_type = filename[filename.index(".") :] if "." in filename else ""
+        temp_file_identity = f"temp_file{uuid4()}{self.file_type}"
         self.temp_file_identity = temp_file_identity
         temp_file = temp_dir / temp_file_identity
         temp_file.write_bytes(file_bytes)
         print("saved to temp")
         return (temp_file, temp_file_identity)
 
+    def load_source(self, file: bytes | pathlib.Path, filename: str) -> None:
+        """
+        Takes the input to compress. Bytes up to `spool_threshold` stay in
+        memory and are handed to the codec and the IPFS add as they are;
+        larger ones are spooled to the temp folder. A path is used in place,
+        or read into memory when it is small enough.
+        """
+        if isinstance(file, pathlib.Path):
+            if file.stat().st_size <= self.spool_threshold:
+                self.source = file.read_bytes()
+            else:
+                self.source = file
+        elif len(file) <= self.spool_threshold:
+            self.source = file
+        else:
+            self.compression_temp_file = self.save_to_temp(file, filename)
+            self.source = self.compression_temp_file[0]
+
+    @property
+    def in_memory(self) -> bool:
+        return not isinstance(self.source, pathlib.Path)
+
+    def source_size(self) -> int:
+        return len(self.source) if self.in_memory else self.source.stat().st_size
+
+    def open_source(self) -> BinaryIO:
+        # BytesIO over a bytes object shares its buffer instead of copying it
+        return io.BytesIO(self.source) if self.in_memory else open(self.source, "rb")
+
+    def source_path(self, filename: str) -> pathlib.Path:
+        """The input as a file, spooling it first if it is held in memory."""
+        if self.in_memory:
+            self.compression_temp_file = self.save_to_temp(self.source, filename)
+            self.source = self.compression_temp_file[0]
+        return self.source
+
+    def output_temp(self, suffix: str) -> pathlib.Path:
+        """A fresh temp file path for codec output, cleaned up with the input."""
+        temp_dir = self.path_variation[self.app_path]
+        temp_dir.mkdir(exist_ok=True)
+        output = temp_dir / f"compressed_temp{uuid4()}{suffix}"
+        self.compression_outputs.append(output)
+        return output
+
+    def cleanup_compression_outcome(self) -> None:
+        """Drops the input and outputs, deleting files only if made here."""
+        if self.compression_temp_file is not None:
+            self.cleanup_file(self.compression_temp_file[0])
+            self.compression_temp_file = None
+        for output in self.compression_outputs:
+            output.unlink(missing_ok=True)
+        self.compression_outputs = []
+        self.source = None
+
     def cleanup_file(self, temp_file: str) -> None:
         print("cleaning")
         pathlib.Path(temp_file).unlink()
@@ -50,9 +117,25 @@ class CompressionImpl:
 
         return f"{parsed_file_path}/compressed_temp{file_uuid}"
 
-    def commit_to_ipfs(self, file, filename: str, user, db) -> str:
-        cid: str = produce_cid(file, filename)
-        print(cid)
-        data_record = assemble_record(file, filename, cid, user.id)
+    def commit_to_ipfs(self, file, filename: str, user, db, **columns) -> str:
+        """
+        Adds `file` (bytes, a memoryview or a path on disk) to IPFS and
+        records it for `user`, with any extra DataStorage `columns`.
+        """
+        if isinstance(file, pathlib.Path):
+            added = produce_cid_file(file, filename)
+            inline = None
+        else:
+            added = produce_cid(file, filename)
+            inline = file
+        if columns.get("compression") is not None:
+            # listeners get the original bytes, never the stored frame
+            inline = self.source if self.in_memory else None
+        print(added.cid)
+        data_record = assemble_record(filename, added, user.id, **columns)
         db.add(data_record)
         db.commit()
+        socket_manager.publish_change_sync(
+            user.id, "add", [change_entry(data_record, inline)]
+        )
+        return added.cid
@@ -0,0 +1,169 @@
+"""
+Durable queue for /compress/* work.
+
+Uploads are spooled to Config.COMPRESSION_SPOOL_DIR and a Celery task is
+queued on Redis for each one; workers run separately from the API and scale
+on their own. Start one with
+
+    celery -A nuclei_backend.storage_service.compression_jobs worker -l info
+
+Tasks are acked late, so a job whose worker dies is redelivered, and failed
+jobs are retried with exponential backoff before they are given up on.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import pathlib
+from typing import Callable
+from uuid import uuid4
+
+import aiofiles
+import redis
+from celery import Celery
+from celery.signals import worker_process_init
+from celery.result import AsyncResult
+from fastapi import UploadFile
+from sqlalchemy import event
+from starlette.concurrency import run_in_threadpool
+
+from ..database import SessionLocal, engine
+from ..users.user_models import User
+from .config import Config
+from .image_compression import celeryconfig
+
+celery_app = Celery(
+    "nuclei_compression",
+    include=[
+        f"{__package__}.image_compression.tasks",
+        f"{__package__}.video_compression.tasks",
+        f"{__package__}.misc_compression.tasks",
+    ],
+)
+celery_app.config_from_object(celeryconfig)
+
+
+@worker_process_init.connect
+def reset_inherited_connections(**kwargs) -> None:
+    # the master imported the app and filled the pool before forking; the
+    # child drops those connections (closing them would break the master's)
+    # and opens its own
+    engine.dispose(close=False)
+
+_jobs = redis.Redis.from_url(Config.COMPRESSION_BROKER_URL, decode_responses=True)
+
+
+class JobUserMissing(Exception):
+    """The job's owner was deleted while it sat in the queue."""
+
+
+def job_key(job_id: str) -> str:
+    return f"compression:job:{job_id}"
+
+
+def record_job(job_id: str, user_id: int, kind: str, filename: str) -> None:
+    _jobs.set(
+        job_key(job_id),
+        json.dumps({"user_id": user_id, "kind": kind, "file_name": filename}),
+        ex=Config.COMPRESSION_JOB_TTL,
+    )
+
+
+def get_job(job_id: str) -> dict | None:
+    job = _jobs.get(job_key(job_id))
+    return json.loads(job) if job else None
+
+
+async def spool_upload(upload: UploadFile) -> pathlib.Path:
+    """Streams an upload into the shared spool dir, where workers pick it up."""
+    Config.COMPRESSION_SPOOL_DIR.mkdir(parents=True, exist_ok=True)
+    path = Config.COMPRESSION_SPOOL_DIR / (
+        uuid4().hex + pathlib.Path(upload.filename or "").suffix
+    )
+    async with aiofiles.open(path, "wb") as spool:
+        while chunk := await upload.read(Config.UPLOAD_CHUNK_SIZE):
+            await spool.write(chunk)
+    return path
+
+
+async def enqueue(task, kind: str, upload: UploadFile, user_id: int, **options) -> str:
+    path = await spool_upload(upload)
+    job_id = str(uuid4())
+    # user ids are UUIDs, which neither the job record nor the task's json
+    # arguments can hold as they are
+    user_id = str(user_id)
+
+    def submit():
+        record_job(job_id, user_id, kind, upload.filename)
+        task.apply_async(
+            kwargs={
+                "spool_path": str(path),
+                "filename": upload.filename,
+                "user_id": user_id,
+                **options,
+            },
+            task_id=job_id,
+        )
+
+    try:
+        await run_in_threadpool(submit)
+    except Exception:
+        path.unlink(missing_ok=True)
+        raise
+    return job_id
+
+
+def run_job(task, spool_path: str, user_id: int, work: Callable) -> dict:
+    """
+    Runs `work(path, user, db)` for a spooled upload inside a task and
+    removes the spool file once the job is done for good. Failures are
+    retried with backoff until the task's max_retries runs out, unless `db`
+    was already committed: the record is stored by then, and running the
+    job again would store it twice.
+    """
+    path = pathlib.Path(spool_path)
+    committed = False
+
+    def mark_committed(session) -> None:
+        nonlocal committed
+        committed = True
+
+    try:
+        with SessionLocal() as db:
+            event.listen(db, "after_commit", mark_committed)
+            user = db.get(User, user_id)
+            if user is None:
+                raise JobUserMissing(f"user {user_id} no longer exists")
+            result = work(path, user, db)
+    except JobUserMissing:
+        path.unlink(missing_ok=True)
+        raise
+    except Exception as e:
+        if not committed and task.request.retries < task.max_retries:
+            logging.error(f"compression job {task.request.id} failed, retrying: {e}")
+            raise task.retry(
+                exc=e, countdown=Config.COMPRESSION_RETRY_BACKOFF * 2**task.request.retries
+            )
+        if committed:
+            logging.error(
+                f"compression job {task.request.id} failed after storing its "
+                f"record, not retrying: {e}"
+            )
+        path.unlink(missing_ok=True)
+        raise
+    path.unlink(missing_ok=True)
+    return result
+
+
+def job_status(job_id: str) -> dict:
+    result = AsyncResult(job_id, app=celery_app)
+    status = {"job_id": job_id, "state": result.state}
+    if result.state == "SUCCESS":
+        status["result"] = result.result
+    elif result.state in ("FAILURE", "RETRY"):
+        # the exception text can hold database or kubo internals, it's logged
+        # by the worker instead
+        status["error"] = (
+            "Compression failed" if result.state == "FAILURE" else "Retrying"
+        )
+    return status
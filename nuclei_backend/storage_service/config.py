@@ -1,3 +1,5 @@
+import json
+import os
 import pathlib
 import struct
 from typing import Final
@@ -7,3 +9,128 @@ from typing import Final
 class Config(struct.Struct):
     TEMP_FOLDER: Final = pathlib.Path(__file__).parent / "processing_temp"
     KUBO_PATH: Final = pathlib.Path(__file__).parent / "ipfs"
+
+    # Kubo RPC API, shared by every upload and compression path
+    KUBO_API_URL: Final = os.environ.get("KUBO_API_URL", "http://127.0.0.1:5001")
+    KUBO_MAX_CONNECTIONS: Final = int(os.environ.get("KUBO_MAX_CONNECTIONS", 32))
+    KUBO_MAX_KEEPALIVE: Final = int(os.environ.get("KUBO_MAX_KEEPALIVE", 16))
+    KUBO_TIMEOUT: Final = float(os.environ.get("KUBO_TIMEOUT", 120))
+
+    # request bodies are piped to kubo in pieces of this size
+    UPLOAD_CHUNK_SIZE: Final = int(os.environ.get("UPLOAD_CHUNK_SIZE", 256 * 1024))
+
+    # in-process LRU in front of the content_index table
+    CONTENT_INDEX_CACHE_SIZE: Final = int(
+        os.environ.get("CONTENT_INDEX_CACHE_SIZE", 10_000)
+    )
+
+    # parallel kubo adds per /upload/batch request
+    BATCH_UPLOAD_CONCURRENCY: Final = int(
+        os.environ.get("BATCH_UPLOAD_CONCURRENCY", 8)
+    )
+
+    # image re-encoding on /compress/image. Each job runs in a Celery worker
+    # process, this many per worker (its -c), 0 leaves Celery's default of one
+    # per core; an explicit -c on the worker command line wins
+    IMAGE_COMPRESSION_WORKERS: Final = int(
+        os.environ.get("IMAGE_COMPRESSION_WORKERS", 0)
+    )
+    IMAGE_JPEG_QUALITY: Final = int(os.environ.get("IMAGE_JPEG_QUALITY", 82))
+    IMAGE_WEBP_QUALITY: Final = int(os.environ.get("IMAGE_WEBP_QUALITY", 80))
+    # longest side in pixels images are scaled down to, 0 keeps their size
+    IMAGE_MAX_DIMENSION: Final = int(os.environ.get("IMAGE_MAX_DIMENSION", 0))
+    # re-encode everything as this format ("webp", "jpeg", "png"), "" keeps it
+    IMAGE_CONVERT_TO: Final = os.environ.get("IMAGE_CONVERT_TO", "").lower()
+    # keep the original unless re-encoding saves at least this fraction
+    IMAGE_MIN_SAVING: Final = float(os.environ.get("IMAGE_MIN_SAVING", 0.05))
+
+    # /compress/* jobs go through a Celery queue on Redis, see
+    # image_compression/tasks.py for the worker command
+    COMPRESSION_BROKER_URL: Final = os.environ.get(
+        "COMPRESSION_BROKER_URL", os.environ.get("REDIS_URL", "redis://127.0.0.1:6379")
+    )
+    # uploads wait here for a worker, so it must be shared by the API and workers
+    COMPRESSION_SPOOL_DIR: Final = pathlib.Path(
+        os.environ.get(
+            "COMPRESSION_SPOOL_DIR", pathlib.Path(__file__).parent / "compression_spool"
+        )
+    ).absolute()
+    COMPRESSION_TASK_RETRIES: Final = int(os.environ.get("COMPRESSION_TASK_RETRIES", 3))
+    COMPRESSION_RETRY_BACKOFF: Final = float(
+        os.environ.get("COMPRESSION_RETRY_BACKOFF", 10)
+    )
+    # how long job ownership and results are kept for /jobs/{id}
+    COMPRESSION_JOB_TTL: Final = int(os.environ.get("COMPRESSION_JOB_TTL", 7 * 24 * 3600))
+
+    # CompressionImpl keeps inputs up to this size in memory and only spools
+    # bigger ones to its _compression_temp folder
+    COMPRESSION_SPOOL_THRESHOLD: Final = int(
+        os.environ.get("COMPRESSION_SPOOL_THRESHOLD", 32 * 1024 * 1024)
+    )
+
+    # video transcoding on /compress/video, one ffmpeg process per job. Jobs
+    # go to their own queue, served by a worker started with
+    # -Q VIDEO_COMPRESSION_QUEUE -c VIDEO_TRANSCODE_WORKERS
+    VIDEO_FFMPEG_PATH: Final = os.environ.get("VIDEO_FFMPEG_PATH", "ffmpeg")
+    VIDEO_COMPRESSION_QUEUE: Final = os.environ.get(
+        "VIDEO_COMPRESSION_QUEUE", "compression_video"
+    )
+    VIDEO_TRANSCODE_WORKERS: Final = int(os.environ.get("VIDEO_TRANSCODE_WORKERS", 2))
+    # threads each ffmpeg may use, 0 splits the cores between the workers
+    VIDEO_FFMPEG_THREADS: Final = int(os.environ.get("VIDEO_FFMPEG_THREADS", 0))
+    # also sets the Celery task_time_limit and Redis visibility_timeout,
+    # see celeryconfig.py
+    VIDEO_TRANSCODE_TIMEOUT: Final = float(
+        os.environ.get("VIDEO_TRANSCODE_TIMEOUT", 60 * 60)
+    )
+    VIDEO_DEFAULT_PRESET: Final = os.environ.get("VIDEO_DEFAULT_PRESET", "web")
+    # preset name -> ffmpeg output arguments, the output is always mp4;
+    # override the whole table with a JSON object in VIDEO_PRESETS
+    VIDEO_PRESETS: Final = json.loads(
+        os.environ.get(
+            "VIDEO_PRESETS",
+            json.dumps(
+                {
+                    "web": [
+                        "-c:v", "libx264", "-preset", "veryfast", "-crf", "26",
+                        "-vf", "scale='min(1920,iw)':-2",
+                        "-c:a", "aac", "-b:a", "128k",
+                    ],
+                    "mobile": [
+                        "-c:v", "libx264", "-preset", "veryfast", "-crf", "28",
+                        "-vf", "scale='min(1280,iw)':-2",
+                        "-c:a", "aac", "-b:a", "96k",
+                    ],
+                    "archive": [
+                        "-c:v", "libx265", "-preset", "medium", "-crf", "24",
+                        "-tag:v", "hvc1",
+                        "-c:a", "aac", "-b:a", "160k",
+                    ],
+                }
+            ),
+        )
+    )
+    # keep the original unless transcoding saves at least this fraction
+    VIDEO_MIN_SAVING: Final = float(os.environ.get("VIDEO_MIN_SAVING", 0.05))
+
+    # zstd compression of everything else on /compress/misc
+    MISC_ZSTD_LEVEL: Final = int(os.environ.get("MISC_ZSTD_LEVEL", 3))
+    MISC_ZSTD_THREADS: Final = int(os.environ.get("MISC_ZSTD_THREADS", 0))
+    # documents up to this size are compressed with the trained dictionary
+    MISC_DICT_MAX_INPUT: Final = int(os.environ.get("MISC_DICT_MAX_INPUT", 128 * 1024))
+    MISC_DICT_SIZE: Final = int(os.environ.get("MISC_DICT_SIZE", 112 * 1024))
+    # per-owner dictionaries are trained on up to MISC_DICT_SAMPLES of their
+    # small files, owners with fewer than MISC_DICT_MIN_SAMPLES are skipped
+    MISC_DICT_SAMPLES: Final = int(os.environ.get("MISC_DICT_SAMPLES", 2000))
+    MISC_DICT_MIN_SAMPLES: Final = int(os.environ.get("MISC_DICT_MIN_SAMPLES", 200))
+    # file types never sampled, their bytes are already compressed
+    MISC_DICT_SKIP_TYPES: Final = frozenset(
+        file_type.strip().lower()
+        for file_type in os.environ.get(
+            "MISC_DICT_SKIP_TYPES",
+            ".jpg,.jpeg,.png,.gif,.webp,.heic,.avif,.mp3,.mp4,.mov,.mkv,.webm,"
+            ".zip,.gz,.bz2,.xz,.7z,.rar,.zst,.pdf,.docx,.xlsx,.pptx",
+        ).split(",")
+        if file_type.strip()
+    )
+    MISC_MIN_SAVING: Final = float(os.environ.get("MISC_MIN_SAVING", 0.02))
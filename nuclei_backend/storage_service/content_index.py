@@ -0,0 +1,111 @@
+from __future__ import annotations
+
+import hashlib
+import threading
+from collections import OrderedDict
+
+from fastapi import UploadFile
+from sqlalchemy.dialects.postgresql import insert
+
+from .config import Config
+from .ipfs_client import IpfsAddResult
+from .ipfs_model import ContentIndex
+
+
+class ContentIndexCache:
+    """
+    Looks up content hashes that were already added to IPFS.
+
+    An in-process LRU answers repeat lookups without a query; misses fall
+    through to the content_index table and are cached on the way back.
+    """
+
+    def __init__(self, maxsize: int = Config.CONTENT_INDEX_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries: OrderedDict[str, IpfsAddResult] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.db_hits = 0
+        self.misses = 0
+
+    def _cache(self, added: IpfsAddResult) -> None:
+        with self._lock:
+            self._entries[added.file_hash] = added
+            self._entries.move_to_end(added.file_hash)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def lookup(self, db, content_hash: str) -> IpfsAddResult | None:
+        with self._lock:
+            if content_hash in self._entries:
+                self._entries.move_to_end(content_hash)
+                self.hits += 1
+                return self._entries[content_hash]
+
+        record = (
+            db.query(ContentIndex)
+            .filter(ContentIndex.content_hash == content_hash)
+            .first()
+        )
+        if record is None:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        added = IpfsAddResult(
+            cid=record.file_cid, file_hash=content_hash, size=record.file_size
+        )
+        with self._lock:
+            self.db_hits += 1
+        self._cache(added)
+        return added
+
+    def remember(self, db, added: IpfsAddResult) -> None:
+        """Adds `added` to the index in the caller's transaction."""
+        self.remember_many(db, [added])
+
+    def remember_many(self, db, added: list[IpfsAddResult]) -> None:
+        if not added:
+            return
+        db.execute(
+            insert(ContentIndex)
+            .values(
+                [
+                    {
+                        "content_hash": item.file_hash,
+                        "file_cid": item.cid,
+                        "file_size": item.size,
+                    }
+                    for item in added
+                ]
+            )
+            .on_conflict_do_nothing(index_elements=["content_hash"])
+        )
+        for item in added:
+            self._cache(item)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.db_hits + self.misses
+            return {
+                "cached_entries": len(self._entries),
+                "max_entries": self.maxsize,
+                "hits": self.hits,
+                "db_hits": self.db_hits,
+                "misses": self.misses,
+                "hit_ratio": (self.hits + self.db_hits) / lookups if lookups else 0.0,
+            }
+
+
+async def hash_upload(
+    upload: UploadFile, chunk_size: int = Config.UPLOAD_CHUNK_SIZE
+) -> str:
+    """Hashes an already spooled upload and rewinds it for the real read."""
+    digest = hashlib.sha256()
+    while chunk := await upload.read(chunk_size):
+        digest.update(chunk)
+    await upload.seek(0)
+    return digest.hexdigest()
+
+
+content_index = ContentIndexCache()
@@ -1,2 +1,28 @@
-broker_url = "kafka://localhost:9092"
-result_backend = "rpc://"
+from ..config import Config
+
+broker_url = Config.COMPRESSION_BROKER_URL
+result_backend = Config.COMPRESSION_BROKER_URL
+result_expires = Config.COMPRESSION_JOB_TTL
+result_extended = True
+
+task_serializer = "json"
+result_serializer = "json"
+accept_content = ["json"]
+
+# a job is only acked once it ran, so a worker dying mid job hands it to another
+task_acks_late = True
+task_reject_on_worker_lost = True
+worker_prefetch_multiplier = 1
+# every job is CPU bound in its own prefork child, so this is the job count
+worker_concurrency = Config.IMAGE_COMPRESSION_WORKERS or None
+task_track_started = True
+# with acks_late, Redis hands a job that is still unacked after
+# visibility_timeout to another worker, so no job may run that long. The
+# longest, a transcode of up to VIDEO_TRANSCODE_TIMEOUT plus its IPFS add,
+# is killed at task_time_limit, well before Redis would redeliver it.
+task_time_limit = Config.VIDEO_TRANSCODE_TIMEOUT * 1.5
+broker_transport_options = {"visibility_timeout": Config.VIDEO_TRANSCODE_TIMEOUT * 2}
+
+# transcodes are long and use several cores each, so they get their own
+# queue and workers sized for them
+task_routes = {"storage.compress_video": {"queue": Config.VIDEO_COMPRESSION_QUEUE}}
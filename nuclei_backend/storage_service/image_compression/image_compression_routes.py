@@ -1,78 +1,45 @@
-import asyncio
-from concurrent.futures import ThreadPoolExecutor
 from typing import List
 
-from fastapi import BackgroundTasks, Depends, File, HTTPException, UploadFile, status
+from fastapi import Depends, File, HTTPException, UploadFile, status
 
 from ...users.auth_utils import get_current_user
-from ...users.user_handler_utils import get_db
+from ...users.user_models import User
+from ..compression_jobs import enqueue
 from ..main import storage_service
-from .image_compression_utils import CompressImage
+from .tasks import compress_image
 import logging
 
 
-async def process_file(
-    file: bytes, filename: str, ipfs_flag: bool, identity_token: str, db
-) -> None:
-    try:
-        loop = asyncio.get_event_loop()
-        compressing_file = CompressImage(file, filename)
-
-        compressed_file = await loop.run_in_executor(
-            None, compressing_file.produce_compression
-        )
-        if ipfs_flag:
-            try:
-                with db as _db:
-                    await loop.run_in_executor(
-                        None,
-                        compressing_file.commit_to_ipfs,
-                        compressed_file,
-                        filename,
-                        identity_token,
-                        _db,
-                    )
-            except Exception as e:
-                print(f"the error was {e}")
-        await loop.run_in_executor(None, compressing_file.cleanup_compression_outcome)
-    except Exception as e:
-        print(f"Error compressing and storing file {filename}: {str(e)}")
-
-
-async def process_files(
-    files: List[UploadFile],
-    ipfs_flag: bool | None = True,
-    identity_token: str = Depends(get_current_user),
-    db=Depends(get_db),
-):
-    loop = asyncio.get_event_loop()
-    tasks = [
-        process_file(file.file.read(), file.filename, ipfs_flag, identity_token, db)
-        for file in files
-    ]
-    await asyncio.gather(*tasks)
-
-
-@storage_service.post("/compress/image")
+@storage_service.post("/compress/image", status_code=status.HTTP_202_ACCEPTED)
 async def compress_task_image(
-    background_tasks: BackgroundTasks,
     files: List[UploadFile] = File(...),
     ipfs_flag: bool | None = True,
-    identity_token: str = Depends(get_current_user),
-    db=Depends(get_db),
+    current_user: User = Depends(get_current_user),
 ):
+    """
+    Queues one compression job per file and returns their ids right away;
+    poll /storage/jobs/{job_id} for the outcome.
+    """
     if not files:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="No file uploaded",
         )
+    jobs = []
     try:
-        logging.debug("sending the task to background")
-        background_tasks.add_task(process_files, files, ipfs_flag, identity_token, db)
-
-        return {
-            "message": "Files submitted for compression",
-            "files": [file.filename for file in files],
-        }, status.HTTP_202_ACCEPTED
+        for file in files:
+            job_id = await enqueue(
+                compress_image, "image", file, current_user.id, ipfs_flag=ipfs_flag
+            )
+            jobs.append({"file_name": file.filename, "job_id": job_id})
     except Exception as e:
-        return {"error": e}
+        logging.error(f"queueing image compression failed: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Compression queue unavailable",
+        ) from e
+    finally:
+        for file in files:
+            await file.close()
+
+    return {"message": "Files submitted for compression", "jobs": jobs}
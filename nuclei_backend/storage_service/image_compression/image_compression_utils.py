@@ -1,33 +1,152 @@
+from __future__ import annotations
+
+import io
 import logging
 import pathlib
-import psutil
-from concurrent.futures import ProcessPoolExecutor
-import os
-import zlib
+import time
+from dataclasses import dataclass
+
+from PIL import Image, UnidentifiedImageError
 
 from ..CompressionBase import CompressionImpl
+from ..config import Config
 
 logger = logging.getLogger(__name__)
 
+# Pillow format name -> file extension, for the formats we re-encode
+ENCODABLE = {"JPEG": ".jpg", "PNG": ".png", "WEBP": ".webp"}
+
+
+@dataclass
+class ImageCompressionResult:
+    filename: str
+    # the re-encoded bytes, or the untouched source (bytes or path) if skipped
+    data: bytes | pathlib.Path
+    original_size: int
+    format: str | None
+    cpu_seconds: float
+    skipped: bool = False
+    reason: str | None = None
+
+    @property
+    def compressed_size(self) -> int:
+        if isinstance(self.data, pathlib.Path):
+            return self.data.stat().st_size
+        return len(self.data)
+
+    @property
+    def bytes_saved(self) -> int:
+        return self.original_size - self.compressed_size
+
+    def summary(self) -> dict:
+        return {
+            "file_name": self.filename,
+            "format": self.format,
+            "original_size": self.original_size,
+            "compressed_size": self.compressed_size,
+            "bytes_saved": self.bytes_saved,
+            "cpu_seconds": round(self.cpu_seconds, 4),
+            "skipped": self.skipped,
+            "reason": self.reason,
+        }
+
+
+def _encode(image: Image.Image, image_format: str, info: dict) -> bytes:
+    out = io.BytesIO()
+    extra = {k: info[k] for k in ("icc_profile", "exif") if info.get(k)}
+    if image_format == "JPEG":
+        if image.mode not in ("RGB", "L", "CMYK"):
+            image = image.convert("RGB")
+        image.save(
+            out,
+            "JPEG",
+            quality=Config.IMAGE_JPEG_QUALITY,
+            optimize=True,
+            progressive=True,
+            **extra,
+        )
+    elif image_format == "WEBP":
+        image.save(out, "WEBP", quality=Config.IMAGE_WEBP_QUALITY, method=4, **extra)
+    else:
+        image.save(out, "PNG", optimize=True, **extra)
+    return out.getvalue()
+
+
+def recompress_image(
+    source: bytes | memoryview | pathlib.Path, filename: str
+) -> ImageCompressionResult:
+    """
+    Re-encodes one image with a real codec: quality targeted JPEG/WebP or
+    optimised PNG, scaled down to IMAGE_MAX_DIMENSION and converted to
+    IMAGE_CONVERT_TO when those are set.
+
+    The source, bytes in memory or a file on disk, is read by Pillow where it
+    is and handed back untouched when the image can't be re-encoded or the
+    saving is under IMAGE_MIN_SAVING.
+    """
+    started = time.process_time()
+    on_disk = isinstance(source, pathlib.Path)
+    original_size = source.stat().st_size if on_disk else len(source)
+
+    def keep(image_format, reason) -> ImageCompressionResult:
+        return ImageCompressionResult(
+            filename=filename,
+            data=source,
+            original_size=original_size,
+            format=image_format,
+            cpu_seconds=time.process_time() - started,
+            skipped=True,
+            reason=reason,
+        )
+
+    try:
+        with Image.open(source if on_disk else io.BytesIO(source)) as image:
+            source_format = image.format
+            if source_format not in ENCODABLE:
+                return keep(source_format, "unsupported format")
+            if getattr(image, "n_frames", 1) > 1:
+                return keep(source_format, "animated image")
+
+            target_format = (Config.IMAGE_CONVERT_TO or source_format).upper()
+            if target_format == "JPG":
+                target_format = "JPEG"
+            if target_format not in ENCODABLE:
+                return keep(source_format, f"unknown target format {target_format}")
+
+            info = dict(image.info)
+            image.load()
+            if Config.IMAGE_MAX_DIMENSION and max(image.size) > Config.IMAGE_MAX_DIMENSION:
+                image.thumbnail(
+                    (Config.IMAGE_MAX_DIMENSION, Config.IMAGE_MAX_DIMENSION),
+                    Image.Resampling.LANCZOS,
+                )
+            compressed = _encode(image, target_format, info)
+    except (UnidentifiedImageError, OSError, ValueError) as e:
+        return keep(None, f"not a readable image: {e}")
+
+    if len(compressed) > original_size * (1 - Config.IMAGE_MIN_SAVING):
+        return keep(source_format, "recompression doesn't pay")
+
+    if target_format != source_format:
+        filename = str(pathlib.Path(filename).with_suffix(ENCODABLE[target_format]))
+    return ImageCompressionResult(
+        filename=filename,
+        data=compressed,
+        original_size=original_size,
+        format=target_format,
+        cpu_seconds=time.process_time() - started,
+    )
+
 
 class CompressImage(CompressionImpl):
-    def __init__(self, file: bytes, filename: str):
+    def __init__(self, file: bytes | pathlib.Path, filename: str):
         super().__init__(app_path="image")
 
-        self.file = file
         self.filename = filename
-        self.compression_temp_file = self.save_to_temp(self.file, self.filename)
-
-    def cleanup_compression_outcome(self):
-        pathlib.Path(self.compression_temp_file[0]).unlink()
+        self.load_source(file, filename)
+        self.result: ImageCompressionResult | None = None
 
-    def produce_compression(self) -> bytes:
+    def produce_compression(self) -> bytes | pathlib.Path:
         print("compressing image")
-        with open(self.compression_temp_file[0], "rb") as f:
-            original_data = f.read()
-
-        try:
-            return zlib.compress(original_data)
-        except Exception as e:
-            print(f"Error compressing image: {str(e)}")
-            return b""
+        self.result = recompress_image(self.source, self.filename)
+        return self.result.data
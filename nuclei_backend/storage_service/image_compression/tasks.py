@@ -0,0 +1,25 @@
+from ..compression_jobs import celery_app, run_job
+from ..config import Config
+from .image_compression_utils import CompressImage
+
+
+@celery_app.task(
+    bind=True, name="storage.compress_image", max_retries=Config.COMPRESSION_TASK_RETRIES
+)
+def compress_image(self, spool_path: str, filename: str, user_id: int, ipfs_flag=True):
+    def work(path, user, db) -> dict:
+        # small spooled uploads are read once and compressed in memory
+        compressing_file = CompressImage(path, filename)
+        try:
+            compressing_file.produce_compression()
+            result = compressing_file.result
+            summary = result.summary()
+            if ipfs_flag:
+                summary["cid"] = compressing_file.commit_to_ipfs(
+                    result.data, result.filename, user, db
+                )
+            return summary
+        finally:
+            compressing_file.cleanup_compression_outcome()
+
+    return run_job(self, spool_path, user_id, work)
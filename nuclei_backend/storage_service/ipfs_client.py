@@ -0,0 +1,203 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import AsyncIterable, Iterable
+from uuid import uuid4
+
+import httpx
+
+from .config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class IpfsError(Exception):
+    """Raised when the Kubo RPC API rejects a request or returns garbage."""
+
+
+@dataclass(frozen=True)
+class IpfsAddResult:
+    cid: str
+    file_hash: str
+    size: int
+
+
+class IpfsClient:
+    """
+    Thin client for the Kubo RPC API.
+
+    One instance holds a keep-alive connection pool for sync callers (thread
+    pool work such as compression) and another for async route handlers, so
+    adds reuse open connections instead of forking the kubo binary.
+    """
+
+    ADD_PARAMS = {"pin": "true", "quieter": "true"}
+
+    def __init__(
+        self,
+        base_url: str = Config.KUBO_API_URL,
+        max_connections: int = Config.KUBO_MAX_CONNECTIONS,
+        max_keepalive: int = Config.KUBO_MAX_KEEPALIVE,
+        timeout: float = Config.KUBO_TIMEOUT,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self._limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+        )
+        self._timeout = httpx.Timeout(timeout)
+        self._client: httpx.Client | None = None
+        self._async_client: httpx.AsyncClient | None = None
+
+    @property
+    def client(self) -> httpx.Client:
+        if self._client is None:
+            self._client = httpx.Client(
+                base_url=self.base_url, limits=self._limits, timeout=self._timeout
+            )
+        return self._client
+
+    @property
+    def async_client(self) -> httpx.AsyncClient:
+        if self._async_client is None:
+            self._async_client = httpx.AsyncClient(
+                base_url=self.base_url, limits=self._limits, timeout=self._timeout
+            )
+        return self._async_client
+
+    def add(self, file: bytes | memoryview, filename: str) -> IpfsAddResult:
+        """
+        Adds and pins `file`, returning its CID and sha256 content hash.
+        Memoryviews are sent as they are, without copying them to bytes.
+        """
+        return self.add_chunks([file], filename)
+
+    def add_chunks(
+        self, chunks: Iterable[bytes | memoryview], filename: str
+    ) -> IpfsAddResult:
+        """Sync counterpart of add_stream, for thread pool and worker callers."""
+        boundary = uuid4().hex
+        digest = hashlib.sha256()
+        size = 0
+
+        def body():
+            nonlocal size
+            yield self._multipart_head(boundary, filename)
+            for chunk in chunks:
+                digest.update(chunk)
+                size += len(chunk)
+                yield chunk
+            yield f"\r\n--{boundary}--\r\n".encode()
+
+        try:
+            response = self.client.post(
+                "/api/v0/add",
+                params=self.ADD_PARAMS,
+                content=body(),
+                headers={
+                    "Content-Type": f"multipart/form-data; boundary={boundary}"
+                },
+            )
+        except httpx.HTTPError as e:
+            raise IpfsError(f"kubo add failed for {filename}: {e}") from e
+        return self._parse_add(response, digest.hexdigest(), size)
+
+    async def add_async(self, file: bytes, filename: str) -> IpfsAddResult:
+        try:
+            response = await self.async_client.post(
+                "/api/v0/add",
+                params=self.ADD_PARAMS,
+                files={"file": (filename, bytes(file))},
+            )
+        except httpx.HTTPError as e:
+            raise IpfsError(f"kubo add failed for {filename}: {e}") from e
+        return self._parse_add(response, hashlib.sha256(file).hexdigest(), len(file))
+
+    async def add_stream(
+        self, chunks: AsyncIterable[bytes], filename: str
+    ) -> IpfsAddResult:
+        """
+        Adds a file from an async stream of chunks without buffering it.
+
+        The multipart body is assembled on the fly and the size and sha256 are
+        accumulated as each chunk passes through, so memory use is bounded by
+        the chunk size no matter how large the file is.
+        """
+        boundary = uuid4().hex
+        digest = hashlib.sha256()
+        size = 0
+
+        async def body():
+            nonlocal size
+            yield self._multipart_head(boundary, filename)
+            async for chunk in chunks:
+                digest.update(chunk)
+                size += len(chunk)
+                yield chunk
+            yield f"\r\n--{boundary}--\r\n".encode()
+
+        try:
+            response = await self.async_client.post(
+                "/api/v0/add",
+                params=self.ADD_PARAMS,
+                content=body(),
+                headers={
+                    "Content-Type": f"multipart/form-data; boundary={boundary}"
+                },
+            )
+        except httpx.HTTPError as e:
+            raise IpfsError(f"kubo add failed for {filename}: {e}") from e
+        return self._parse_add(response, digest.hexdigest(), size)
+
+    def cat(self, cid: str) -> bytes:
+        """Reads a whole file back from kubo, for small ones only."""
+        try:
+            response = self.client.post("/api/v0/cat", params={"arg": cid})
+        except httpx.HTTPError as e:
+            raise IpfsError(f"kubo cat failed for {cid}: {e}") from e
+        if response.status_code != 200:
+            raise IpfsError(f"kubo cat returned {response.status_code}: {response.text}")
+        return response.content
+
+    @staticmethod
+    def _multipart_head(boundary: str, filename: str) -> bytes:
+        filename = filename.replace('"', "").replace("\r", "").replace("\n", "")
+        return (
+            f"--{boundary}\r\n"
+            f'Content-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+            "Content-Type: application/octet-stream\r\n\r\n"
+        ).encode()
+
+    def _parse_add(
+        self, response: httpx.Response, file_hash: str, size: int
+    ) -> IpfsAddResult:
+        if response.status_code != 200:
+            raise IpfsError(f"kubo add returned {response.status_code}: {response.text}")
+        # kubo streams one JSON object per added node, the root comes last
+        lines = [line for line in response.text.splitlines() if line.strip()]
+        try:
+            cid = json.loads(lines[-1])["Hash"]
+        except (IndexError, KeyError, ValueError) as e:
+            raise IpfsError(f"unexpected kubo add response: {response.text}") from e
+        return IpfsAddResult(cid=cid, file_hash=file_hash, size=size)
+
+    def close(self) -> None:
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+
+    async def aclose(self) -> None:
+        self.close()
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+
+
+@lru_cache(maxsize=None)
+def get_ipfs_client() -> IpfsClient:
+    """Returns the per-process client so every caller shares its pools."""
+    return IpfsClient()
@@ -1,5 +1,23 @@
-from sqlalchemy import Column, ForeignKey, Integer, String
-from sqlalchemy.orm import relationship
+import datetime
+import uuid
+import zlib
+
+from sqlalchemy import (
+    DDL,
+    BigInteger,
+    Column,
+    DateTime,
+    ForeignKey,
+    Index,
+    Integer,
+    LargeBinary,
+    String,
+    UniqueConstraint,
+    event,
+    func,
+    select,
+)
+from sqlalchemy.orm import Session, relationship
 from sqlalchemy.dialects.postgresql import UUID
 
 from ..database import Base
@@ -11,11 +29,150 @@ class DataStorage(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     file_name = Column(String)
-    file_cid = Column(String)
-    file_hash = Column(String)
+    file_cid = Column(String, index=True)
+    file_hash = Column(String, index=True)
     file_size = Column(Integer)
     file_type = Column(String)
     file_upload_date = Column(String)
 
     owner_id = Column(UUID(as_uuid=True), ForeignKey("users.id"))
     owner = relationship("User", back_populates="data")
+
+    # codec the stored bytes are in ("zstd"), None when stored as uploaded
+    compression = Column(String(16))
+    # the owner's dictionary the zstd frame was made with, if any
+    compression_dict_id = Column(Integer, ForeignKey("compression_dictionary.id"))
+    compression_dict = relationship("CompressionDictionary")
+
+    # per-user listings page by id, so (owner_id, id) serves them from the index
+    __table_args__ = (Index("ix_data_storage_owner_id_id", "owner_id", "id"),)
+
+    @property
+    def download_name(self) -> str:
+        """The name the file is handed out under once decompressed."""
+        if self.compression == "zstd" and self.file_name.endswith(".zst"):
+            return self.file_name[: -len(".zst")]
+        return self.file_name
+
+
+class CompressionDictionary(Base):
+    # zstd dictionaries trained offline on a sample of one owner's small
+    # files. Records point at the version they were compressed with, so old
+    # versions are kept for as long as anything refers to them.
+    __tablename__ = "compression_dictionary"
+
+    id = Column(Integer, primary_key=True, index=True)
+    owner_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False)
+    version = Column(Integer, nullable=False)
+    # the id zstd writes into frame headers made with this dictionary
+    zstd_dict_id = Column(BigInteger, nullable=False)
+    data = Column(LargeBinary, nullable=False)
+    sample_count = Column(Integer)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+    # the unique index also serves "latest version for this owner"
+    __table_args__ = (UniqueConstraint("owner_id", "version"),)
+
+
+class ContentIndex(Base):
+    # Maps a sha256 of file content to the CID it was already added under,
+    # so repeated uploads of the same bytes skip the kubo add.
+    __tablename__ = "content_index"
+
+    id = Column(Integer, primary_key=True, index=True)
+    content_hash = Column(String(64), unique=True, index=True, nullable=False)
+    file_cid = Column(String, index=True, nullable=False)
+    file_size = Column(Integer)
+
+
+class DataChange(Base):
+    # Append-only journal of DataStorage inserts and deletes. `id` is the
+    # monotonic sequence clients pass back as `since` to get what changed.
+    __tablename__ = "data_change_journal"
+
+    id = Column(BigInteger, primary_key=True)
+    owner_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False)
+    data_id = Column(Integer, nullable=False)
+    operation = Column(String(8), nullable=False)
+    file_name = Column(String)
+    file_cid = Column(String)
+    file_size = Column(Integer)
+    changed_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_data_change_journal_owner_id_id", "owner_id", "id"),
+    )
+
+    ADD = "add"
+    DELETE = "delete"
+
+
+# first key of the advisory locks that serialise journal writes per owner
+JOURNAL_LOCK_NAMESPACE = 0x4A524E4C
+
+
+def journal_lock_key(owner_id) -> int:
+    key = zlib.crc32(uuid.UUID(str(owner_id)).bytes)
+    return key - 2**32 if key >= 2**31 else key
+
+
+def lock_journal(db, owner_ids) -> None:
+    """
+    Takes the owners' journal locks until the transaction ends. Journal ids
+    come from a sequence when rows are inserted, not when they commit; with
+    the lock held from insert to commit an owner's ids become visible in
+    order, so a cursor read at any moment never passes an id that commits
+    later. Sorted, so two writers can't deadlock on each other.
+    """
+    if db.get_bind().dialect.name != "postgresql":
+        return
+    for key in sorted({journal_lock_key(owner_id) for owner_id in owner_ids}):
+        db.execute(select(func.pg_advisory_xact_lock(JOURNAL_LOCK_NAMESPACE, key)))
+
+
+def journal_entry(record, operation: str) -> dict:
+    return {
+        "owner_id": record.owner_id,
+        "data_id": record.id,
+        "operation": operation,
+        "file_name": record.file_name,
+        "file_cid": record.file_cid,
+        "file_size": record.file_size,
+        "changed_at": datetime.datetime.utcnow(),
+    }
+
+
+# Records added or deleted through a session are journaled in the same flush,
+# as a single multi-row insert. Bulk query().delete() never reaches the
+# session, use sync_journal.delete_records for those.
+@event.listens_for(Session, "after_flush")
+def _journal_flush(session, flush_context):
+    entries = [
+        journal_entry(record, DataChange.ADD)
+        for record in session.new
+        if isinstance(record, DataStorage)
+    ] + [
+        journal_entry(record, DataChange.DELETE)
+        for record in session.deleted
+        if isinstance(record, DataStorage)
+    ]
+    if entries:
+        lock_journal(session, {entry["owner_id"] for entry in entries})
+        session.execute(DataChange.__table__.insert(), entries)
+
+
+# create_all only creates missing tables, so columns and indexes added to
+# existing ones are added here after it runs
+SCHEMA_UPGRADES = (
+    "CREATE INDEX IF NOT EXISTS ix_data_storage_owner_id_id"
+    " ON data_storage (owner_id, id)",
+    "ALTER TABLE data_storage ADD COLUMN IF NOT EXISTS compression VARCHAR(16)",
+    "ALTER TABLE data_storage ADD COLUMN IF NOT EXISTS compression_dict_id"
+    " INTEGER REFERENCES compression_dictionary (id)",
+)
+for statement in SCHEMA_UPGRADES:
+    event.listen(
+        Base.metadata,
+        "after_create",
+        DDL(statement).execute_if(dialect="postgresql"),
+    )
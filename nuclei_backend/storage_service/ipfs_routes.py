@@ -1,62 +1,240 @@
 from __future__ import annotations
 
+import asyncio
 import logging
 from typing import *  # noqa: F403
 
 import sqlalchemy.exc
-from fastapi import Depends, File, HTTPException, UploadFile
+from fastapi import Depends, File, Header, HTTPException, Request, UploadFile
 
-from ..users.auth_utils import get_current_user
+from ..syncing_service.chunking.utils import encrypt_stream_async, stream_key
+from ..syncing_service.sync_config import SyncConfig
+from ..syncing_service.utils.socket_connection import change_entry, socket_manager
+from ..users.auth_utils import get_current_admin, get_current_user
 from ..users.user_handler_utils import get_db
 from ..users.user_models import User
+from .content_index import content_index, hash_upload
+from .ipfs_client import IpfsAddResult, IpfsError, get_ipfs_client
 from .ipfs_utils import *  # noqa: F403
 from .main import storage_service
 
 
+def check_encryption_key(key: str | None) -> None:
+    if key is None:
+        return
+    try:
+        stream_key(key)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+
+
+async def store_record(
+    db,
+    filename: str,
+    added: IpfsAddResult,
+    current_user: User,
+    deduplicated: bool = False,
+    inline: bytes | None = None,
+):
+    # whether content was deduplicated stays internal: it is decided against
+    # every tenant's uploads, so reporting it would tell a caller whether
+    # someone else already stored the same file
+    if not added.cid:
+        raise HTTPException(status_code=400, detail="Failed to produce CID")
+    try:
+        data_record = assemble_record(  # noqa: F405
+            filename,
+            added,
+            current_user.id,
+        )
+
+        db.add(data_record)
+        if not deduplicated:
+            content_index.remember(db, added)
+        db.commit()
+
+    except sqlalchemy.exc.IntegrityError:
+        db.rollback()
+        return {"message": "File already exists", "file_hash": added.file_hash}
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail="Internal Server Error") from e
+
+    await socket_manager.publish_change(
+        current_user.id, "add", [change_entry(data_record, inline)]
+    )
+    return {
+        "id": data_record.id,
+        "cid": added.cid,
+        "hash": added.file_hash,
+        "size": added.size,
+        "user_id": current_user.username,
+        "status": "success",
+    }
+
+
 @storage_service.post("/upload")
 async def upload(
     file_name: UploadFile,
+    x_encryption_key: str | None = Header(None),
     db=Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
+    """
+    With an X-Encryption-Key header (urlsafe base64 of 32 bytes) the file is
+    stored as a streamed AES-GCM ciphertext instead, see chunking/utils.py.
+    Encrypted uploads get a fresh nonce every time, so they're never deduplicated.
+    """
     print("Uploading file")
-    # get the file name
-    file: bytes = file_name.file.read()
+    check_encryption_key(x_encryption_key)
     try:
-        cid: str = produce_cid(file, file_name)  # noqa: F405
-        if not cid:
-            raise HTTPException(status_code=400, detail="Failed to produce CID")
-        _hash: str = generate_hash(cid)  # noqa: F405
-        if not _hash:
-            raise HTTPException(status_code=400, detail="Failed to generate hash")
-        user: User = current_user
-        if not user:
-            raise HTTPException(status_code=400, detail="User not found")
-
+        chunks = iter_upload(file_name)  # noqa: F405
+        added = None
+        if x_encryption_key is None:
+            # known content only needs a new record, not another add and pin
+            added = content_index.lookup(db, await hash_upload(file_name))
+        else:
+            chunks = encrypt_stream_async(chunks, x_encryption_key)
+        deduplicated = added is not None
+        if not deduplicated:
+            # the upload is piped to kubo chunk by chunk rather than read whole
+            added = await produce_cid_stream(chunks, file_name.filename)  # noqa: F405
+        inline = None
+        if (
+            x_encryption_key is None
+            and added.size <= SyncConfig.SOCKET_INLINE_MAX_BYTES
+        ):
+            await file_name.seek(0)
+            inline = await file_name.read()
+    except IpfsError as e:
+        logging.error(e)
+        raise HTTPException(status_code=502, detail="Failed to produce CID") from e
     except Exception as e:
         logging.error(e)
         raise HTTPException(status_code=500, detail="Internal Server Error") from e
+    finally:
+        await file_name.close()
+
+    return await store_record(
+        db, file_name.filename, added, current_user, deduplicated, inline
+    )
+
+
+@storage_service.post("/upload/stream")
+async def upload_stream(
+    request: Request,
+    filename: str,
+    x_encryption_key: str | None = Header(None),
+    db=Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """
+    Uploads the raw request body as one file.
+
+    Unlike /upload the body is never parsed as multipart or spooled to disk,
+    it goes straight from the socket into the kubo add call. The body is
+    always received and hashed on the way through; a client supplied hash
+    proves nothing about having the content. With X-Encryption-Key the body
+    is encrypted on the way through, as in /upload.
+    """
+    check_encryption_key(x_encryption_key)
+    chunks = request.stream()
+    if x_encryption_key is not None:
+        chunks = encrypt_stream_async(chunks, x_encryption_key)
     try:
-        users_id = current_user.id
-        data_record = assemble_record(  # noqa: F405
-            file,
-            file_name,
-            cid,
-            users_id,
+        added: IpfsAddResult = await produce_cid_stream(  # noqa: F405
+            chunks, filename
         )
+    except IpfsError as e:
+        logging.error(e)
+        raise HTTPException(status_code=502, detail="Failed to produce CID") from e
+    except Exception as e:
+        logging.error(e)
+        raise HTTPException(status_code=500, detail="Internal Server Error") from e
 
-        db.add(data_record)
-        db.commit()
+    return await store_record(db, filename, added, current_user)
 
-    except sqlalchemy.exc.IntegrityError:
-        return {"message": "File already exists", "file_hash": hash}
 
+@storage_service.post("/upload/batch")
+async def upload_batch(
+    files: List[UploadFile] = File(...),  # noqa: F405
+    db=Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """
+    Uploads many files in one request.
+
+    Files are added to kubo concurrently, at most BATCH_UPLOAD_CONCURRENCY at
+    a time, and every DataStorage row is written in a single commit. One
+    failed add does not fail the batch, it is reported in its own result.
+    """
+    if not files:
+        raise HTTPException(status_code=400, detail="No file uploaded")
+
+    semaphore = asyncio.Semaphore(Config.BATCH_UPLOAD_CONCURRENCY)  # noqa: F405
+
+    async def add_one(upload: UploadFile):
+        async with semaphore:
+            try:
+                added = content_index.lookup(db, await hash_upload(upload))
+                if added is not None:
+                    return upload.filename, added, True, None
+                added = await produce_cid_stream(  # noqa: F405
+                    iter_upload(upload), upload.filename  # noqa: F405
+                )
+                return upload.filename, added, False, None
+            except IpfsError as e:
+                logging.error(e)
+                return upload.filename, None, False, "Failed to produce CID"
+            finally:
+                await upload.close()
+
+    outcomes = await asyncio.gather(*(add_one(upload) for upload in files))
+
+    stored = [outcome for outcome in outcomes if outcome[1] is not None]
+    fresh = {added.file_hash: added for _, added, dedup, _ in stored if not dedup}
+    records = [
+        assemble_record(filename, added, current_user.id)  # noqa: F405
+        for filename, added, _, _ in stored
+    ]
+    try:
+        db.add_all(records)
+        content_index.remember_many(db, list(fresh.values()))
+        db.commit()
     except Exception as e:
+        db.rollback()
+        logging.error(e)
         raise HTTPException(status_code=500, detail="Internal Server Error") from e
 
+    if records:
+        await socket_manager.publish_change(
+            current_user.id, "add", [change_entry(record) for record in records]
+        )
+
     return {
-        "cid": cid,
-        "hash": _hash,
-        "user_id": current_user.username,
-        "status": "success",
+        "stored": len(stored),
+        "failed": len(outcomes) - len(stored),
+        "files": [
+            {
+                "file_name": filename,
+                "cid": added.cid,
+                "hash": added.file_hash,
+                "size": added.size,
+                "status": "success",
+            }
+            if added is not None
+            else {"file_name": filename, "status": "failed", "detail": error}
+            for filename, added, dedup, error in outcomes
+        ],
     }
+
+
+@storage_service.get("/dedup/stats")
+async def dedup_stats(current_user: User = Depends(get_current_admin)):
+    # the counters cover every tenant
+    return content_index.stats()
+
+
+@storage_service.on_event("shutdown")
+async def close_ipfs_client():
+    await get_ipfs_client().aclose()
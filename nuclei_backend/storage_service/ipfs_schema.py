@@ -20,3 +20,11 @@ class Ipfs(IpfsBase):
 
     class Config:
         orm_mode = True
+
+
+class IpfsRecord(Ipfs):
+    file_cid: str
+    file_hash: str | None = None
+    # how the stored bytes are compressed, see /storage/compression/dictionaries
+    compression: str | None = None
+    compression_dict_id: int | None = None
@@ -2,15 +2,13 @@ from __future__ import annotations
 
 import datetime
 import os
-import os.path
 import pathlib
-import time
 from typing import *  # noqa: F403
-from uuid import uuid4
 
-from typing_extensions import LiteralString
+from fastapi import UploadFile
 
 from .config import Config
+from .ipfs_client import IpfsAddResult, get_ipfs_client
 from .ipfs_model import DataStorage
 
 
@@ -18,89 +16,50 @@ def ensure_dir(path: str) -> None:
     pathlib.Path(path).mkdir(parents=True, exist_ok=True)
 
 
-def save_temp_file(file, filename: str) -> str:
-    unique_id = str(uuid4())
-    _filename = f"filename{unique_id}.{filename[-4:]}"
-    _file_path = os.path.join(Config.TEMP_FOLDER, _filename)
+def produce_cid(file: bytes | memoryview, filename: str) -> IpfsAddResult:
+    return get_ipfs_client().add(file, filename)
 
-    with open(_file_path, "wb") as f:
-        f.write(file)
 
-    return _file_path
+def iter_file(
+    path: str | os.PathLike, chunk_size: int = Config.UPLOAD_CHUNK_SIZE
+) -> Iterator[bytes]:  # noqa: F405
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            yield chunk
 
 
-def remove(path):
-    os.remove(path)
+def produce_cid_file(path: str | os.PathLike, filename: str) -> IpfsAddResult:
+    """Adds a file from disk, streamed rather than read whole."""
+    return get_ipfs_client().add_chunks(iter_file(path), filename)
 
 
-def generate_hash(cid: LiteralString) -> str:
-    unique_id = str(uuid4())
-    _bat_path = os.path.join(Config.TEMP_FOLDER, f"hash{unique_id}.bat")
-    _buffer_path = os.path.join(Config.TEMP_FOLDER, f"hash{unique_id}.txt")
+async def produce_cid_async(file: bytes, filename: str) -> IpfsAddResult:
+    return await get_ipfs_client().add_async(file, filename)
 
-    with open(_bat_path, "w") as f:
-        f.write("#!/bin/bash")
-        f.write("\n")
-        f.write(rf"cd {Config.TEMP_FOLDER}")
-        f.write("\n")
-        f.write(rf"{Config.KUBO_PATH} ls -v {cid} > hash{unique_id}.txt")
 
-    os.chmod(_bat_path, 0b111101101)
+async def iter_upload(
+    upload: UploadFile, chunk_size: int = Config.UPLOAD_CHUNK_SIZE
+) -> AsyncIterator[bytes]:  # noqa: F405
+    while chunk := await upload.read(chunk_size):
+        yield chunk
 
-    os.popen(_bat_path)
-    time.sleep(1)
 
-    with open(_buffer_path, "r") as f:
-        _hash = f.read().strip()
+async def produce_cid_stream(
+    chunks: AsyncIterable[bytes], filename: str  # noqa: F405
+) -> IpfsAddResult:
+    return await get_ipfs_client().add_stream(chunks, filename)
 
-    remove(_bat_path)
-    remove(_buffer_path)
 
-    return _hash
-
-
-def produce_cid(file: bytes, filename: str) -> LiteralString:
-    if not os.path.exists(Config.TEMP_FOLDER):
-        ensure_dir(Config.TEMP_FOLDER)
-    try:
-        path = str(Config.TEMP_FOLDER)
-        unique_id = str(uuid4())
-        _bat_path = os.path.join(Config.TEMP_FOLDER, f"cid{unique_id}.sh")
-        _buffer_path = os.path.join(Config.TEMP_FOLDER, f"cid{unique_id}.txt")
-        _temp_file_path = save_temp_file(file, filename)
-    except Exception as e:
-        raise e
-    print(_temp_file_path)
-
-    with open(_bat_path, "w") as f:
-        f.write("#!/bin/bash")
-        f.write("\n")
-        f.write(rf"cd {Config.TEMP_FOLDER}")
-        f.write("\n")
-        f.write(
-            rf"{Config.KUBO_PATH} add --quiet --pin {_temp_file_path} > {path}/cid{unique_id}.txt"  # noqa: E501
-        )
-
-    os.chmod(_bat_path, 0b111101101)
-    os.popen(_bat_path)
-    time.sleep(1)
-    with open(pathlib.Path(_buffer_path), "r") as f:
-        cid = f.read().strip()
-
-    remove(_bat_path)
-    remove(_buffer_path)
-    pathlib.Path(_temp_file_path).unlink()
-
-    return cid
-
-
-def assemble_record(file: bytes, filename: str, cid: str, owner_id: int = None):
+def assemble_record(
+    filename: str, added: IpfsAddResult, owner_id: int = None, **columns
+):
     return DataStorage(
         file_name=filename,
-        file_cid=cid,
-        file_hash=generate_hash(cid),
-        file_size=len(file),
-        file_type=os.path.splitext(file)[1],
+        file_cid=added.cid,
+        file_hash=added.file_hash,
+        file_size=added.size,
+        file_type=os.path.splitext(filename)[1],
         file_upload_date=datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
         owner_id=owner_id,
+        **columns,
     )
@@ -0,0 +1,17 @@
+from fastapi import Depends, HTTPException
+from starlette.concurrency import run_in_threadpool
+
+from ..users.auth_utils import get_current_user
+from ..users.user_models import User
+from .compression_jobs import get_job, job_status
+from .main import storage_service
+
+
+@storage_service.get("/jobs/{job_id}")
+async def get_job_status(job_id: str, current_user: User = Depends(get_current_user)):
+    job = await run_in_threadpool(get_job, job_id)
+    # someone else's job looks the same as one that doesn't exist
+    if job is None or job["user_id"] != str(current_user.id):
+        raise HTTPException(status_code=404, detail="Job not found")
+    status = await run_in_threadpool(job_status, job_id)
+    return {**status, "kind": job["kind"], "file_name": job["file_name"]}
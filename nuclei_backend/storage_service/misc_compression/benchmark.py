@@ -0,0 +1,120 @@
+"""
+Compares zlib (what CompressImage used to apply), plain zstd and zstd with a
+trained dictionary on a set of small files, per file as the storage
+pipeline compresses them:
+
+    python -m nuclei_backend.storage_service.misc_compression.benchmark --dir samples/
+    python -m nuclei_backend.storage_service.misc_compression.benchmark --owner <uuid>
+
+The dictionary is trained on part of the files and measured on the rest,
+so the ratio is what a new upload would get.
+"""
+from __future__ import annotations
+
+import argparse
+import pathlib
+import random
+import time
+import uuid
+import zlib
+
+import zstandard as zstd
+
+from ..config import Config
+from .misc_compression_utils import train_dictionary
+
+MB = 1024 * 1024
+
+
+def load_samples(args) -> list[bytes]:
+    if args.dir is not None:
+        return [
+            file.read_bytes()
+            for file in sorted(args.dir.rglob("*"))
+            if file.is_file() and 0 < file.stat().st_size <= Config.MISC_DICT_MAX_INPUT
+        ]
+    from ...database import SessionLocal
+    from .dictionaries import sample_owner_content
+
+    with SessionLocal() as db:
+        return sample_owner_content(db, args.owner, args.samples)
+
+
+def measure(name: str, compress, decompress, files: list[bytes], repeat: int) -> dict:
+    original = sum(len(file) for file in files)
+    best_compress = best_decompress = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        frames = [compress(file) for file in files]
+        best_compress = min(best_compress, time.perf_counter() - started)
+        started = time.perf_counter()
+        for frame in frames:
+            decompress(frame)
+        best_decompress = min(best_decompress, time.perf_counter() - started)
+    assert [decompress(frame) for frame in frames[:50]] == files[:50]
+    compressed = sum(len(frame) for frame in frames)
+    return {
+        "codec": name,
+        "ratio": original / compressed,
+        "compress": original / MB / best_compress,
+        "decompress": original / MB / best_decompress,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="compare zlib, zstd and zstd with a dictionary on small files"
+    )
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--dir", type=pathlib.Path, help="directory of sample files")
+    source.add_argument("--owner", type=uuid.UUID, help="sample this owner's files")
+    parser.add_argument("--samples", type=int, default=Config.MISC_DICT_SAMPLES)
+    parser.add_argument("--level", type=int, default=Config.MISC_ZSTD_LEVEL)
+    parser.add_argument("--holdout", type=float, default=0.2,
+                        help="share of files kept out of training")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    files = load_samples(args)
+    random.Random(0).shuffle(files)
+    split = int(len(files) * (1 - args.holdout))
+    train, test = files[:split], files[split:]
+    if not test:
+        parser.error("not enough files to hold any out")
+    dictionary = train_dictionary(train)
+    print(
+        f"{len(train)} training files, {len(test)} test files "
+        f"({sum(map(len, test)) / len(test) / 1024:.1f} KiB average), "
+        f"dictionary {len(dictionary.as_bytes()) // 1024} KiB"
+    )
+
+    plain = zstd.ZstdCompressor(level=args.level)
+    with_dict = zstd.ZstdCompressor(level=args.level, dict_data=dictionary)
+    results = [
+        measure("zlib", zlib.compress, zlib.decompress, test, args.repeat),
+        measure(
+            f"zstd-{args.level}",
+            plain.compress,
+            zstd.ZstdDecompressor().decompress,
+            test,
+            args.repeat,
+        ),
+        measure(
+            f"zstd-{args.level}+dict",
+            with_dict.compress,
+            zstd.ZstdDecompressor(dict_data=dictionary).decompress,
+            test,
+            args.repeat,
+        ),
+    ]
+
+    print(f"{'codec':<16}{'ratio':>8}{'compress MB/s':>16}{'decompress MB/s':>18}")
+    for result in results:
+        print(
+            f"{result['codec']:<16}{result['ratio']:>8.2f}"
+            f"{result['compress']:>16.1f}{result['decompress']:>18.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
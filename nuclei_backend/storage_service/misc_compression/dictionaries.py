@@ -0,0 +1,187 @@
+"""
+Per-owner zstd dictionaries for /compress/misc.
+
+Most of what users store outside images and video is small JSON, text and
+thumbnails, where zstd on its own finds little to match within one file.
+A dictionary trained on an owner's own files supplies those matches. They
+are trained offline, a new version per run, with
+
+    python -m nuclei_backend.storage_service.misc_compression.dictionaries
+
+and jobs compress with the owner's latest version, recording which one on
+the DataStorage row so it can always be read back. The sync read paths
+decompress such records before handing them out, see record_dictionary.
+"""
+from __future__ import annotations
+
+import argparse
+import logging
+import uuid
+
+import zstandard as zstd
+from sqlalchemy import func, or_
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+
+from ...database import SessionLocal
+from ...syncing_service.chunking.utils import STREAM_MAGIC
+from ..config import Config
+from ..ipfs_client import IpfsError, get_ipfs_client
+from ..ipfs_model import CompressionDictionary, DataStorage
+from .misc_compression_utils import load_dictionary, train_dictionary
+
+logger = logging.getLogger(__name__)
+
+# tries at taking the next version when concurrent runs race for it
+VERSION_ATTEMPTS = 3
+
+
+def latest_dictionary(db, owner_id) -> CompressionDictionary | None:
+    return (
+        db.query(CompressionDictionary)
+        .filter(CompressionDictionary.owner_id == owner_id)
+        .order_by(CompressionDictionary.version.desc())
+        .first()
+    )
+
+
+def trainable(query):
+    """
+    Narrows a DataStorage query to records worth training on: small, stored
+    as uploaded, and not of a type whose bytes are already compressed.
+    """
+    return query.filter(
+        DataStorage.compression.is_(None),
+        DataStorage.file_size > 0,
+        DataStorage.file_size <= Config.MISC_DICT_MAX_INPUT,
+        or_(
+            DataStorage.file_type.is_(None),
+            func.lower(DataStorage.file_type).notin_(Config.MISC_DICT_SKIP_TYPES),
+        ),
+    )
+
+
+def sample_owner_content(
+    db, owner_id, samples: int = Config.MISC_DICT_SAMPLES
+) -> list[bytes]:
+    """
+    Reads a random sample of the owner's trainable files back from IPFS.
+    Encrypted uploads are dropped too, ciphertext teaches a dictionary
+    nothing and would put it in every frame trained from it.
+    """
+    records = (
+        trainable(db.query(DataStorage.file_cid))
+        .filter(DataStorage.owner_id == owner_id)
+        .order_by(func.random())
+        .limit(samples)
+        .all()
+    )
+    client = get_ipfs_client()
+    content = []
+    for (cid,) in records:
+        try:
+            data = client.cat(cid)
+        except IpfsError as e:
+            logger.error(f"skipping sample {cid}: {e}")
+            continue
+        if not data.startswith(STREAM_MAGIC):
+            content.append(data)
+    return content
+
+
+def train_owner_dictionary(
+    db, owner_id, samples: int = Config.MISC_DICT_SAMPLES
+) -> CompressionDictionary | None:
+    """
+    Trains and stores the owner's next dictionary version, or returns None
+    when they don't have MISC_DICT_MIN_SAMPLES small files to train on.
+    """
+    content = sample_owner_content(db, owner_id, samples)
+    if len(content) < Config.MISC_DICT_MIN_SAMPLES:
+        logger.info(f"not training {owner_id}: only {len(content)} samples")
+        return None
+    trained = train_dictionary(content)
+    for attempt in range(1, VERSION_ATTEMPTS + 1):
+        current = latest_dictionary(db, owner_id)
+        dictionary = CompressionDictionary(
+            owner_id=owner_id,
+            version=current.version + 1 if current else 1,
+            zstd_dict_id=trained.dict_id(),
+            data=trained.as_bytes(),
+            sample_count=len(content),
+        )
+        db.add(dictionary)
+        try:
+            db.commit()
+            return dictionary
+        except IntegrityError:
+            # a concurrent run stored this version first, take the next one
+            db.rollback()
+            if attempt == VERSION_ATTEMPTS:
+                raise
+
+
+def candidate_owners(db) -> list:
+    """Owners with enough trainable files."""
+    return [
+        owner_id
+        for (owner_id,) in trainable(db.query(DataStorage.owner_id))
+        .group_by(DataStorage.owner_id)
+        .having(func.count() >= Config.MISC_DICT_MIN_SAMPLES)
+        .all()
+    ]
+
+
+def check_compression(record: DataStorage) -> None:
+    if record.compression != "zstd":
+        raise ValueError(f"unknown compression {record.compression}")
+
+
+def record_dictionary(db, record: DataStorage) -> zstd.ZstdCompressionDict | None:
+    """The dictionary a compressed record's frame needs, None if it needs none."""
+    check_compression(record)
+    if not record.compression_dict_id:
+        return None
+    return load_dictionary(db.get(CompressionDictionary, record.compression_dict_id))
+
+
+async def record_dictionary_async(
+    db, record: DataStorage
+) -> zstd.ZstdCompressionDict | None:
+    check_compression(record)
+    if not record.compression_dict_id:
+        return None
+    return load_dictionary(
+        await db.get(CompressionDictionary, record.compression_dict_id)
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="train per-owner zstd dictionaries from their stored files"
+    )
+    parser.add_argument(
+        "--owner",
+        action="append",
+        type=uuid.UUID,
+        help="owner id to train, repeatable; default all",
+    )
+    parser.add_argument("--samples", type=int, default=Config.MISC_DICT_SAMPLES)
+    args = parser.parse_args()
+
+    with SessionLocal() as db:
+        for owner_id in args.owner or candidate_owners(db):
+            try:
+                dictionary = train_owner_dictionary(db, owner_id, args.samples)
+            except (zstd.ZstdError, IpfsError, SQLAlchemyError) as e:
+                db.rollback()
+                logger.error(f"training {owner_id} failed: {e}")
+                continue
+            if dictionary is not None:
+                print(
+                    f"{owner_id}: version {dictionary.version}, "
+                    f"{len(dictionary.data)} bytes from {dictionary.sample_count} files"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+from typing import List
+
+from fastapi import Depends, File, HTTPException, Response, UploadFile, status
+
+from ...users.auth_utils import get_current_user
+from ...users.user_handler_utils import get_db
+from ...users.user_models import User
+from ..compression_jobs import enqueue
+from ..config import Config
+from ..ipfs_model import CompressionDictionary
+from ..main import storage_service
+from .misc_compression_utils import MAX_LEVEL, MIN_LEVEL
+from .tasks import compress_misc
+import logging
+
+
+@storage_service.post("/compress/misc", status_code=status.HTTP_202_ACCEPTED)
+async def compress_task_misc(
+    files: List[UploadFile] = File(...),
+    level: int = Config.MISC_ZSTD_LEVEL,
+    ipfs_flag: bool | None = True,
+    current_user: User = Depends(get_current_user),
+):
+    """
+    Queues one zstd job per file at the given level and returns their ids
+    right away; poll /storage/jobs/{job_id} for the outcome.
+    """
+    if not files:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="No file uploaded",
+        )
+    if not MIN_LEVEL <= level <= MAX_LEVEL:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Level must be between {MIN_LEVEL} and {MAX_LEVEL}",
+        )
+    jobs = []
+    try:
+        for file in files:
+            job_id = await enqueue(
+                compress_misc,
+                "misc",
+                file,
+                current_user.id,
+                level=level,
+                ipfs_flag=ipfs_flag,
+            )
+            jobs.append({"file_name": file.filename, "job_id": job_id})
+    except Exception as e:
+        logging.error(f"queueing misc compression failed: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Compression queue unavailable",
+        ) from e
+    finally:
+        for file in files:
+            await file.close()
+
+    return {"message": "Files submitted for compression", "jobs": jobs}
+
+
+@storage_service.get("/compression/dictionaries/{dictionary_id}")
+def get_compression_dictionary(
+    dictionary_id: int,
+    db=Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """
+    The raw zstd dictionary a record's compression_dict_id points at, which
+    clients need to decompress it.
+    """
+    dictionary = db.get(CompressionDictionary, dictionary_id)
+    if dictionary is None or dictionary.owner_id != current_user.id:
+        raise HTTPException(status_code=404, detail="Dictionary not found")
+    return Response(
+        content=dictionary.data,
+        media_type="application/octet-stream",
+        headers={"X-Dictionary-Version": str(dictionary.version)},
+    )
@@ -0,0 +1,216 @@
+from __future__ import annotations
+
+import functools
+import logging
+import os
+import pathlib
+import time
+from dataclasses import dataclass
+from typing import AsyncIterator, Iterable
+
+import zstandard as zstd
+
+from ..CompressionBase import CompressionImpl
+from ..config import Config
+from ..ipfs_model import CompressionDictionary
+
+logger = logging.getLogger(__name__)
+
+# zstd's fast negative levels down to this one are accepted too
+MIN_LEVEL = -7
+MAX_LEVEL = zstd.MAX_COMPRESSION_LEVEL
+
+
+@dataclass
+class MiscCompressionResult:
+    filename: str
+    # the zstd frame, or the untouched source (bytes or path) if skipped
+    data: bytes | pathlib.Path
+    original_size: int
+    level: int
+    # id of the dictionary the frame needs to be decompressed, 0 for none
+    dict_id: int
+    cpu_seconds: float
+    skipped: bool = False
+    reason: str | None = None
+
+    @property
+    def compressed_size(self) -> int:
+        if isinstance(self.data, pathlib.Path):
+            return self.data.stat().st_size
+        return len(self.data)
+
+    @property
+    def bytes_saved(self) -> int:
+        return self.original_size - self.compressed_size
+
+    def summary(self) -> dict:
+        return {
+            "file_name": self.filename,
+            "level": self.level,
+            "dict_id": self.dict_id,
+            "original_size": self.original_size,
+            "compressed_size": self.compressed_size,
+            "bytes_saved": self.bytes_saved,
+            "cpu_seconds": round(self.cpu_seconds, 4),
+            "skipped": self.skipped,
+            "reason": self.reason,
+        }
+
+
+def check_level(level: int) -> int:
+    if not MIN_LEVEL <= level <= MAX_LEVEL:
+        raise ValueError(f"zstd level must be between {MIN_LEVEL} and {MAX_LEVEL}")
+    return level
+
+
+@functools.lru_cache(maxsize=256)
+def _zstd_dictionary(dictionary_id: int, data: bytes) -> zstd.ZstdCompressionDict:
+    return zstd.ZstdCompressionDict(data)
+
+
+def load_dictionary(dictionary: CompressionDictionary) -> zstd.ZstdCompressionDict:
+    # dictionary rows never change once written, so parsed ones are reused
+    return _zstd_dictionary(dictionary.id, dictionary.data)
+
+
+def dict_options(dictionary: zstd.ZstdCompressionDict | None) -> dict:
+    # zstandard 0.15 rejects dict_data=None, so it is only passed when set
+    return {} if dictionary is None else {"dict_data": dictionary}
+
+
+def train_dictionary(
+    samples: Iterable[bytes], dict_size: int = Config.MISC_DICT_SIZE
+) -> zstd.ZstdCompressionDict:
+    """
+    Trains a zstd dictionary on typical small documents. Small files share
+    too little within themselves for zstd to find matches, a dictionary
+    built from many of them gives it those matches up front. zstd wants a
+    few hundred samples, and raises ZstdError with too few.
+    """
+    return zstd.train_dictionary(dict_size, list(samples))
+
+
+def compress_misc(
+    source: bytes | memoryview | pathlib.Path,
+    filename: str,
+    level: int = Config.MISC_ZSTD_LEVEL,
+    dictionary: zstd.ZstdCompressionDict | None = None,
+    output: pathlib.Path | None = None,
+) -> MiscCompressionResult:
+    """
+    Compresses one file into a zstd frame named `filename`.zst.
+
+    Bytes are compressed in memory, with `dictionary` when they are no
+    bigger than MISC_DICT_MAX_INPUT. A path is streamed into `output`. The
+    source is handed back untouched when the saving is under MISC_MIN_SAVING,
+    which is what already compressed formats end up with.
+    """
+    started = time.process_time()
+    on_disk = isinstance(source, pathlib.Path)
+    original_size = source.stat().st_size if on_disk else len(source)
+    use_dict = (
+        dictionary is not None
+        and not on_disk
+        and original_size <= Config.MISC_DICT_MAX_INPUT
+    )
+    compressor = zstd.ZstdCompressor(
+        level=check_level(level),
+        threads=Config.MISC_ZSTD_THREADS,
+        **dict_options(dictionary if use_dict else None),
+    )
+
+    if on_disk:
+        if output is None:
+            raise ValueError("compressing a file on disk needs an output path")
+        with open(source, "rb") as ifh, open(output, "wb") as ofh:
+            compressor.copy_stream(ifh, ofh, size=original_size)
+        compressed: bytes | pathlib.Path = output
+        compressed_size = output.stat().st_size
+    else:
+        compressed = compressor.compress(source)
+        compressed_size = len(compressed)
+
+    skipped = compressed_size > original_size * (1 - Config.MISC_MIN_SAVING)
+    if skipped and on_disk:
+        output.unlink(missing_ok=True)
+    return MiscCompressionResult(
+        filename=filename if skipped else f"{filename}.zst",
+        data=source if skipped else compressed,
+        original_size=original_size,
+        level=level,
+        dict_id=0 if skipped or not use_dict else dictionary.dict_id(),
+        cpu_seconds=time.process_time() - started,
+        skipped=skipped,
+        reason="compression doesn't pay" if skipped else None,
+    )
+
+
+def decompress_misc(
+    data: bytes, dictionary: zstd.ZstdCompressionDict | None = None
+) -> bytes:
+    """Reverses compress_misc; frames made with a dictionary need it back."""
+    return zstd.ZstdDecompressor(**dict_options(dictionary)).decompress(data)
+
+
+def decompress_misc_file(
+    path: pathlib.Path, dictionary: zstd.ZstdCompressionDict | None = None
+) -> None:
+    """decompress_misc for a frame on disk, replacing it with the original."""
+    partial = path.with_name(path.name + ".part")
+    try:
+        with open(path, "rb") as ifh, open(partial, "wb") as ofh:
+            zstd.ZstdDecompressor(**dict_options(dictionary)).copy_stream(ifh, ofh)
+        os.replace(partial, path)
+    finally:
+        partial.unlink(missing_ok=True)
+
+
+async def decompress_misc_stream(
+    chunks: AsyncIterator[bytes],
+    dictionary: zstd.ZstdCompressionDict | None = None,
+) -> AsyncIterator[bytes]:
+    """decompress_misc for a frame arriving in chunks."""
+    decompressor = zstd.ZstdDecompressor(**dict_options(dictionary)).decompressobj()
+    async for chunk in chunks:
+        data = decompressor.decompress(chunk)
+        if data:
+            yield data
+
+
+class CompressMisc(CompressionImpl):
+    def __init__(
+        self,
+        file: bytes | pathlib.Path,
+        filename: str,
+        level: int = Config.MISC_ZSTD_LEVEL,
+        dictionary: CompressionDictionary | None = None,
+    ):
+        super().__init__(app_path="misc")
+
+        self.filename = filename
+        self.level = check_level(level)
+        # the owner's latest trained dictionary, see dictionaries.py
+        self.dictionary = dictionary
+        self.load_source(file, filename)
+        self.result: MiscCompressionResult | None = None
+
+    def produce_compression(self) -> bytes | pathlib.Path:
+        self.result = compress_misc(
+            self.source,
+            self.filename,
+            self.level,
+            dictionary=load_dictionary(self.dictionary) if self.dictionary else None,
+            output=None if self.in_memory else self.output_temp(".zst"),
+        )
+        logger.info(f"compressed {self.filename}: {self.result.summary()}")
+        return self.result.data
+
+    def record_columns(self) -> dict:
+        """DataStorage columns saying how to read the stored bytes back."""
+        if self.result is None or self.result.skipped:
+            return {}
+        return {
+            "compression": "zstd",
+            "compression_dict_id": self.dictionary.id if self.result.dict_id else None,
+        }
@@ -0,0 +1,40 @@
+from ..compression_jobs import celery_app, run_job
+from ..config import Config
+from .dictionaries import latest_dictionary
+from .misc_compression_utils import CompressMisc
+
+
+@celery_app.task(
+    bind=True, name="storage.compress_misc", max_retries=Config.COMPRESSION_TASK_RETRIES
+)
+def compress_misc(
+    self,
+    spool_path: str,
+    filename: str,
+    user_id: int,
+    level: int = Config.MISC_ZSTD_LEVEL,
+    ipfs_flag=True,
+):
+    def work(path, user, db) -> dict:
+        # small spooled uploads are read once and compressed in memory, with
+        # the owner's dictionary when they have one
+        compressing_file = CompressMisc(
+            path, filename, level, latest_dictionary(db, user.id)
+        )
+        try:
+            compressing_file.produce_compression()
+            result = compressing_file.result
+            summary = result.summary()
+            if ipfs_flag:
+                summary["cid"] = compressing_file.commit_to_ipfs(
+                    result.data,
+                    result.filename,
+                    user,
+                    db,
+                    **compressing_file.record_columns(),
+                )
+            return summary
+        finally:
+            compressing_file.cleanup_compression_outcome()
+
+    return run_job(self, spool_path, user_id, work)
@@ -0,0 +1,32 @@
+from ..compression_jobs import celery_app, run_job
+from ..config import Config
+from .video_compression_utils import CompressVideo
+
+
+@celery_app.task(
+    bind=True, name="storage.compress_video", max_retries=Config.COMPRESSION_TASK_RETRIES
+)
+def compress_video(
+    self,
+    spool_path: str,
+    filename: str,
+    user_id: int,
+    preset: str = Config.VIDEO_DEFAULT_PRESET,
+    ipfs_flag=True,
+):
+    def work(path, user, db) -> dict:
+        # ffmpeg reads the spooled upload in place
+        compressing_file = CompressVideo(path, filename, preset)
+        try:
+            compressing_file.produce_compression()
+            result = compressing_file.result
+            summary = result.summary()
+            if ipfs_flag:
+                summary["cid"] = compressing_file.commit_to_ipfs(
+                    result.data, result.filename, user, db
+                )
+            return summary
+        finally:
+            compressing_file.cleanup_compression_outcome()
+
+    return run_job(self, spool_path, user_id, work)
@@ -0,0 +1,57 @@
+from typing import List
+
+from fastapi import Depends, File, HTTPException, UploadFile, status
+
+from ...users.auth_utils import get_current_user
+from ...users.user_models import User
+from ..compression_jobs import enqueue
+from ..config import Config
+from ..main import storage_service
+from .tasks import compress_video
+import logging
+
+
+@storage_service.post("/compress/video", status_code=status.HTTP_202_ACCEPTED)
+async def compress_task_video(
+    files: List[UploadFile] = File(...),
+    preset: str = Config.VIDEO_DEFAULT_PRESET,
+    ipfs_flag: bool | None = True,
+    current_user: User = Depends(get_current_user),
+):
+    """
+    Queues one transcoding job per file with the given preset and returns
+    their ids right away; poll /storage/jobs/{job_id} for the outcome.
+    """
+    if not files:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="No file uploaded",
+        )
+    if preset not in Config.VIDEO_PRESETS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown preset, use one of {sorted(Config.VIDEO_PRESETS)}",
+        )
+    jobs = []
+    try:
+        for file in files:
+            job_id = await enqueue(
+                compress_video,
+                "video",
+                file,
+                current_user.id,
+                preset=preset,
+                ipfs_flag=ipfs_flag,
+            )
+            jobs.append({"file_name": file.filename, "job_id": job_id})
+    except Exception as e:
+        logging.error(f"queueing video compression failed: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Compression queue unavailable",
+        ) from e
+    finally:
+        for file in files:
+            await file.close()
+
+    return {"message": "Files submitted for compression", "jobs": jobs}
@@ -0,0 +1,156 @@
+from __future__ import annotations
+
+import logging
+import os
+import pathlib
+import subprocess
+import time
+from dataclasses import dataclass
+
+from ..CompressionBase import CompressionImpl
+from ..config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class VideoTranscodeError(RuntimeError):
+    """ffmpeg could not be started at all, as opposed to rejecting the input."""
+
+
+@dataclass
+class VideoCompressionResult:
+    filename: str
+    # the transcoded mp4, or the untouched source if skipped
+    data: pathlib.Path
+    original_size: int
+    preset: str
+    seconds: float
+    skipped: bool = False
+    reason: str | None = None
+
+    @property
+    def compressed_size(self) -> int:
+        return self.data.stat().st_size
+
+    @property
+    def bytes_saved(self) -> int:
+        return self.original_size - self.compressed_size
+
+    def summary(self) -> dict:
+        return {
+            "file_name": self.filename,
+            "preset": self.preset,
+            "original_size": self.original_size,
+            "compressed_size": self.compressed_size,
+            "bytes_saved": self.bytes_saved,
+            "seconds": round(self.seconds, 2),
+            "skipped": self.skipped,
+            "reason": self.reason,
+        }
+
+
+def ffmpeg_command(
+    source: pathlib.Path, output: pathlib.Path, preset: str
+) -> list[str]:
+    if preset not in Config.VIDEO_PRESETS:
+        raise ValueError(f"unknown video preset {preset}")
+    # VIDEO_TRANSCODE_WORKERS ffmpegs share the host, so each gets its cut
+    # of the cores instead of ffmpeg's default of all of them
+    threads = Config.VIDEO_FFMPEG_THREADS or max(
+        1, (os.cpu_count() or 1) // max(Config.VIDEO_TRANSCODE_WORKERS, 1)
+    )
+    return [
+        Config.VIDEO_FFMPEG_PATH,
+        "-hide_banner",
+        "-nostdin",
+        "-loglevel", "error",
+        "-y",
+        "-i", str(source),
+        "-map_metadata", "0",
+        "-threads", str(threads),
+        *Config.VIDEO_PRESETS[preset],
+        # moov atom up front so players can start before the whole file arrives
+        "-movflags", "+faststart",
+        str(output),
+    ]  # fmt: skip
+
+
+def transcode_video(
+    source: pathlib.Path, output: pathlib.Path, filename: str, preset: str
+) -> VideoCompressionResult:
+    """
+    Transcodes `source` into an mp4 at `output` with one of
+    Config.VIDEO_PRESETS, in its own ffmpeg process.
+
+    The source is handed back untouched when ffmpeg can't read it, runs past
+    VIDEO_TRANSCODE_TIMEOUT or saves less than VIDEO_MIN_SAVING. A missing
+    ffmpeg binary raises VideoTranscodeError so the job is retried.
+    """
+    started = time.monotonic()
+    original_size = source.stat().st_size
+
+    def keep(reason) -> VideoCompressionResult:
+        output.unlink(missing_ok=True)
+        return VideoCompressionResult(
+            filename=filename,
+            data=source,
+            original_size=original_size,
+            preset=preset,
+            seconds=time.monotonic() - started,
+            skipped=True,
+            reason=reason,
+        )
+
+    command = ffmpeg_command(source, output, preset)
+    try:
+        done = subprocess.run(
+            command,
+            stdin=subprocess.DEVNULL,
+            capture_output=True,
+            timeout=Config.VIDEO_TRANSCODE_TIMEOUT,
+        )
+    except FileNotFoundError as e:
+        raise VideoTranscodeError(f"ffmpeg not found at {command[0]}") from e
+    except subprocess.TimeoutExpired:
+        return keep("transcode timed out")
+
+    if done.returncode != 0:
+        error = done.stderr.decode(errors="replace").strip().splitlines()
+        return keep(f"not a readable video: {error[-1] if error else done.returncode}")
+
+    if output.stat().st_size > original_size * (1 - Config.VIDEO_MIN_SAVING):
+        return keep("transcoding doesn't pay")
+
+    return VideoCompressionResult(
+        filename=str(pathlib.Path(filename).with_suffix(".mp4")),
+        data=output,
+        original_size=original_size,
+        preset=preset,
+        seconds=time.monotonic() - started,
+    )
+
+
+class CompressVideo(CompressionImpl):
+    def __init__(
+        self,
+        file: bytes | pathlib.Path,
+        filename: str,
+        preset: str = Config.VIDEO_DEFAULT_PRESET,
+    ):
+        # ffmpeg reads from a file, so a path is never pulled into memory
+        super().__init__(app_path="video", spool_threshold=0)
+
+        if preset not in Config.VIDEO_PRESETS:
+            raise ValueError(f"unknown video preset {preset}")
+        self.filename = filename
+        self.preset = preset
+        self.load_source(file, filename)
+        self.result: VideoCompressionResult | None = None
+
+    def produce_compression(self) -> pathlib.Path:
+        source = self.source_path(self.filename)
+        self.result = transcode_video(
+            source, self.output_temp(".mp4"), self.filename, self.preset
+        )
+        logger.info(f"transcoded video {self.filename}: {self.result.summary()}")
+        return self.result.data
@@ -0,0 +1,137 @@
+"""
+Compares the ChunkingEngine with the original Chunker.
+
+Run it from the syncing_service directory, it doesn't import the app:
+
+    cd nuclei_backend/syncing_service
+    python -m chunking.benchmark --size-mb 4096
+
+A file of random bytes is generated in --dir (a temp dir by default), chunked
+by both implementations and rebuilt from its cdc chunks, and the throughput
+of each step is printed. With --shift
+the file is also chunked again with a few bytes inserted at the front, to
+show how many chunks fixed and content-defined boundaries still share.
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import pathlib
+import tempfile
+import time
+
+from .chunking import Chunker, Reconstruct
+from .engine import MiB, ChunkingEngine
+
+
+def generate_file(path: pathlib.Path, size: int) -> None:
+    with open(path, "wb") as f:
+        remaining = size
+        while remaining:
+            block = os.urandom(min(64 * MiB, remaining))
+            f.write(block)
+            remaining -= len(block)
+
+
+def timed(label: str, size: int, func):
+    started = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - started
+    print(f"{label:<28} {elapsed:8.2f}s {size / MiB / elapsed:10.1f} MB/s")
+    return result
+
+
+def run_legacy(path: pathlib.Path, workdir: pathlib.Path, pieces: int) -> None:
+    # the old chunker writes into the working directory
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        Chunker(str(path), pieces).generic_run()
+    finally:
+        os.chdir(cwd)
+
+
+def reconstruct(ccif: pathlib.Path, output_dir: pathlib.Path, workers) -> None:
+    rebuild = Reconstruct(ccif, output_dir=output_dir)
+    rebuild.parse_ccif_file()
+    rebuild.construct_file(workers=workers)
+    assert rebuild.ensure_integrity()
+    rebuild.manifest.close()
+
+
+def shared_chunks(a, b) -> float:
+    digests = {chunk.digest for chunk in a.chunks}
+    return sum(chunk.digest in digests for chunk in b.chunks) / len(b.chunks)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--size-mb", type=int, default=2048)
+    parser.add_argument("--avg-kb", type=int, default=1024)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--dir", default=None)
+    parser.add_argument("--shift", action="store_true")
+    args = parser.parse_args()
+
+    size = args.size_mb * MiB
+    avg_size = args.avg_kb * 1024
+    with tempfile.TemporaryDirectory(dir=args.dir) as tmp:
+        tmp = pathlib.Path(tmp)
+        source = tmp / "source.bin"
+        print(f"generating {args.size_mb} MiB in {tmp}")
+        generate_file(source, size)
+
+        for name in ("legacy", "fixed", "cdc"):
+            (tmp / name).mkdir()
+        timed(
+            "Chunker (original)",
+            size,
+            lambda: run_legacy(source, tmp / "legacy", max(1, size // avg_size)),
+        )
+        fixed = timed(
+            "ChunkingEngine fixed",
+            size,
+            lambda: ChunkingEngine(
+                source, "fixed", avg_size, output_dir=tmp / "fixed",
+                workers=args.workers,
+            ).run(),
+        )
+        cdc = timed(
+            "ChunkingEngine cdc",
+            size,
+            lambda: ChunkingEngine(
+                source, "cdc", avg_size, output_dir=tmp / "cdc", workers=args.workers
+            ).run(),
+        )
+        timed(
+            "ChunkingEngine cdc, no write",
+            size,
+            lambda: ChunkingEngine(source, "cdc", avg_size, workers=args.workers).run(),
+        )
+        print(f"chunks: fixed {len(fixed.chunks)}, cdc {len(cdc.chunks)}")
+        timed(
+            "Reconstruct cdc",
+            size,
+            lambda: reconstruct(
+                cdc.write_ccif(tmp / "cdc"), tmp / "rebuilt", args.workers
+            ),
+        )
+
+        if args.shift:
+            shifted = tmp / "shifted.bin"
+            with open(source, "rb") as src, open(shifted, "wb") as dst:
+                dst.write(b"shift")
+                while block := src.read(64 * MiB):
+                    dst.write(block)
+            source.unlink()
+            fixed_shifted = ChunkingEngine(shifted, "fixed", avg_size).run()
+            cdc_shifted = ChunkingEngine(shifted, "cdc", avg_size).run()
+            print(
+                f"chunks reused after a 5 byte insert: "
+                f"fixed {shared_chunks(fixed, fixed_shifted):.1%}, "
+                f"cdc {shared_chunks(cdc, cdc_shifted):.1%}"
+            )
+
+
+if __name__ == "__main__":
+    main()
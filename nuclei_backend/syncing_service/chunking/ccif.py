@@ -0,0 +1,146 @@
+"""
+Binary CCIF chunk manifest.
+
+Layout, all integers little endian:
+
+    header   magic b"CCIF", version u16, flags u16, file size u64,
+             chunk count u64, file sha256 (32 bytes), primary uuid (16 bytes),
+             file name length u32
+    name     utf-8 file name
+    records  one 64 byte record per chunk, in file order:
+             offset u64, size u64, sha256 (32 bytes), chunk uuid (16 bytes)
+
+Records have a fixed size, so record `i` is read with a single pread at
+`records_offset + i * RECORD.size` without touching the rest of the file.
+"""
+from __future__ import annotations
+
+import bisect
+import os
+import pathlib
+import struct
+import uuid
+from typing import Iterator
+
+from .engine import ChunkManifest, ChunkRecord
+
+MAGIC = b"CCIF"
+VERSION = 1
+HEADER = struct.Struct("<4sHHQQ32s16sI")
+RECORD = struct.Struct("<QQ32s16s")
+
+
+class CcifError(ValueError):
+    pass
+
+
+def write_ccif(manifest: ChunkManifest, path: str | os.PathLike) -> pathlib.Path:
+    path = pathlib.Path(path)
+    name = str(manifest.file_name).encode("utf-8")
+    with open(path, "wb") as f:
+        f.write(
+            HEADER.pack(
+                MAGIC,
+                VERSION,
+                0,
+                manifest.file_size,
+                len(manifest.chunks),
+                bytes.fromhex(manifest.file_hash),
+                manifest.primary_uuid.bytes,
+                len(name),
+            )
+        )
+        f.write(name)
+        f.write(
+            b"".join(
+                RECORD.pack(chunk.offset, chunk.size, chunk.digest, chunk.uid.bytes)
+                for chunk in manifest.chunks
+            )
+        )
+    return path
+
+
+class CcifReader:
+    """
+    Reads a CCIF manifest lazily: only the header is read up front and each
+    record is fetched when asked for.
+    """
+
+    def __init__(self, path: str | os.PathLike) -> None:
+        self.path = pathlib.Path(path)
+        self._fd = os.open(self.path, os.O_RDONLY)
+        try:
+            self._read_header()
+        except Exception:
+            os.close(self._fd)
+            raise
+
+    def _read_header(self) -> None:
+        header = os.pread(self._fd, HEADER.size, 0)
+        if len(header) < HEADER.size or header[:4] != MAGIC:
+            raise CcifError(f"{self.path} is not a CCIF manifest")
+        (
+            _,
+            self.version,
+            self.flags,
+            self.file_size,
+            self.chunk_count,
+            file_hash,
+            primary_uuid,
+            name_length,
+        ) = HEADER.unpack(header)
+        if self.version > VERSION:
+            raise CcifError(f"unsupported CCIF version {self.version}")
+        self.file_hash = file_hash.hex()
+        self.primary_uuid = uuid.UUID(bytes=primary_uuid)
+        self.file_name = os.pread(self._fd, name_length, HEADER.size).decode("utf-8")
+        self.records_offset = HEADER.size + name_length
+        expected = self.records_offset + self.chunk_count * RECORD.size
+        if os.fstat(self._fd).st_size < expected:
+            raise CcifError(f"{self.path} is truncated")
+
+    def __len__(self) -> int:
+        return self.chunk_count
+
+    def record(self, index: int) -> ChunkRecord:
+        if index < 0:
+            index += self.chunk_count
+        if not 0 <= index < self.chunk_count:
+            raise IndexError(index)
+        offset, size, digest, uid = RECORD.unpack(
+            os.pread(self._fd, RECORD.size, self.records_offset + index * RECORD.size)
+        )
+        return ChunkRecord(index, offset, size, digest, uuid.UUID(bytes=uid))
+
+    __getitem__ = record
+
+    def __iter__(self) -> Iterator[ChunkRecord]:
+        for index in range(self.chunk_count):
+            yield self.record(index)
+
+    def index_at(self, offset: int) -> int:
+        """Index of the chunk holding byte `offset` of the original file."""
+        if not 0 <= offset < self.file_size:
+            raise IndexError(offset)
+        # records are sorted by offset, so this reads O(log n) of them
+        return bisect.bisect_right(self, offset, key=lambda c: c.offset) - 1
+
+    def manifest(self) -> ChunkManifest:
+        return ChunkManifest(
+            primary_uuid=self.primary_uuid,
+            file_name=self.file_name,
+            file_size=self.file_size,
+            file_hash=self.file_hash,
+            chunks=list(self),
+        )
+
+    def close(self) -> None:
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def __enter__(self) -> CcifReader:
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
@@ -1,19 +1,27 @@
 import hashlib
+import itertools
 import os
+import pathlib
 import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
-# import the queue class from Python Standard Library
+from .ccif import CcifReader
+from .engine import ChunkManifest, ChunkRecord, chunk_file_name
+from .utils import StreamDecryptionError, decrypt_stream, encrypt_stream, read_file
 
 
 class Chunker:
-    def __init__(self, file_name, size) -> None:
+    def __init__(self, file_name, size, key=None) -> None:
         self.file_name = file_name
         self.size = size
+        self.key = key
         self.primary_uuid = uuid.uuid4()
         self.original_file_hash = ""
         self.chunk_file_hashes = []
         self.chunk_file_uid = []
         self.chunk_amounts = 0
+        self.chunk_records = []
 
     def chunks(self):
         """
@@ -30,15 +38,23 @@ class Chunker:
         """
         split_files = self.chunks()
         count = 0
+        offset = 0
         for chunk in split_files:
-            _hash = hashlib.sha256()
+            _hash = hashlib.sha256(chunk)
             _file_chunk_uid = uuid.uuid4()
             with open(
                 f"{self.primary_uuid}_chunk_{_file_chunk_uid}_{count}.chunk", "wb+"
             ) as f:
-                _hash.update(f.read())
-                count += 1
-                f.write(bytes(chunk))
+                if self.key is None:
+                    f.write(bytes(chunk))
+                else:
+                    for piece in encrypt_stream([chunk], self.key):
+                        f.write(piece)
+            self.chunk_records.append(
+                ChunkRecord(count, offset, len(chunk), _hash.digest(), _file_chunk_uid)
+            )
+            count += 1
+            offset += len(chunk)
             self.chunk_file_uid.append(_file_chunk_uid)
             self.chunk_file_hashes.append(_hash.hexdigest())
 
@@ -57,121 +73,243 @@ class Chunker:
 
     def write_ccif(self):
         """
-        It writes the file's information to a file with the same name as the file's primary UUID.
+        It writes the file's manifest to a binary CCIF file named after the file's primary UUID.
         """  # noqa: E501
-        with open(f"{self.primary_uuid}.ccif", "wb+") as ccif:
-            ccif.write(bytes(str(self.primary_uuid), "utf-8"))
-            ccif.write(bytes("\n", "utf-8"))
+        ChunkManifest(
+            primary_uuid=self.primary_uuid,
+            file_name=os.path.basename(self.file_name),
+            file_size=os.stat(self.file_name).st_size,
+            file_hash=self.original_file_hash,
+            chunks=self.chunk_records,
+        ).write_ccif()
+
+    def generic_run(self):
+        self.produce_chunks()
+        self.hasher()
+        self.write_ccif()
 
-            ccif.write(bytes(str(self.file_name), "utf-8"))
-            ccif.write(bytes("\n", "utf-8"))
 
-            ccif.write(bytes(str(self.size), "utf-8"))
-            ccif.write(bytes("\n", "utf-8"))
+class ChunkIntegrityError(ValueError):
+    pass
 
-            ccif.write(bytes(str(self.original_file_hash), "utf-8"))
-            ccif.write(bytes("\n", "utf-8"))
 
-            ccif.write(bytes(str(self.chunk_file_hashes), "utf-8"))
-            ccif.write(bytes("\n", "utf-8"))
+class ReconstructProgress:
+    """
+    Bitmap of the chunks already written to a reconstruction's output, kept
+    next to it as `<output>.progress`. Each chunk flips one bit in place, so
+    recording progress costs a one byte pwrite.
+    """
 
-            ccif.write(bytes(str(self.chunk_file_uid), "utf-8"))
+    MAGIC = b"CCIP"
 
-    def generic_run(self):
-        self.produce_chunks()
-        self.hasher()
-        self.write_ccif()
+    def __init__(self, path: pathlib.Path, fd: int, bitmap: bytearray) -> None:
+        self.path = path
+        self._fd = fd
+        self._bitmap = bitmap
+
+    @classmethod
+    def open(cls, output: pathlib.Path, primary_uuid: uuid.UUID, chunk_count: int):
+        path = output.with_name(output.name + ".progress")
+        header = cls.MAGIC + primary_uuid.bytes
+        size = (chunk_count + 7) // 8
+        bitmap = bytearray(size)
+        if path.exists() and output.exists():
+            existing = path.read_bytes()
+            # progress of some other manifest, or of a torn write, starts over
+            if existing[: len(header)] == header and len(existing) == len(header) + size:
+                bitmap = bytearray(existing[len(header) :])
+        path.write_bytes(header + bitmap)
+        return cls(path, os.open(path, os.O_WRONLY), bitmap)
+
+    def is_done(self, index: int) -> bool:
+        return bool(self._bitmap[index // 8] & (1 << index % 8))
+
+    def mark_done(self, index: int) -> None:
+        if self.is_done(index):
+            return
+        self._bitmap[index // 8] |= 1 << index % 8
+        os.pwrite(
+            self._fd,
+            self._bitmap[index // 8 : index // 8 + 1],
+            len(self.MAGIC) + 16 + index // 8,
+        )
+
+    def close(self) -> None:
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def remove(self) -> None:
+        self.close()
+        self.path.unlink(missing_ok=True)
 
 
 class Reconstruct:
-    def __init__(self, ccif_file) -> None:
-        self.ccif_file = ccif_file
+    def __init__(
+        self, ccif_file, chunk_dir=None, output_dir="reconstructed", key=None
+    ) -> None:
+        self.ccif_file = pathlib.Path(ccif_file)
+        self.key = key
+        # chunks sit next to their manifest unless told otherwise
+        self.chunk_dir = pathlib.Path(chunk_dir or self.ccif_file.parent)
+        self.output_dir = pathlib.Path(output_dir)
+        self.manifest: CcifReader | None = None
         self.file_name = ""
         self.size = 0
         self.original_file_hash = ""
-        self.chunk_file_hashes = []
-        self.chunk_file_uid = []
         self.primary_uuid = ""
+        self.reconstructed_hash = None
 
-    def parser(self, data):
+    def parse_ccif_file(self):
         """
-        It takes a string of the form `"[UUID(a), UUID(b), UUID(c)]"` and returns a list of the form
-        `["a", "b", "c"]`
+        It opens the manifest; only its header is read until chunks are asked for
+        """
+        self.manifest = CcifReader(self.ccif_file)
+        self.primary_uuid = str(self.manifest.primary_uuid)
+        self.file_name = self.manifest.file_name
+        self.size = self.manifest.file_size
+        self.original_file_hash = self.manifest.file_hash
 
-        :param data: The data to be parsed
-        :return: A list of strings.
-        """  # noqa: E501
-        return [
-            elem.strip("' ")
-            for elem in data.strip("[]\n")
-            .replace("UUID(", "")
-            .replace(")", "")
-            .split(",")
-        ]
+    def chunk_path(self, index: int) -> pathlib.Path:
+        """
+        It returns the path of chunk `index`, straight from its manifest record
+        """
+        return self.chunk_dir / chunk_file_name(
+            self.manifest.primary_uuid, self.manifest.record(index)
+        )
 
-    def parse_ccif_file(self):
+    def chunk_files(self) -> list:
+        return [self.chunk_path(index) for index in range(len(self.manifest))]
+
+    def read_chunk(self, index: int) -> bytes:
         """
-        It reads a file and then parses the data into a list
+        It returns the plaintext of chunk `index`, decrypting it when a key was given
         """
-        with open(self.ccif_file, "rb") as ccif:
-            self.primary_uuid: str = ccif.readline().decode("utf-8")
+        if self.key is None:
+            with open(self.chunk_path(index), "rb") as chunk_file:
+                return chunk_file.read()
+        return b"".join(decrypt_stream(read_file(self.chunk_path(index)), self.key))
 
-            self.file_name: str = ccif.readline().decode("utf-8")
-            self.size: int = ccif.readline().decode("utf-8")
-            self.original_file_hash: str = ccif.readline().decode("utf-8")
-            self.chunk_file_hashes: list = ccif.readline().decode("utf-8")
-            self.chunk_file_uid: list = ccif.readline().decode("utf-8")
+    def read_range(self, start: int, length: int) -> bytes:
+        """
+        It returns `length` bytes of the original file from `start`, reading
+        only the chunks that overlap that range
+        """
+        end = min(start + length, self.manifest.file_size)
+        if start >= end:
+            return b""
+        parts = []
+        index = self.manifest.index_at(start)
+        while index < len(self.manifest):
+            chunk = self.manifest.record(index)
+            if chunk.offset >= end:
+                break
+            begin = max(start, chunk.offset)
+            stop = min(end, chunk.offset + chunk.size)
+            if self.key is None:
+                with open(self.chunk_path(index), "rb") as chunk_file:
+                    chunk_file.seek(begin - chunk.offset)
+                    parts.append(chunk_file.read(stop - begin))
+            else:
+                data = self.read_chunk(index)
+                parts.append(data[begin - chunk.offset : stop - chunk.offset])
+            index += 1
+        return b"".join(parts)
 
-        self.primary_uuid = self.parser(self.primary_uuid)
+    @property
+    def output_path(self) -> pathlib.Path:
+        return self.output_dir / self.file_name
 
-        self.chunk_file_uid = self.parser(self.chunk_file_uid)
-        self.chunk_file_hashes = self.parser(self.chunk_file_hashes)
-        self.file_name = self.file_name.strip("\n")
-        self.size = str(self.size).strip("\n")
-        self.original_file_hash = self.original_file_hash.strip("\n")
+    def _load_chunk(self, chunk: ChunkRecord, fd: int, done: bool):
+        """
+        It returns the verified bytes of `chunk`, writing them into the output at
+        the chunk's offset unless an earlier run already did
+        """
+        if done:
+            data = os.pread(fd, chunk.size, chunk.offset)
+        else:
+            try:
+                data = self.read_chunk(chunk.index)
+            except StreamDecryptionError as e:
+                raise ChunkIntegrityError(
+                    f"chunk {chunk.index} of {self.file_name} failed decryption"
+                ) from e
+        if len(data) != chunk.size or hashlib.sha256(data).digest() != chunk.digest:
+            if done:
+                # the earlier write didn't land, so fetch the chunk again
+                return self._load_chunk(chunk, fd, False)
+            raise ChunkIntegrityError(
+                f"chunk {chunk.index} of {self.file_name} failed verification"
+            )
+        if not done:
+            view = memoryview(data)
+            while view:
+                written = os.pwrite(fd, view, chunk.offset + len(data) - len(view))
+                view = view[written:]
+        return data
 
-    def chunk_files(self) -> list:
+    def construct_file(self, workers=None, window=None):
         """
-        It returns a list of files in the current directory that contain the string "_chunk_" and the
-        first character of the primary_uuid attribute of the object
-        :return: A list of files that are sorted by the chunk number.
-        """  # noqa: E501
+        It writes every chunk into a preallocated output file at its offset, on a
+        thread pool, verifying each chunk's digest before it is written.
 
-        return sorted(
-            [
-                file
-                for file in os.listdir()
-                if "_chunk_" in file and self.primary_uuid[0] in file
-            ],
-            key=lambda file: int(file.split("_")[-1].split(".")[0]),
+        Results are consumed in file order through a window of at most `window`
+        chunks in flight, which bounds memory and lets the whole file hash be
+        computed as the chunks land instead of re-reading the output. Finished
+        chunks are recorded in a progress file, so an interrupted run resumes
+        where it stopped: chunks marked done are read back from the output and
+        checked rather than copied again.
+        """
+        workers = workers or os.cpu_count() or 4
+        window = window or workers * 4
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        progress = ReconstructProgress.open(
+            self.output_path, self.manifest.primary_uuid, len(self.manifest)
         )
+        fd = os.open(self.output_path, os.O_RDWR | os.O_CREAT, 0o644)
+        file_hash = hashlib.sha256()
+        try:
+            os.ftruncate(fd, self.manifest.file_size)
+            if hasattr(os, "posix_fallocate") and self.manifest.file_size:
+                os.posix_fallocate(fd, 0, self.manifest.file_size)
+            with ThreadPoolExecutor(max_workers=workers) as pool:
 
-    def construct_file(self):
-        """
-        It opens the file that we want to reconstruct, then iterates through the chunk files and writes
-        them to the reconstructed file
-        """  # noqa: E501
-        with open(f"reconstructed/{self.file_name}", "wb+") as reconstructed_file:
-            for chunk in self.chunk_files():
-                with open(chunk, "rb") as chunk_file:
-                    reconstructed_file.write(chunk_file.read())
+                def submit(chunk):
+                    return pool.submit(
+                        self._load_chunk, chunk, fd, progress.is_done(chunk.index)
+                    )
+
+                chunks = iter(self.manifest)
+                pending = deque(map(submit, itertools.islice(chunks, window)))
+                index = 0
+                while pending:
+                    file_hash.update(pending.popleft().result())
+                    progress.mark_done(index)
+                    index += 1
+                    if (chunk := next(chunks, None)) is not None:
+                        pending.append(submit(chunk))
+        finally:
+            os.close(fd)
+            progress.close()
+
+        self.reconstructed_hash = file_hash.hexdigest()
+        if self.reconstructed_hash == self.original_file_hash:
+            progress.remove()
 
     def ensure_integrity(self):
         """
-        It reads the file in chunks of 1024 bytes and updates the hash object with each chunk
+        It compares the whole file hash against the manifest, hashing the output
+        in 1 MiB blocks only when construct_file() didn't already compute it
         :return: The return value is a boolean value.
         """  # noqa: E501
-        _hash = hashlib.sha256()
-        with open(f"reconstructed/{self.file_name}", "rb") as file:
-            chunk = 0
-            while chunk != b"":
-                chunk = file.read(1024)
-                _hash.update(chunk)
+        if self.reconstructed_hash is None:
+            _hash = hashlib.sha256()
+            with open(self.output_path, "rb") as file:
+                while chunk := file.read(1024 * 1024):
+                    _hash.update(chunk)
+            self.reconstructed_hash = _hash.hexdigest()
 
-        if _hash.hexdigest() == self.original_file_hash:
-            return True
-        else:
-            return False
+        return self.reconstructed_hash == self.original_file_hash
 
     def run(self):
         """
@@ -179,16 +317,19 @@ class Reconstruct:
         ensure_integrity() function
         """  # noqa: E501
         self.parse_ccif_file()
-        self.construct_file()
-        if self.ensure_integrity():
-            print("File integrity ensured")
+        try:
+            self.construct_file()
+            if self.ensure_integrity():
+                print("File integrity ensured")
+        finally:
+            self.manifest.close()
 
 
-def scan_for_ccif_files():
+def scan_for_ccif_files(directory="."):
     """
-    It returns a generator object that yields the name of each file in the current directory that ends
+    It returns a generator object that yields the path of each file in `directory` that ends
     with ".ccif"
     """  # noqa: E501
-    for file in os.listdir():
+    for file in os.listdir(directory):
         if file.endswith(".ccif"):
-            yield file
+            yield os.path.join(directory, file)
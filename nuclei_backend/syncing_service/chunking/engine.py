@@ -0,0 +1,223 @@
+from __future__ import annotations
+
+import hashlib
+import math
+import mmap
+import os
+import pathlib
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Literal
+
+import numpy as np
+
+from .utils import encrypt_stream
+
+KiB = 1024
+MiB = 1024 * KiB
+# rolling hash arrays for this many bytes stay cache resident
+SCAN_WINDOW = 256 * KiB
+
+# fixed so that the same bytes always cut at the same places, on any host
+GEAR = np.random.default_rng(0x6E75636C).integers(0, 2**32, 256, dtype=np.uint32)
+
+
+@dataclass(frozen=True)
+class ChunkRecord:
+    index: int
+    offset: int
+    size: int
+    digest: bytes
+    uid: uuid.UUID
+
+    @property
+    def hexdigest(self) -> str:
+        return self.digest.hex()
+
+
+def chunk_file_name(primary_uuid: uuid.UUID, chunk: ChunkRecord) -> str:
+    return f"{primary_uuid}_chunk_{chunk.uid}_{chunk.index}.chunk"
+
+
+@dataclass
+class ChunkManifest:
+    primary_uuid: uuid.UUID
+    file_name: str
+    file_size: int
+    file_hash: str
+    chunks: list[ChunkRecord] = field(default_factory=list)
+
+    def chunk_file_name(self, chunk: ChunkRecord) -> str:
+        return chunk_file_name(self.primary_uuid, chunk)
+
+    def write_ccif(self, directory: str | os.PathLike = ".") -> pathlib.Path:
+        """Writes the manifest as `{primary_uuid}.ccif`, see ccif.py."""
+        from .ccif import write_ccif
+
+        return write_ccif(self, pathlib.Path(directory) / f"{self.primary_uuid}.ccif")
+
+
+class ChunkingEngine:
+    """
+    Splits a file into chunks in one pass over an mmap of it.
+
+    In "cdc" mode boundaries are content defined: a gear rolling hash is
+    computed for every byte position with NumPy, a block at a time, and a
+    chunk ends where its low bits are zero (subject to min/max sizes), so an
+    insert near the start of a file only changes the chunks around it. In
+    "fixed" mode chunks are `avg_size` bytes. Chunks are hashed (and written
+    out, when `output_dir` is given) on a thread pool while the scan carries
+    on; hashlib releases the GIL so that work runs in parallel. Digests are
+    always of the plaintext, also when chunk files are encrypted.
+    """
+
+    def __init__(
+        self,
+        file_name: str | os.PathLike,
+        mode: Literal["cdc", "fixed"] = "cdc",
+        avg_size: int = 1 * MiB,
+        min_size: int | None = None,
+        max_size: int | None = None,
+        output_dir: str | os.PathLike | None = None,
+        workers: int | None = None,
+        block_size: int = 8 * MiB,
+        key: str | bytes | None = None,
+    ) -> None:
+        self.file_name = pathlib.Path(file_name)
+        self.mode = mode
+        self.avg_size = avg_size
+        self.min_size = min_size if min_size is not None else avg_size // 4
+        self.max_size = max_size if max_size is not None else avg_size * 4
+        if not 0 < self.min_size < self.avg_size < self.max_size:
+            raise ValueError("chunk sizes must satisfy 0 < min < avg < max")
+        self.output_dir = pathlib.Path(output_dir) if output_dir else None
+        self.workers = workers or os.cpu_count() or 4
+        self.block_size = max(block_size, self.max_size)
+        # expected chunk length is roughly min_size + 2 ** bits
+        self.bits = max(1, round(math.log2(self.avg_size - self.min_size)))
+        # chunk files are written encrypted when given a key, see utils.py
+        self.key = key
+        self.primary_uuid = uuid.uuid4()
+
+    def run(self) -> ChunkManifest:
+        file_size = self.file_name.stat().st_size
+        manifest = ChunkManifest(
+            primary_uuid=self.primary_uuid,
+            file_name=self.file_name.name,
+            file_size=file_size,
+            file_hash=hashlib.sha256().hexdigest(),
+        )
+        if self.output_dir is not None:
+            self.output_dir.mkdir(parents=True, exist_ok=True)
+        if file_size == 0:
+            return manifest
+
+        with open(self.file_name, "rb") as f, mmap.mmap(
+            f.fileno(), 0, access=mmap.ACCESS_READ
+        ) as mm, ThreadPoolExecutor(max_workers=self.workers) as pool:
+            if hasattr(mm, "madvise"):
+                mm.madvise(mmap.MADV_SEQUENTIAL)
+            futures: list[Future] = []
+            file_hash = hashlib.sha256()
+            cuts = self._cuts(mm, file_hash, pool)
+            for index, (offset, size) in enumerate(cuts):
+                futures.append(
+                    pool.submit(self._process_chunk, mm, manifest, index, offset, size)
+                )
+            manifest.chunks = [future.result() for future in futures]
+            manifest.file_hash = file_hash.hexdigest()
+        return manifest
+
+    def _process_chunk(self, mm, manifest, index, offset, size) -> ChunkRecord:
+        with memoryview(mm) as whole, whole[offset : offset + size] as view:
+            chunk = ChunkRecord(
+                index=index,
+                offset=offset,
+                size=size,
+                digest=hashlib.sha256(view).digest(),
+                uid=uuid.uuid4(),
+            )
+            if self.output_dir is not None:
+                with open(self.output_dir / manifest.chunk_file_name(chunk), "wb") as f:
+                    if self.key is None:
+                        f.write(view)
+                    else:
+                        for piece in encrypt_stream([view], self.key):
+                            f.write(piece)
+        return chunk
+
+    def _cuts(self, mm, file_hash, pool):
+        """Yields `(offset, size)` of each chunk as soon as its end is known."""
+        file_size = len(mm)
+        start = 0
+        candidates = np.empty(0, dtype=np.int64)
+        for block_start in range(0, file_size, self.block_size):
+            block_end = min(block_start + self.block_size, file_size)
+            with memoryview(mm) as whole, whole[block_start:block_end] as view:
+                file_hash.update(view)
+            if self.mode == "cdc":
+                scans = [
+                    pool.submit(
+                        self._candidates, mm, start_at,
+                        min(start_at + SCAN_WINDOW, block_end),
+                    )
+                    for start_at in range(block_start, block_end, SCAN_WINDOW)
+                ]
+                candidates = np.concatenate(
+                    [candidates] + [scan.result() for scan in scans]
+                )
+            at_eof = block_end == file_size
+            while start < file_size:
+                end, candidates = self._next_cut(start, candidates, block_end, at_eof)
+                if end is None:
+                    break
+                yield start, end - start
+                start = end
+
+    def _next_cut(self, start, candidates, scanned_to, at_eof):
+        """
+        Picks where the chunk beginning at `start` ends, or None when that
+        depends on bytes past `scanned_to` that haven't been hashed yet.
+        """
+        if self.mode == "fixed":
+            end = start + self.avg_size
+            if end <= scanned_to:
+                return end, candidates
+            return (scanned_to, candidates) if at_eof else (None, candidates)
+
+        lowest = start + self.min_size
+        candidates = candidates[np.searchsorted(candidates, lowest) :]
+        if candidates.size and candidates[0] <= start + self.max_size:
+            return int(candidates[0]), candidates[1:]
+        if start + self.max_size <= scanned_to:
+            return start + self.max_size, candidates
+        return (scanned_to, candidates) if at_eof else (None, candidates)
+
+    def _candidates(self, mm, block_start, block_end) -> np.ndarray:
+        """
+        Offsets between `block_start` and `block_end` where a chunk may end.
+
+        The gear hash h = (h << 1) + GEAR[byte] only keeps the last `bits`
+        bytes in its low `bits` bits, so those bits can be computed for every
+        position at once: summing windows of 1, 2, 4, ... 32 bytes takes five
+        vector passes, and bytes further back than `bits` shift out of the mask.
+        """
+        lead = min(self.bits - 1, block_start)
+        data = np.frombuffer(
+            mm, dtype=np.uint8, count=block_end - block_start + lead,
+            offset=block_start - lead,
+        )
+        rolling = np.take(GEAR, data)
+        del data
+        shifted = np.empty_like(rolling)
+        width = 1
+        while width < 32:
+            np.left_shift(rolling[:-width], np.uint32(width), out=shifted[width:])
+            rolling[width:] += shifted[width:]
+            width *= 2
+        del shifted
+        mask = np.uint32((1 << self.bits) - 1)
+        # a chunk ends after the byte whose hash hits the mask, hence the + 1
+        hits = np.flatnonzero((rolling[lead:] & mask) == 0)
+        return hits.astype(np.int64) + block_start + 1
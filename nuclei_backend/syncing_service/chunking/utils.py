@@ -1,45 +1,314 @@
+import argparse
 import base64
 import hashlib
+import os
+import pathlib
 import random
+import struct
+import tempfile
+import time
+import tracemalloc
+from typing import AsyncIterable, AsyncIterator, Iterable, Iterator
 
 import cryptography
+from cryptography.exceptions import InvalidTag
 from cryptography.fernet import Fernet
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 
+# Streamed files are a header followed by framed AES-256-GCM records:
+#
+#   header  magic b"NCSE", version u8, record size u32, nonce prefix (8 bytes)
+#   record  frame u32 (ciphertext length, top bit set on the last record),
+#           ciphertext + 16 byte tag
+#
+# Every record is at most `record size` bytes of plaintext, its nonce is the
+# prefix followed by the record counter, and the header, counter and final
+# flag are authenticated as associated data, so records can't be reordered,
+# dropped or cut off at the end without decryption failing.
+STREAM_MAGIC = b"NCSE"
+STREAM_VERSION = 1
+STREAM_HEADER = struct.Struct("<4sBI8s")
+FRAME = struct.Struct("<I")
+FINAL_FLAG = 1 << 31
+TAG_SIZE = 16
+RECORD_SIZE = 64 * 1024
+READ_SIZE = 1024 * 1024
 
-def generate_random_file():
-    with open("random.txt", "wb") as f:
-        for _ in range(1024 * 1024):
+
+class StreamDecryptionError(ValueError):
+    pass
+
+
+def generate_random_file(filename="random.txt", size=8 * 1024 * 1024):
+    with open(filename, "wb") as f:
+        for _ in range(size // 8):
             f.write(random.randbytes(8))
 
 
-def encrypt(filename: str, key: str):
-    f = Fernet(key)
-    with open(filename, "rb") as file:
-        file_data = file.read()
+def stream_key(key) -> bytes:
+    """
+    Turns a Fernet style key (urlsafe base64 of 32 bytes) or 32 raw bytes
+    into an AES-256 key.
+    """
+    if isinstance(key, (bytes, bytearray)) and len(key) == 32:
+        return bytes(key)
+    try:
+        raw = base64.urlsafe_b64decode(key)
+    except (ValueError, TypeError) as e:
+        raise ValueError("encryption key must be urlsafe base64") from e
+    if len(raw) != 32:
+        raise ValueError("encryption key must decode to 32 bytes")
+    return raw
 
-    encrypted_data = f.encrypt(file_data)
-    with open(filename, "wb") as file:
-        file.write(encrypted_data)
 
+class StreamEncryptor:
+    """
+    Encrypts a byte stream into the framed format, holding at most one
+    record of plaintext. Feed it with update() and end it with finalize().
+    """
+
+    def __init__(self, key, record_size: int = RECORD_SIZE) -> None:
+        self._aead = AESGCM(stream_key(key))
+        self.record_size = record_size
+        self._prefix = os.urandom(8)
+        self._header = STREAM_HEADER.pack(
+            STREAM_MAGIC, STREAM_VERSION, record_size, self._prefix
+        )
+        self._counter = 0
+        self._buffer = bytearray()
+        self._started = False
+
+    def _seal(self, plaintext, final: bool) -> bytes:
+        nonce = self._prefix + self._counter.to_bytes(4, "little")
+        aad = self._header + struct.pack("<IB", self._counter, final)
+        sealed = self._aead.encrypt(nonce, bytes(plaintext), aad)
+        self._counter += 1
+        return FRAME.pack(len(sealed) | (FINAL_FLAG if final else 0)) + sealed
+
+    def _head(self) -> list:
+        if self._started:
+            return []
+        self._started = True
+        return [self._header]
+
+    def update(self, data) -> bytes:
+        out = self._head()
+        self._buffer += data
+        # the last record is held back until finalize() so it can be flagged
+        while len(self._buffer) > self.record_size:
+            out.append(self._seal(self._buffer[: self.record_size], final=False))
+            del self._buffer[: self.record_size]
+        return b"".join(out)
+
+    def finalize(self) -> bytes:
+        out = self._head()
+        out.append(self._seal(self._buffer, final=True))
+        self._buffer = bytearray()
+        return b"".join(out)
+
+
+class StreamDecryptor:
+    """
+    Decrypts the framed format incrementally, buffering at most one record.
+
+    With `passthrough`, input that doesn't start with the stream header is
+    returned untouched, for streams that may or may not be encrypted.
+    """
+
+    def __init__(self, key, passthrough: bool = False) -> None:
+        self._aead = AESGCM(stream_key(key))
+        self.passthrough = passthrough
+        self._header = None
+        self._plain = False
+        self._counter = 0
+        self._buffer = bytearray()
+        self._finished = False
+
+    def _read_header(self) -> bool:
+        head = bytes(self._buffer[: len(STREAM_MAGIC)])
+        if head != STREAM_MAGIC[: len(head)]:
+            if self.passthrough:
+                self._plain = True
+                return True
+            raise StreamDecryptionError("not an encrypted stream")
+        if len(self._buffer) < STREAM_HEADER.size:
+            return False
+        _, version, record_size, prefix = STREAM_HEADER.unpack_from(self._buffer)
+        if version > STREAM_VERSION:
+            raise StreamDecryptionError(f"unsupported stream version {version}")
+        self._header = bytes(self._buffer[: STREAM_HEADER.size])
+        self._prefix = prefix
+        self._max_record = record_size + TAG_SIZE
+        del self._buffer[: STREAM_HEADER.size]
+        return True
+
+    def update(self, data) -> bytes:
+        self._buffer += data
+        if self._header is None and not self._plain and not self._read_header():
+            return b""
+        if self._plain:
+            out = bytes(self._buffer)
+            self._buffer.clear()
+            return out
+
+        out = []
+        while len(self._buffer) >= FRAME.size:
+            if self._finished:
+                raise StreamDecryptionError("data after the final record")
+            (frame,) = FRAME.unpack_from(self._buffer)
+            length, final = frame & ~FINAL_FLAG, bool(frame & FINAL_FLAG)
+            if length > self._max_record or length < TAG_SIZE:
+                raise StreamDecryptionError("corrupt record frame")
+            if len(self._buffer) < FRAME.size + length:
+                break
+            nonce = self._prefix + self._counter.to_bytes(4, "little")
+            aad = self._header + struct.pack("<IB", self._counter, final)
+            try:
+                out.append(
+                    self._aead.decrypt(
+                        nonce, bytes(self._buffer[FRAME.size : FRAME.size + length]), aad
+                    )
+                )
+            except InvalidTag as e:
+                raise StreamDecryptionError(
+                    f"record {self._counter} failed authentication"
+                ) from e
+            del self._buffer[: FRAME.size + length]
+            self._counter += 1
+            self._finished = final
+        return b"".join(out)
+
+    def finalize(self) -> bytes:
+        if self._header is None and not self._plain:
+            if self.passthrough:
+                # shorter than a header, so it can't have been encrypted
+                out = bytes(self._buffer)
+                self._buffer.clear()
+                return out
+            raise StreamDecryptionError("stream ended before its header")
+        if not self._plain and (self._buffer or not self._finished):
+            raise StreamDecryptionError("stream was truncated")
+        return b""
+
+
+def encrypt_stream(
+    chunks: Iterable[bytes], key, record_size: int = RECORD_SIZE
+) -> Iterator[bytes]:
+    encryptor = StreamEncryptor(key, record_size)
+    for chunk in chunks:
+        if out := encryptor.update(chunk):
+            yield out
+    yield encryptor.finalize()
 
-def decrypt(filename: str, key: bytes):
-    f = Fernet(key)
 
+def decrypt_stream(
+    chunks: Iterable[bytes], key, passthrough: bool = False
+) -> Iterator[bytes]:
+    decryptor = StreamDecryptor(key, passthrough)
+    for chunk in chunks:
+        if out := decryptor.update(chunk):
+            yield out
+    if out := decryptor.finalize():
+        yield out
+
+
+async def encrypt_stream_async(
+    chunks: AsyncIterable[bytes], key, record_size: int = RECORD_SIZE
+) -> AsyncIterator[bytes]:
+    encryptor = StreamEncryptor(key, record_size)
+    async for chunk in chunks:
+        if out := encryptor.update(chunk):
+            yield out
+    yield encryptor.finalize()
+
+
+async def decrypt_stream_async(
+    chunks: AsyncIterable[bytes], key, passthrough: bool = False
+) -> AsyncIterator[bytes]:
+    decryptor = StreamDecryptor(key, passthrough)
+    async for chunk in chunks:
+        if out := decryptor.update(chunk):
+            yield out
+    if out := decryptor.finalize():
+        yield out
+
+
+def read_file(filename, size: int = READ_SIZE) -> Iterator[bytes]:
     with open(filename, "rb") as file:
-        encrypted_data = file.read()
+        while chunk := file.read(size):
+            yield chunk
 
+
+def _replace_with(filename, chunks: Iterable[bytes]) -> None:
+    """
+    Writes `chunks` to a temp file next to `filename` and swaps it in, so
+    a failure part way leaves the original untouched.
+    """
+    directory = os.path.dirname(os.path.abspath(filename))
+    fd, temp = tempfile.mkstemp(dir=directory, prefix=".crypt-")
     try:
-        decrypted_data = f.decrypt(encrypted_data)
-    except cryptography.fernet.InvalidToken:
+        with os.fdopen(fd, "wb") as out:
+            for chunk in chunks:
+                out.write(chunk)
+        os.replace(temp, filename)
+    except BaseException:
+        os.unlink(temp)
+        raise
+
+
+def encrypt(filename: str, key: str):
+    _replace_with(filename, encrypt_stream(read_file(filename), key))
+
+
+def decrypt(filename: str, key: bytes):
+    with open(filename, "rb") as file:
+        streamed = file.read(len(STREAM_MAGIC)) == STREAM_MAGIC
+
+    if not streamed:
+        # files encrypted before the streamed format were one Fernet token
+        f = Fernet(key)
+        with open(filename, "rb") as file:
+            encrypted_data = file.read()
+        try:
+            decrypted_data = f.decrypt(encrypted_data)
+        except cryptography.fernet.InvalidToken:
+            return
+        with open(filename, "wb") as file:
+            file.write(decrypted_data)
         return
 
-    with open(filename, "wb") as file:
-        file.write(decrypted_data)
+    try:
+        _replace_with(filename, decrypt_stream(read_file(filename), key))
+    except StreamDecryptionError:
+        return
 
 
-if __name__ == "__main__":
-    generate_random_file()
+def benchmark(size_mb: int, record_size: int) -> None:
     key = base64.urlsafe_b64encode(hashlib.sha256(b"password").digest())
+    with tempfile.TemporaryDirectory() as tmp:
+        path = pathlib.Path(tmp) / "random.bin"
+        with open(path, "wb") as f:
+            for _ in range(size_mb):
+                f.write(os.urandom(1024 * 1024))
+        original = hashlib.sha256(path.read_bytes()).hexdigest()
+
+        for label, func in (("encrypt", encrypt), ("decrypt", decrypt)):
+            tracemalloc.start()
+            started = time.perf_counter()
+            func(path, key)
+            elapsed = time.perf_counter() - started
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print(
+                f"{label}: {size_mb / elapsed:8.1f} MB/s, "
+                f"peak python memory {peak / 1024 / 1024:.1f} MiB"
+            )
+        assert hashlib.sha256(path.read_bytes()).hexdigest() == original
 
-    # decrypt("random.txt", key)
-    # encrypt("random.txt", key)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="streamed encryption benchmark")
+    parser.add_argument("--size-mb", type=int, default=1024)
+    parser.add_argument("--record-kb", type=int, default=RECORD_SIZE // 1024)
+    args = parser.parse_args()
+    benchmark(args.size_mb, args.record_kb * 1024)
@@ -0,0 +1,204 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import logging
+import os
+import pathlib
+import random
+import re
+from dataclasses import dataclass
+from typing import AsyncIterator
+
+import aiofiles
+import aiohttp
+
+from ..storage_service.config import Config as StorageConfig
+from .sync_config import SyncConfig
+from .utils.balancing import assign_lpt
+
+logger = logging.getLogger(__name__)
+
+SHA256_HEX = re.compile(r"^[0-9a-f]{64}$")
+
+
+class FetchIntegrityError(Exception):
+    """The bytes kubo returned don't match the size or hash on record."""
+
+
+@dataclass
+class FetchResult:
+    record: object
+    path: pathlib.Path
+    size: int = 0
+    sha256: str = ""
+    attempts: int = 0
+    error: str | None = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+class IpfsFetchEngine:
+    """
+    Downloads DataStorage records from kubo onto disk.
+
+    All requests share one aiohttp session whose connector is capped at
+    `concurrency`, bodies are streamed to disk chunk by chunk while their
+    size and sha256 are computed, and failed or mismatched downloads are
+    retried with exponential backoff. Use as an async context manager.
+    """
+
+    def __init__(
+        self,
+        base_url: str = StorageConfig.KUBO_API_URL,
+        concurrency: int = SyncConfig.FETCH_CONCURRENCY,
+        retries: int = SyncConfig.FETCH_RETRIES,
+        backoff: float = SyncConfig.FETCH_BACKOFF_SECONDS,
+        chunk_size: int = SyncConfig.FETCH_CHUNK_SIZE,
+        connect_timeout: float = SyncConfig.FETCH_CONNECT_TIMEOUT_SECONDS,
+        read_timeout: float = SyncConfig.FETCH_READ_TIMEOUT_SECONDS,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.concurrency = concurrency
+        self.retries = retries
+        self.backoff = backoff
+        self.chunk_size = chunk_size
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self._session: aiohttp.ClientSession | None = None
+        self._slots = asyncio.Semaphore(concurrency)
+
+    async def __aenter__(self) -> IpfsFetchEngine:
+        self._session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.concurrency),
+            # large files and slow stream() consumers take as long as they
+            # take, only a stalled connection times out
+            timeout=aiohttp.ClientTimeout(
+                total=None,
+                sock_connect=self.connect_timeout,
+                sock_read=self.read_timeout,
+            ),
+        )
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self._session.close()
+        self._session = None
+
+    async def fetch_all(self, targets) -> list[FetchResult]:
+        """
+        Fetches `(record, path)` pairs with `concurrency` workers.
+
+        Records are spread over the workers by size up front (assign_lpt),
+        so one worker doesn't end up alone on the big files at the end.
+        Results come back in the order of `targets`.
+        """
+        targets = list(targets)
+        results: list[FetchResult | None] = [None] * len(targets)
+        plan = assign_lpt(
+            [record.file_size or 0 for record, _ in targets], self.concurrency
+        )
+
+        async def worker(indices) -> None:
+            for index in indices:
+                record, path = targets[index]
+                results[index] = await self.fetch(record, path)
+
+        await asyncio.gather(*(worker(indices) for indices in plan.bins))
+        return results
+
+    async def fetch(self, record, path: pathlib.Path) -> FetchResult:
+        result = FetchResult(record=record, path=pathlib.Path(path))
+        for attempt in range(1, self.retries + 2):
+            result.attempts = attempt
+            try:
+                async with self._slots:
+                    await self._fetch_once(record, result)
+                result.error = None
+                return result
+            except (
+                aiohttp.ClientError,
+                asyncio.TimeoutError,
+                FetchIntegrityError,
+            ) as e:
+                result.error = str(e) or e.__class__.__name__
+                logger.warning(
+                    f"fetch of {record.file_cid} failed "
+                    f"(attempt {attempt}): {result.error}"
+                )
+            if attempt <= self.retries:
+                # backoff happens outside the slot so healthy fetches keep it
+                await asyncio.sleep(
+                    self.backoff * 2 ** (attempt - 1) * (1 + random.random())
+                )
+        return result
+
+    async def stream(self, record) -> AsyncIterator[bytes]:
+        """
+        Yields a record's bytes straight from kubo as they arrive.
+
+        Nothing is read ahead of the consumer, so a slow client slows the
+        kubo read too. Size and hash are checked once the body ends and a
+        mismatch raises FetchIntegrityError, since bytes already yielded
+        can't be taken back.
+        """
+        digest = hashlib.sha256()
+        size = 0
+        async with self._slots:
+            async with self._session.post(
+                f"{self.base_url}/api/v0/cat", params={"arg": record.file_cid}
+            ) as response:
+                if response.status != 200:
+                    raise aiohttp.ClientResponseError(
+                        response.request_info,
+                        response.history,
+                        status=response.status,
+                        message=await response.text(),
+                    )
+                async for chunk in response.content.iter_chunked(self.chunk_size):
+                    digest.update(chunk)
+                    size += len(chunk)
+                    yield chunk
+        self.verify(record, size, digest.hexdigest())
+
+    async def _fetch_once(self, record, result: FetchResult) -> None:
+        digest = hashlib.sha256()
+        size = 0
+        partial = result.path.with_name(result.path.name + ".part")
+        try:
+            async with self._session.post(
+                f"{self.base_url}/api/v0/cat", params={"arg": record.file_cid}
+            ) as response:
+                if response.status != 200:
+                    raise aiohttp.ClientResponseError(
+                        response.request_info,
+                        response.history,
+                        status=response.status,
+                        message=await response.text(),
+                    )
+                async with aiofiles.open(partial, "wb") as f:
+                    async for chunk in response.content.iter_chunked(self.chunk_size):
+                        digest.update(chunk)
+                        size += len(chunk)
+                        await f.write(chunk)
+
+            self.verify(record, size, digest.hexdigest())
+            os.replace(partial, result.path)
+        finally:
+            if partial.exists():
+                partial.unlink()
+        result.size = size
+        result.sha256 = digest.hexdigest()
+
+    @staticmethod
+    def verify(record, size: int, sha256: str) -> None:
+        if record.file_size is not None and size != record.file_size:
+            raise FetchIntegrityError(
+                f"{record.file_cid}: expected {record.file_size} bytes, got {size}"
+            )
+        # records from before uploads were hashed client side hold kubo ls output
+        expected = (record.file_hash or "").lower()
+        if SHA256_HEX.match(expected) and sha256 != expected:
+            raise FetchIntegrityError(f"{record.file_cid}: sha256 mismatch")
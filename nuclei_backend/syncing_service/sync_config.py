@@ -0,0 +1,38 @@
+import os
+import pathlib
+from typing import Final
+
+
+class SyncConfig(object):
+    # every sync session stages its downloads in its own folder under here
+    STAGING_DIR: Final = pathlib.Path(
+        os.environ.get(
+            "SYNC_STAGING_DIR", pathlib.Path(__file__).parent / "FILE_PLAYING_FIELD"
+        )
+    ).absolute()
+    REDIS_URL: Final = os.environ.get("REDIS_URL", "redis://127.0.0.1:6379")
+    # default and largest page sizes for the redis manifest listing
+    MANIFEST_PAGE_SIZE: Final = int(os.environ.get("MANIFEST_PAGE_SIZE", 100))
+    MANIFEST_MAX_PAGE_SIZE: Final = int(os.environ.get("MANIFEST_MAX_PAGE_SIZE", 1000))
+    # default and largest page sizes for DataStorage listings
+    LISTING_PAGE_SIZE: Final = int(os.environ.get("LISTING_PAGE_SIZE", 100))
+    LISTING_MAX_PAGE_SIZE: Final = int(os.environ.get("LISTING_MAX_PAGE_SIZE", 1000))
+
+    # IPFS fetch engine used by sync downloads
+    FETCH_CONCURRENCY: Final = int(os.environ.get("FETCH_CONCURRENCY", 16))
+    FETCH_RETRIES: Final = int(os.environ.get("FETCH_RETRIES", 3))
+    FETCH_BACKOFF_SECONDS: Final = float(os.environ.get("FETCH_BACKOFF_SECONDS", 0.5))
+    FETCH_CHUNK_SIZE: Final = int(os.environ.get("FETCH_CHUNK_SIZE", 256 * 1024))
+    # no cap on a whole transfer, only on connecting and on kubo going quiet
+    FETCH_CONNECT_TIMEOUT_SECONDS: Final = float(
+        os.environ.get("FETCH_CONNECT_TIMEOUT_SECONDS", 10)
+    )
+    FETCH_READ_TIMEOUT_SECONDS: Final = float(
+        os.environ.get("FETCH_READ_TIMEOUT_SECONDS", 60)
+    )
+
+    # files up to this size ride along inline in socket change events
+    SOCKET_INLINE_MAX_BYTES: Final = int(
+        os.environ.get("SOCKET_INLINE_MAX_BYTES", 64 * 1024)
+    )
+    SOCKET_CHANNEL: Final = os.environ.get("SOCKET_CHANNEL", "nuclei-sync")
@@ -0,0 +1,132 @@
+from sqlalchemy import func, select
+
+from ..storage_service.ipfs_model import (
+    DataChange,
+    DataStorage,
+    journal_entry,
+    lock_journal,
+)
+
+
+def delete_records(db, user_id, *criteria) -> list[int]:
+    """
+    Deletes the user's records matching `criteria` in one statement and
+    journals a tombstone for each, returning the deleted ids. The caller
+    commits.
+    """
+    table = DataStorage.__table__
+    deleted = db.execute(
+        table.delete()
+        .where(table.c.owner_id == user_id, *criteria)
+        .returning(
+            table.c.id,
+            table.c.owner_id,
+            table.c.file_name,
+            table.c.file_cid,
+            table.c.file_size,
+        )
+    ).all()
+    if deleted:
+        lock_journal(db, [user_id])
+        db.execute(
+            DataChange.__table__.insert(),
+            [journal_entry(row, DataChange.DELETE) for row in deleted],
+        )
+    return [row.id for row in deleted]
+
+
+def get_change_cursor(db, user_id) -> int:
+    return (
+        db.query(func.coalesce(func.max(DataChange.id), 0))
+        .filter(DataChange.owner_id == user_id)
+        .scalar()
+    )
+
+
+async def get_change_cursor_async(db, user_id) -> int:
+    result = await db.execute(
+        select(func.coalesce(func.max(DataChange.id), 0)).filter(
+            DataChange.owner_id == user_id
+        )
+    )
+    return result.scalar_one()
+
+
+async def get_changes_async(db, user_id, since: int, limit: int) -> list:
+    result = await db.execute(
+        select(DataChange)
+        .filter(DataChange.owner_id == user_id, DataChange.id > since)
+        .order_by(DataChange.id)
+        .limit(limit)
+    )
+    return result.scalars().all()
+
+
+def collapse_changes(changes: list) -> list[dict]:
+    """
+    Reduces a run of journal entries to the latest state of each record, so a
+    file added and deleted inside the window only shows up as a tombstone.
+    """
+    latest = {}
+    for change in changes:
+        latest.pop(change.data_id, None)
+        latest[change.data_id] = change
+    return [
+        {
+            "seq": change.id,
+            "operation": change.operation,
+            "id": change.data_id,
+            "file_name": change.file_name,
+            "file_cid": change.file_cid,
+            "file_size": change.file_size,
+        }
+        for change in latest.values()
+    ]
+
+
+def get_added_since(db, user_id, since: int) -> list:
+    """Records added after `since` that still exist."""
+    added = select(DataChange.data_id).filter(
+        DataChange.owner_id == user_id,
+        DataChange.id > since,
+        DataChange.operation == DataChange.ADD,
+    )
+    return (
+        db.query(DataStorage)
+        .filter(DataStorage.owner_id == user_id, DataStorage.id.in_(added))
+        .order_by(DataStorage.id)
+        .all()
+    )
+
+
+async def get_added_since_async(
+    db, user_id, since: int, after_id: int = 0, limit: int = 100
+) -> list:
+    """Keyset page of the records added after `since` that still exist."""
+    added = select(DataChange.data_id).filter(
+        DataChange.owner_id == user_id,
+        DataChange.id > since,
+        DataChange.operation == DataChange.ADD,
+    )
+    result = await db.execute(
+        select(DataStorage)
+        .filter(
+            DataStorage.owner_id == user_id,
+            DataStorage.id > after_id,
+            DataStorage.id.in_(added),
+        )
+        .order_by(DataStorage.id)
+        .limit(limit)
+    )
+    return result.scalars().all()
+
+
+def get_deleted_since(db, user_id, since: int) -> list[int]:
+    return [
+        data_id
+        for (data_id,) in db.query(DataChange.data_id).filter(
+            DataChange.owner_id == user_id,
+            DataChange.id > since,
+            DataChange.operation == DataChange.DELETE,
+        )
+    ]
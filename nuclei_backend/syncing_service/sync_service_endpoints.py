@@ -1,6 +1,9 @@
 import json
 import asyncio
-from fastapi import Depends, HTTPException
+from uuid import uuid4
+
+from fastapi import Depends, Header, HTTPException, Response
+from fastapi.responses import StreamingResponse
 from fastapi import BackgroundTasks, status
 from fastapi_utils.tasks import repeat_every
 
@@ -8,7 +11,17 @@ from ..storage_service.ipfs_model import DataStorage
 from ..users.auth_utils import get_current_user
 from ..users.user_handler_utils import get_db
 from ..users.user_models import User
+from .chunking.utils import stream_key
+from .sync_config import SyncConfig
+from .sync_journal import (
+    delete_records,
+    get_added_since,
+    get_change_cursor,
+    get_deleted_since,
+)
 from .sync_service_main import sync_router
+from .sync_stream import content_disposition, stream_library
+from .utils.socket_connection import socket_manager
 from .sync_user_cache import (
     FileSessionManager,
     FileListener,
@@ -24,24 +37,30 @@ import logging
 import datetime
 
 
-async def process_files(user, db):
+async def process_files(user, db, since: int | None = None):
+    """
+    Downloads the user's files into the Redis cache. With `since`, only the
+    files added after that journal cursor are fetched and the ones deleted
+    since are evicted, instead of re-downloading the whole library.
+    """
     try:
-        cids = get_user_cids(user.id, db)
-        get_collective_bytes(user.id, db)
+        cursor = get_change_cursor(db, user.id)
+        redis_controller = RedisController(user=str(user.id))
+        if since is None:
+            cids = get_user_cids(user.id, db)
+        else:
+            cids = get_added_since(db, user.id, since)
+            for data_id in get_deleted_since(db, user.id, since):
+                redis_controller.delete_file(data_id)
         files = UserDataExtraction(user.id, db, cids)
         file_session_cache = FileSessionManager(files.session_id)
         file_session_cache.activate_file_session()
-        redis_controller = RedisController(user=str(user.id))
         await files.download_file_ipfs()  # await here
-        files.write_file_summary()
 
-        file_listener = FileListener(user.id, files.session_id)
+        file_listener = FileListener(user.id, files.session_id, files.new_folder)
         file_listener.file_listener()
 
-        # Use asynchronous sleep
-        await asyncio.sleep(10)
-
-        redis_controller.set_file_count(len(cids))
+        redis_controller.set_file_count(redis_controller.cached_file_count())
 
         try:
             files.cleanup()
@@ -51,6 +70,7 @@ async def process_files(user, db):
         file_session_cache.deactivate_file_session()
         redis_controller.close()
         file_session_cache.close()
+        return cursor
 
     except HTTPException as http_exception:
         logging.error(f"HTTPException: {http_exception.detail}")
@@ -61,18 +81,45 @@ async def process_files(user, db):
 @sync_router.get("/fetch/all")
 async def dispatch_all(
     background_tasks: BackgroundTasks,
+    since: int | None = None,
     user: User = Depends(get_current_user),
     db=Depends(get_db),
 ):
     try:
-        await process_files(user, db)
+        cursor = await process_files(user, db, since)
         return {
             "message": "Dispatched",
+            "cursor": cursor,
         }, status.HTTP_202_ACCEPTED
     except Exception as e:
         return {"error": str(e)}
 
 
+@sync_router.get("/stream")
+async def stream_all(
+    since: int | None = None,
+    x_encryption_key: str | None = Header(None),
+    user: User = Depends(get_current_user),
+):
+    """
+    Streams the library (or what was added after journal cursor `since`) as
+    multipart/mixed, one part per file, straight from IPFS. Nothing is staged
+    on disk or in Redis and the first file starts flowing immediately.
+    Each file part is followed by a status part saying whether it arrived
+    whole; discard any file whose status isn't ok. Files uploaded with X-Encryption-Key come back decrypted given the same key.
+    """
+    if x_encryption_key is not None:
+        try:
+            stream_key(x_encryption_key)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e)) from e
+    boundary = uuid4().hex
+    return StreamingResponse(
+        stream_library(user.id, boundary, since, x_encryption_key),
+        media_type=f"multipart/mixed; boundary={boundary}",
+    )
+
+
 @sync_router.on_event("startup")
 @repeat_every(seconds=60 * 60 * 2)
 async def clear_redis_schedular():
@@ -90,24 +137,59 @@ async def clear_redis_schedular():
 
 
 @sync_router.get("/fetch/redis/all")
-async def redis_cache_all(user: User = Depends(get_current_user)):
+async def redis_cache_all(
+    cursor: int = 0,
+    limit: int = SyncConfig.MANIFEST_PAGE_SIZE,
+    user: User = Depends(get_current_user),
+):
+    """
+    Lists the cached files after `cursor`, file bytes are fetched one at a time
+    from /fetch/redis/file/{file_id}.
+    """
     try:
         _redis = RedisController(str(user.id))
-        all_files = _redis.get_files()
+        files = _redis.get_manifest(
+            after=cursor, limit=min(limit, SyncConfig.MANIFEST_MAX_PAGE_SIZE)
+        )
         _redis.close()
-        all_files = json.loads(all_files)
 
-        return {"files": all_files}
+        return {
+            "files": files,
+            "next_cursor": files[-1]["id"] if files else None,
+        }
 
     except Exception as e:
         print(e)
 
 
+@sync_router.get("/fetch/redis/file/{file_id}")
+async def redis_cache_file(file_id: int, user: User = Depends(get_current_user)):
+    _redis = RedisController(str(user.id))
+    data = _redis.get_file(file_id)
+    meta = _redis.get_file_meta(file_id)
+    if data is None or meta is None:
+        raise HTTPException(status_code=404, detail="File not cached")
+    return Response(
+        content=data,
+        media_type="application/octet-stream",
+        headers={
+            "Content-Disposition": content_disposition(meta["name"]),
+            "X-File-Id": str(file_id),
+            "X-File-Cid": str(meta.get("cid", "")),
+        },
+    )
+
+
 @sync_router.post("/fetch/delete/all")
 def delete_all(user: User = Depends(get_current_user), db=Depends(get_db)):
-    db.query(DataStorage).delete()
+    deleted = delete_records(db, user.id)
     db.commit()
-    return {"message": "deleted"}
+    RedisController(str(user.id)).clear_cache()
+    if deleted:
+        socket_manager.publish_change_sync(
+            user.id, "delete", [{"id": data_id} for data_id in deleted]
+        )
+    return {"message": "deleted", "count": len(deleted)}
 
 
 @sync_router.get("/fetch/redis/clear")
@@ -0,0 +1,169 @@
+import asyncio
+import json
+import logging
+import unicodedata
+from typing import AsyncIterator
+from urllib.parse import quote
+
+import aiohttp
+import zstandard as zstd
+
+from ..database import AsyncSessionLocal
+from ..storage_service.misc_compression.dictionaries import record_dictionary_async
+from ..storage_service.misc_compression.misc_compression_utils import (
+    decompress_misc_stream,
+)
+from .chunking.utils import StreamDecryptionError, decrypt_stream_async
+from .fetch_engine import FetchIntegrityError, IpfsFetchEngine
+from .sync_config import SyncConfig
+from .sync_journal import get_added_since_async, get_change_cursor_async
+from .sync_utils import get_user_cids_page_async
+
+
+async def iter_records(user_id, since: int | None = None) -> AsyncIterator:
+    """
+    Walks the user's records (or those added after `since`) page by page.
+
+    Every page gets its own short session so a long running stream doesn't
+    hold a pooled connection between pages.
+    """
+    after_id = 0
+    while True:
+        async with AsyncSessionLocal() as db:
+            if since is None:
+                page = await get_user_cids_page_async(
+                    user_id, db, after_id=after_id, limit=SyncConfig.LISTING_PAGE_SIZE
+                )
+            else:
+                page = await get_added_since_async(
+                    db,
+                    user_id,
+                    since,
+                    after_id=after_id,
+                    limit=SyncConfig.LISTING_PAGE_SIZE,
+                )
+        for record in page:
+            yield record
+        if len(page) < SyncConfig.LISTING_PAGE_SIZE:
+            return
+        after_id = page[-1].id
+
+
+# follows every file's part and says whether its bytes arrived whole
+STATUS_CONTENT_TYPE = "application/vnd.nuclei.file-status+json"
+
+
+def part_head(boundary: str, content_type: str, headers: dict) -> bytes:
+    lines = [f"--{boundary}", f"Content-Type: {content_type}"]
+    lines += [f"{name}: {value}" for name, value in headers.items()]
+    return ("\r\n".join(lines) + "\r\n\r\n").encode()
+
+
+def content_disposition(filename) -> str:
+    """
+    An attachment header for any file name: a plain ASCII filename for old
+    clients plus the exact name as RFC 5987 UTF-8 in filename*.
+    """
+    name = str(filename)
+    fallback = "".join(
+        char
+        for char in unicodedata.normalize("NFKD", name)
+        if " " <= char <= "~" and char not in '"\\'
+    ).strip() or "download"
+    return (
+        f'attachment; filename="{fallback}"; '
+        f"filename*=UTF-8''{quote(name, safe='')}"
+    )
+
+
+def file_headers(record) -> dict:
+    # no Content-Length: the bytes are only verified once the part has been
+    # sent, so its size is reported in the status part that follows
+    return {
+        "Content-Disposition": content_disposition(record.download_name),
+        "X-File-Id": str(record.id),
+        "X-File-Cid": record.file_cid,
+    }
+
+
+def status_part(boundary: str, record, size: int, error: str | None) -> bytes:
+    status = {"id": record.id, "ok": error is None, "size": size}
+    if error is not None:
+        status["error"] = error
+    head = part_head(boundary, STATUS_CONTENT_TYPE, {"X-File-Id": str(record.id)})
+    return head + json.dumps(status).encode() + b"\r\n"
+
+
+async def stream_dictionary(record, dictionaries: dict):
+    """record_dictionary_async, loading each dictionary once per stream."""
+    if record.compression_dict_id not in dictionaries:
+        async with AsyncSessionLocal() as db:
+            dictionaries[record.compression_dict_id] = await record_dictionary_async(
+                db, record
+            )
+    return dictionaries[record.compression_dict_id]
+
+
+async def stream_library(
+    user_id, boundary: str, since: int | None = None, key: str | None = None
+) -> AsyncIterator[bytes]:
+    """
+    Streams the user's files as a multipart/mixed body, one part per file,
+    piping each from kubo to the client as it arrives. Every file is then
+    followed by a status part (STATUS_CONTENT_TYPE) with its id, size and
+    whether it arrived whole; a file part is only good when its status says
+    ok, since a fetch, hash or decryption failure can come after its first
+    bytes are out. A file that fails before any byte gets just the status.
+    The last part is a JSON summary with the files that failed and the
+    journal cursor to pass as `since` next time. Files stored zstd compressed
+    by /compress/misc are decompressed on the way out. With `key`, files
+    stored encrypted are decrypted too and the rest pass through.
+    """
+    async with AsyncSessionLocal() as db:
+        cursor = await get_change_cursor_async(db, user_id)
+
+    sent, failed = 0, []
+    dictionaries: dict = {}
+    async with IpfsFetchEngine() as engine:
+        async for record in iter_records(user_id, since):
+            started = False
+            size = 0
+            error = None
+            headers = file_headers(record)
+            chunks = engine.stream(record)
+            try:
+                if record.compression is not None:
+                    chunks = decompress_misc_stream(
+                        chunks, await stream_dictionary(record, dictionaries)
+                    )
+                if key is not None:
+                    chunks = decrypt_stream_async(chunks, key, passthrough=True)
+                async for chunk in chunks:
+                    if not started:
+                        yield part_head(boundary, "application/octet-stream", headers)
+                        started = True
+                    size += len(chunk)
+                    yield chunk
+                if not started:
+                    # empty file, still gets its part
+                    yield part_head(boundary, "application/octet-stream", headers)
+                    started = True
+                sent += 1
+            except (
+                aiohttp.ClientError,
+                asyncio.TimeoutError,
+                FetchIntegrityError,
+                StreamDecryptionError,
+                zstd.ZstdError,
+                ValueError,
+            ) as e:
+                logging.error(f"streaming {record.file_cid} failed: {e}")
+                error = e.__class__.__name__
+                failed.append(record.id)
+            if started:
+                yield b"\r\n"
+            yield status_part(boundary, record, size, error)
+
+    yield part_head(boundary, "application/json", {})
+    yield json.dumps({"files": sent, "failed": failed, "cursor": cursor}).encode()
+    yield f"\r\n--{boundary}--\r\n".encode()
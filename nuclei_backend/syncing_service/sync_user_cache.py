@@ -1,4 +1,3 @@
-import base64
 import datetime
 import hashlib
 import json
@@ -9,26 +8,83 @@ import time
 from os import environ
 import redis
 
+from .sync_config import SyncConfig
+
 
 class RedisController:
+    """
+    Per-user sync cache.
+
+    Each file's bytes live under their own key, `sync:<user>:file:<id>`, and
+    a small manifest hash (`sync:<user>:manifest`, id -> JSON metadata) plus
+    a sorted set of ids (`sync:<user>:ids`) describe what is cached, so
+    single files or pages can be read and updated without touching the rest.
+    """
+
     redis_connection = redis.Redis().from_url(
-        url="redis://127.0.0.1:6379", decode_responses=True, db=0
+        url=SyncConfig.REDIS_URL, decode_responses=True, db=0
+    )
+    # file contents are stored raw, so they need a connection that doesn't decode
+    binary_connection = redis.Redis().from_url(
+        url=SyncConfig.REDIS_URL, decode_responses=False, db=0
     )
 
     def __init__(self, user):
         self.user = user
+        self.manifest_key = f"sync:{self.user}:manifest"
+        self.ids_key = f"sync:{self.user}:ids"
+
+    def file_key(self, file_id) -> str:
+        return f"sync:{self.user}:file:{file_id}"
+
+    def set_file(self, file_id: int, data: bytes, meta: dict):
+        meta = dict(meta, id=int(file_id))
+        pipeline = self.binary_connection.pipeline(transaction=False)
+        pipeline.set(self.file_key(file_id), data)
+        pipeline.hset(self.manifest_key, str(file_id), json.dumps(meta))
+        pipeline.zadd(self.ids_key, {str(file_id): int(file_id)})
+        return pipeline.execute()
+
+    def get_file(self, file_id) -> bytes | None:
+        return self.binary_connection.get(self.file_key(file_id))
+
+    def get_file_meta(self, file_id) -> dict | None:
+        meta = self.redis_connection.hget(self.manifest_key, str(file_id))
+        return json.loads(meta) if meta else None
+
+    def get_manifest(self, after: int = 0, limit: int = SyncConfig.MANIFEST_PAGE_SIZE):
+        """Returns up to `limit` manifest entries with ids greater than `after`."""
+        ids = self.redis_connection.zrangebyscore(
+            self.ids_key, f"({int(after)}", "+inf", start=0, num=limit
+        )
+        if not ids:
+            return []
+        return [
+            json.loads(meta)
+            for meta in self.redis_connection.hmget(self.manifest_key, ids)
+            if meta
+        ]
 
-    def set_files(self, file: list[dict[str, bytes]]):
-        return self.redis_connection.set(str(self.user), str(file))
-
-    def get_files(self):
-        return self.redis_connection.get(self.user)
+    def delete_file(self, file_id):
+        pipeline = self.redis_connection.pipeline(transaction=False)
+        pipeline.delete(self.file_key(file_id))
+        pipeline.hdel(self.manifest_key, str(file_id))
+        pipeline.zrem(self.ids_key, str(file_id))
+        return pipeline.execute()
 
     def clear_cache(self):
-        return self.redis_connection.delete(self.user)
+        file_ids = self.redis_connection.zrange(self.ids_key, 0, -1)
+        return self.redis_connection.delete(
+            self.manifest_key,
+            self.ids_key,
+            *(self.file_key(file_id) for file_id in file_ids),
+        )
 
     def check_files(self):
-        return self.redis_connection.exists(self.user)
+        return self.redis_connection.exists(self.manifest_key)
+
+    def cached_file_count(self) -> int:
+        return self.redis_connection.zcard(self.ids_key)
 
     def set_file_count(self, count: int):
         return self.redis_connection.set(f"{self.user}_count", count)
@@ -51,7 +107,7 @@ class FileSessionManager:
     """A cache entry for a file in a directory."""
 
     redis_connection = redis.Redis().from_url(
-        url="redis://127.0.0.1:6379", decode_responses=True, db=1
+        url=SyncConfig.REDIS_URL, decode_responses=True, db=1
     )
 
     def __init__(self, dir_id):
@@ -79,7 +135,7 @@ class FileSessionManager:
 
 class FileCleanerSchedule:
     redis_connection = redis.Redis().from_url(
-        url="redis://127.0.0.1:6379", decode_responses=True, db=1
+        url=SyncConfig.REDIS_URL, decode_responses=True, db=1
     )
 
     def __init__(self) -> None:
@@ -89,10 +145,11 @@ class FileCleanerSchedule:
 
     def get_expired_sessions(self):
         "returns an array of expired keys"
-        for sessions in self.all_sessions:
-            if not self.is_expired(self.redis_connection.get(sessions)):
-                self.all_sessions.remove(sessions)
-        return self.all_sessions
+        return [
+            sessions
+            for sessions in self.all_sessions
+            if self.is_expired(self.redis_connection.get(sessions) or 0)
+        ]
 
     def is_expired(self, _time):
         "calculates the time_delta fed"
@@ -103,14 +160,11 @@ class FileCleanerSchedule:
 
     def clean_expired_folders(self):
         "checks and deletes expired folders, assumption is the folder is already expired"
-        for sessions in self.get_expired_sessions():
+        expired = self.get_expired_sessions()
+        for sessions in expired:
             dir_name = str(sessions).split(":")[1]
 
-            dir_path = (
-                pathlib.Path(__file__).parent.absolute()
-                / "FILE_PLAYING_FIELD"
-                / dir_name
-            )
+            dir_path = SyncConfig.STAGING_DIR / dir_name
 
             if dir_path.is_dir():
                 shutil.rmtree(dir_path, ignore_errors=True)
@@ -120,46 +174,41 @@ class FileCleanerSchedule:
             self.redis_connection.delete(sessions)
         # now we scan the dirs and delete everything else that's not in the redis cache
 
-        other_folders = os.listdir(
-            pathlib.Path(__file__).parent.absolute() / "FILE_PLAYING_FIELD"
-        )
-        for folders in other_folders:
-            if folders not in self.all_sessions:
-                shutil.rmtree(folders, ignore_errors=True)
+        if not SyncConfig.STAGING_DIR.is_dir():
+            return
+        active = {
+            str(sessions).split(":")[1]
+            for sessions in self.all_sessions
+            if sessions not in expired
+        }
+        for folders in os.listdir(SyncConfig.STAGING_DIR):
+            if folders not in active:
+                shutil.rmtree(SyncConfig.STAGING_DIR / folders, ignore_errors=True)
 
 
 class FileListener(RedisController):
-    def __init__(self, user_id, session_id):
+    def __init__(self, user_id, session_id, session_folder):
         super().__init__(user_id)
         self.user_id = user_id
         self.session_id = session_id
+        self.session_folder = pathlib.Path(session_folder)
 
     def file_listener(self):
         """
-        The `file_listener` function reads files from a directory,
-        encodes them in base64, and stores them
-        in a dictionary before saving the dictionary to a Redis database.
+        The `file_listener` function reads the downloaded files listed in the
+        session summary and caches each one under its own Redis key.
         """
-        # self.path / str(self.session_id)
-        time.sleep(2)
-        files_index = open(f"{self.session_id}.internal.json", "r").read()
-        data = json.loads(files_index)
-        data = dict(data)
-        data = data.items()
-        dispatch_dict = {str(self.user_id): []}
-
-        for _ in data:
-            with open(_[0], "rb") as file_read_buffer:
-                file_read_buffer = file_read_buffer.read()
-            dispatch_dict[str(self.user_id)].append(
-                {
-                    str(_[0]): base64.encodebytes(file_read_buffer).decode(),
-                    "data": {
-                        "id": (str(_[1]["file_id"])),
-                        "size": (str(_[1]["file_size"])),
+        summary_path = self.session_folder / f"{self.session_id}.internal.json"
+        data = json.loads(summary_path.read_text())
+
+        for file_path, summary in data.items():
+            with open(file_path, "rb") as file_read_buffer:
+                self.set_file(
+                    summary["file_id"],
+                    file_read_buffer.read(),
+                    {
+                        "name": summary["file_name"],
+                        "size": summary["file_size"],
+                        "cid": summary["file_cid"],
                     },
-                }
-            )
-
-        dispatch_dict = str(dispatch_dict).replace("'", '"')
-        self.redis.set_files(dispatch_dict)
+                )
@@ -12,11 +12,24 @@ from ..users.user_handler_utils import get_db
 from ..users.user_models import User
 from .sync_service_main import sync_router
 from .sync_user_cache import FileSessionManager, FileListener, RedisController
+from ..storage_service.ipfs_schema import IpfsRecord
+from ..users.user_handler_utils import get_async_db
+from .sync_config import SyncConfig
+from .sync_journal import (
+    collapse_changes,
+    delete_records,
+    get_change_cursor_async,
+    get_changes_async,
+)
+from .utils.socket_connection import socket_manager
 from .sync_utils import (
     UserDataExtraction,
     get_collective_bytes,
+    get_collective_bytes_async,
+    get_file_count_async,
     get_user_cid,
     get_user_cids,
+    get_user_cids_page_async,
 )
 
 
@@ -34,35 +47,28 @@ async def fetch_specific(
 
     for item_id in item_ids:
         files = UserDataExtraction(user.id, db, [get_user_cid(user.id, db, item_id)])
-        files.download_file_ipfs()
-        files.write_file_summary()
-        files.cleanup()
+        await files.download_file_ipfs()
 
-        file_listener = FileListener(user.id, files.session_id)
+        file_listener = FileListener(user.id, files.session_id, files.new_folder)
         file_listener.file_listener()
+        files.cleanup()
 
     _redis = RedisController(str(user.id))
-    all_files = _redis.get_files()
+    files_to_return = [
+        item_id for item_id in item_ids if _redis.get_file_meta(item_id) is not None
+    ]
     _redis.close()
-    all_files = json.loads(all_files)
-    files_to_return = []
-    for name, _ in all_files:
-        file_index = (
-            db.query(DataStorage)
-            .filter(DataStorage.owner_id == user.id, DataStorage.file_name == name)
-            .first()
-        )
-        files_to_return.append(file_index.id)
 
     return {"status": 200, "files": files_to_return}
 
 
 @sync_router.get("/fetch/user_data")
-def get_user_data_length(user: User = Depends(get_current_user), db=Depends(get_db)):
+async def get_user_data_length(
+    user: User = Depends(get_current_user), db=Depends(get_async_db)
+):
     return {
-        "user_data_length": len(
-            db.query(DataStorage).filter(DataStorage.owner_id == user.id).all()
-        )
+        "user_data_length": await get_file_count_async(user.id, db),
+        "user_data_bytes": await get_collective_bytes_async(user.id, db),
     }
 
 
@@ -70,30 +76,67 @@ def get_user_data_length(user: User = Depends(get_current_user), db=Depends(get_
 async def delete(
     image_index: int, user: User = Depends(get_current_user), db=Depends(get_db)
 ):
-    db.query(DataStorage).filter(
-        DataStorage.owner_id == user.id, DataStorage.id == image_index
-    ).delete()
+    deleted = delete_records(db, user.id, DataStorage.id == image_index)
 
     _redis = RedisController(str(user.id))
-
-    all_files = _redis.get_files()
-    all_files = json.loads(all_files)
-
-    all_files.pop(image_index)
-    _redis.set_files(all_files)
+    _redis.delete_file(image_index)
     _redis.close()
     db.commit()
+    if deleted:
+        await socket_manager.publish_change(
+            user.id, "delete", [{"id": data_id} for data_id in deleted]
+        )
 
     return {"status": "deleted", "image_index": image_index}
 
 
 @sync_router.get("/all")
-def return_all(user: User = Depends(get_current_user), db=Depends(get_db)):
-    user_data = (
-        db.query(User).filter(User.id == user.id).all(),
-        db.query(DataStorage).filter(DataStorage.owner_id == user.id).all(),
-    )
+async def return_all(
+    cursor: int = 0,
+    limit: int = SyncConfig.LISTING_PAGE_SIZE,
+    user: User = Depends(get_current_user),
+    db=Depends(get_async_db),
+):
+    """
+    Lists the user's files a page at a time, pass back `next_cursor` as
+    `cursor` to continue; it is null once the listing is exhausted.
+    """
+    limit = max(1, min(limit, SyncConfig.LISTING_MAX_PAGE_SIZE))
+    page = await get_user_cids_page_async(user.id, db, after_id=cursor, limit=limit)
 
     return {
-        "user": user_data,
+        "user": {"id": str(user.id), "username": user.username, "email": user.email},
+        "files": [IpfsRecord.from_orm(record) for record in page],
+        "next_cursor": page[-1].id if len(page) == limit else None,
     }
+
+
+@sync_router.get("/changes")
+async def get_changes(
+    since: int = 0,
+    limit: int = SyncConfig.LISTING_PAGE_SIZE,
+    user: User = Depends(get_current_user),
+    db=Depends(get_async_db),
+):
+    """
+    Returns the files added and deleted after journal cursor `since`.
+
+    Pass the returned `cursor` back as `since` on the next call and keep going
+    while `has_more` is true. A fresh client should read /changes/cursor
+    before listing /all, then follow changes from that cursor.
+    """
+    limit = max(1, min(limit, SyncConfig.LISTING_MAX_PAGE_SIZE))
+    changes = await get_changes_async(db, user.id, since, limit)
+
+    return {
+        "changes": collapse_changes(changes),
+        "cursor": changes[-1].id if changes else since,
+        "has_more": len(changes) == limit,
+    }
+
+
+@sync_router.get("/changes/cursor")
+async def get_changes_cursor(
+    user: User = Depends(get_current_user), db=Depends(get_async_db)
+):
+    return {"cursor": await get_change_cursor_async(db, user.id)}
@@ -22,7 +22,15 @@ import time
 from uuid import uuid4
 from fastapi import HTTPException
 from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import func, select
+import zstandard as zstd
 from ..storage_service.ipfs_model import DataStorage
+from ..storage_service.misc_compression.dictionaries import record_dictionary
+from ..storage_service.misc_compression.misc_compression_utils import (
+    decompress_misc_file,
+)
+from .fetch_engine import IpfsFetchEngine
+from .sync_config import SyncConfig
 
 
 def get_user_cids(user_id, db) -> list:
@@ -47,95 +55,185 @@ def get_user_cid(user_id, db, item_id) -> list:
         raise HTTPException(status_code=500, detail="Internal Server Error") from e
 
 
+def get_user_cids_page(user_id, db, after_id: int = 0, limit: int = 100) -> list:
+    """
+    Returns up to `limit` of the user's records with ids above `after_id`.
+
+    Seeking on (owner_id, id) keeps every page an index range scan, however
+    deep into the listing the cursor is.
+    """
+    try:
+        return (
+            db.query(DataStorage)
+            .filter(DataStorage.owner_id == user_id, DataStorage.id > after_id)
+            .order_by(DataStorage.id)
+            .limit(limit)
+            .all()
+        )
+    except Exception as e:
+        logging.error(f"An Error occurred in get_user_cids_page: {e}")
+        raise HTTPException(status_code=500, detail="Internal Server Error") from e
+
+
 def get_collective_bytes(user_id, db):
     try:
-        query = db.query(DataStorage).filter(DataStorage.owner_id == user_id).all()
-        return sum(x.file_size for x in query)
+        return (
+            db.query(func.coalesce(func.sum(DataStorage.file_size), 0))
+            .filter(DataStorage.owner_id == user_id)
+            .scalar()
+        )
+    except Exception as e:
+        logging.error(e)
+        raise HTTPException(status_code=500, detail="Internal Server Error") from e
+
+
+def get_file_count(user_id, db) -> int:
+    try:
+        return (
+            db.query(func.count(DataStorage.id))
+            .filter(DataStorage.owner_id == user_id)
+            .scalar()
+        )
+    except Exception as e:
+        logging.error(e)
+        raise HTTPException(status_code=500, detail="Internal Server Error") from e
+
+
+async def get_user_cids_async(user_id, db) -> list:
+    try:
+        result = await db.execute(
+            select(DataStorage).filter(DataStorage.owner_id == user_id)
+        )
+        return result.scalars().all()
+    except Exception as e:
+        logging.error(f"An Error occurred in get_user_cids_async: {e}")
+        raise HTTPException(status_code=500, detail="Internal Server Error") from e
+
+
+async def get_user_cid_async(user_id, db, item_id):
+    try:
+        result = await db.execute(
+            select(DataStorage).filter(
+                DataStorage.owner_id == user_id, DataStorage.id == item_id
+            )
+        )
+        return result.scalars().first()
+    except Exception as e:
+        logging.error(e)
+        raise HTTPException(status_code=500, detail="Internal Server Error") from e
+
+
+async def get_user_cids_page_async(
+    user_id, db, after_id: int = 0, limit: int = 100
+) -> list:
+    try:
+        result = await db.execute(
+            select(DataStorage)
+            .filter(DataStorage.owner_id == user_id, DataStorage.id > after_id)
+            .order_by(DataStorage.id)
+            .limit(limit)
+        )
+        return result.scalars().all()
+    except Exception as e:
+        logging.error(f"An Error occurred in get_user_cids_page_async: {e}")
+        raise HTTPException(status_code=500, detail="Internal Server Error") from e
+
+
+async def get_file_count_async(user_id, db) -> int:
+    try:
+        result = await db.execute(
+            select(func.count(DataStorage.id)).filter(DataStorage.owner_id == user_id)
+        )
+        return result.scalar_one()
+    except Exception as e:
+        logging.error(e)
+        raise HTTPException(status_code=500, detail="Internal Server Error") from e
+
+
+async def get_collective_bytes_async(user_id, db):
+    try:
+        result = await db.execute(
+            select(func.coalesce(func.sum(DataStorage.file_size), 0)).filter(
+                DataStorage.owner_id == user_id
+            )
+        )
+        return result.scalar_one()
     except Exception as e:
         logging.error(e)
         raise HTTPException(status_code=500, detail="Internal Server Error") from e
 
 
 class UserDataExtraction:
-    def __init__(self, user_id, db, cids: list):
+    """
+    One sync session's downloads.
+
+    Everything happens under the session's own absolute folder and nothing
+    touches the process working directory, so any number of sessions can run
+    concurrently in one worker.
+    """
+
+    def __init__(self, user_id, db, cids: list, staging_dir=SyncConfig.STAGING_DIR):
         self.user_id = user_id
         self.session_id = uuid4()
         self.db = db
-        self.user_data = get_user_cids(self.user_id, self.db)
-        self.file_bytes = []
         self.cids = cids
+        self.failed = []
 
-        self.new_folder = os.path.abspath(
-            os.path.join(
-                os.path.dirname(__file__), f"FILE_PLAYING_FIELD/{self.session_id}"
-            )
-        )
-        self.ipfs_path = os.path.abspath(
-            os.path.join(os.path.dirname(__file__), "utils/ipfs")
-        )
+        self.new_folder = pathlib.Path(staging_dir).absolute() / str(self.session_id)
+        self.summary_path = self.new_folder / f"{self.session_id}.internal.json"
 
-    async def download_file(self, cid):
-        try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(
-                    f"{self.ipfs_path}/get/{cid.file_cid}"
-                ) as response:
-                    with open(cid.file_name, "wb") as f:
-                        f.write(await response.read())
-        except Exception as e:
-            logging.error(f"Error downloading file {cid.file_name}: {e}")
-            raise
+    def local_path(self, cid) -> pathlib.Path:
+        # prefixed with the record id, users can hold several files of one name
+        return self.new_folder / f"{cid.id}_{pathlib.Path(cid.file_name).name}"
 
     async def download_files_async(self):
-        async def download_file_async(cid):
+        targets = [(cid, self.local_path(cid)) for cid in self.cids]
+        async with IpfsFetchEngine() as engine:
+            results = await engine.fetch_all(targets)
+        await self.decompress_files(results)
+
+        self.failed = [result for result in results if not result.ok]
+        for result in self.failed:
+            logging.error(
+                f"Error downloading file {result.record.file_name} "
+                f"after {result.attempts} attempts: {result.error}"
+            )
+        # only what arrived intact is summarised and handed to the cache
+        self.cids = [result.record for result in results if result.ok]
+
+    async def decompress_files(self, results) -> None:
+        """Turns downloaded /compress/misc frames back into the original files."""
+        for result in results:
+            if not result.ok or result.record.compression is None:
+                continue
             try:
-                await self.download_file(cid)
-            except Exception as e:
-                logging.error(f"Error downloading file {cid.file_name}: {e}")
-                raise
-
-        await asyncio.gather(*(download_file_async(cid) for cid in self.cids))
+                dictionary = record_dictionary(self.db, result.record)
+                await asyncio.to_thread(decompress_misc_file, result.path, dictionary)
+            except (zstd.ZstdError, ValueError) as e:
+                result.error = str(e) or e.__class__.__name__
 
     async def download_file_ipfs(self):
-        os.mkdir(self.new_folder)
-        os.chdir(self.new_folder)
+        self.new_folder.mkdir(parents=True)
 
         await self.download_files_async()
 
         self.write_file_summary()
 
-        while not self.insurance():
-            await asyncio.sleep(5)
-
     def write_file_summary(self):
         with contextlib.suppress(PermissionError):
             file_sum = {
-                cid.file_name: {
-                    "file_name": cid.file_name,
+                str(self.local_path(cid)): {
+                    "file_name": cid.download_name,
                     "file_cid": cid.file_cid,
-                    "file_size": cid.file_size,
+                    # what was written, decompressed records outgrow file_size
+                    "file_size": self.local_path(cid).stat().st_size,
                     "file_id": cid.id,
                 }
                 for cid in self.cids
             }
-            with open(f"{self.session_id}.internal.json", "w") as f:
+            with open(self.summary_path, "w") as f:
                 json.dump(file_sum, f)
 
-    def insurance(self) -> bool:
-        for cid in self.cids:
-            if not os.path.isfile(f"{cid.file_name}"):
-                return False
-            _bytes = open(cid.file_name, "rb")
-            if len(_bytes.read()) != cid.file_size:
-                return False
-            del _bytes
-        return True
-
     def cleanup(self):
-        with contextlib.suppress(PermissionError):
-            os.chdir(pathlib.Path(self.new_folder).parent)
-
-            shutil.rmtree(
-                pathlib.Path(self.new_folder),
-                ignore_errors=False,
-            )
+        with contextlib.suppress(PermissionError, FileNotFoundError):
+            shutil.rmtree(self.new_folder, ignore_errors=False)
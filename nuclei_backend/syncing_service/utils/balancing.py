@@ -0,0 +1,48 @@
+from __future__ import annotations
+
+import heapq
+from dataclasses import dataclass
+from typing import Sequence
+
+import numpy as np
+
+
+@dataclass
+class Assignment:
+    """Which items each worker gets, as indices into the original sizes."""
+
+    bins: list[np.ndarray]
+    loads: np.ndarray
+
+    @property
+    def makespan(self) -> int:
+        return int(self.loads.max()) if self.loads.size else 0
+
+
+def assign_lpt(sizes: Sequence[int], workers: int) -> Assignment:
+    """
+    Spreads items over `workers` to keep the busiest worker's total small.
+
+    Greedy longest processing time first: items are taken largest first and
+    each goes to the worker with the least assigned so far, which is within
+    4/3 of the best possible makespan. Each worker's items stay largest first.
+    Any item count works, including fewer items than workers.
+    """
+    if workers < 1:
+        raise ValueError("workers must be at least 1")
+    sizes = np.asarray(sizes, dtype=np.int64)
+    order = np.argsort(-sizes, kind="stable")
+    owner = np.empty(sizes.size, dtype=np.int64)
+    loads = np.zeros(workers, dtype=np.int64)
+
+    heap = [(0, worker) for worker in range(workers)]
+    for index in order:
+        load, worker = heap[0]
+        owner[index] = worker
+        heapq.heapreplace(heap, (load + int(sizes[index]), worker))
+    np.add.at(loads, owner, sizes)
+
+    # a stable sort on owner keeps each worker's items in largest first order
+    by_owner = order[np.argsort(owner[order], kind="stable")]
+    counts = np.bincount(owner, minlength=workers)
+    return Assignment(bins=np.split(by_owner, np.cumsum(counts)[:-1]), loads=loads)
@@ -1,28 +1,31 @@
-import math
-import random
+import numpy as np
 
-from quick_sort import quick_sort
-
-bytes_example = [random.randint(1024**3, 5000**3) for _ in range(10)]
+from .balancing import Assignment, assign_lpt
 
 
 class BytePairing:
     def __init__(self, _bytes: list[int]) -> None:
-        self._bytes = _bytes
+        self._bytes = np.asarray(_bytes, dtype=np.int64)
 
     def divider(self) -> dict[str, list]:
-        self._bytes = quick_sort(self._bytes)
-        self.mid_point = math.ceil(len(self._bytes) / 2)
-        bigger_half, smaller_half = list(self._bytes[self.mid_point :]), list(
-            self._bytes[: self.mid_point]
-        )
-
-        return {"smaller_half": smaller_half, "bigger_half": bigger_half[::-1]}
+        ordered = np.sort(self._bytes)
+        self.mid_point = (len(ordered) + 1) // 2
+        return {
+            "smaller_half": ordered[: self.mid_point].tolist(),
+            "bigger_half": ordered[self.mid_point :][::-1].tolist(),
+        }
 
-    def parallelize(self):
+    def parallelize(self) -> list[int]:
+        """
+        Orders the sizes smallest, largest, second smallest, second largest...
+        With an odd count the middle size comes last.
+        """
         self.byte_dict = self.divider()
-        self.new_arr = []
-        for _ in range(self.mid_point):
-            self.new_arr.append(self.byte_dict["smaller_half"][_])
-            self.new_arr.append(self.byte_dict["bigger_half"][_])
-        return self.new_arr
+        paired = np.empty(len(self._bytes), dtype=np.int64)
+        paired[0::2] = self.byte_dict["smaller_half"]
+        paired[1::2] = self.byte_dict["bigger_half"]
+        return paired.tolist()
+
+    def assign(self, workers: int) -> Assignment:
+        """Splits the sizes over `workers` transfer workers, see assign_lpt."""
+        return assign_lpt(self._bytes, workers)
@@ -1,14 +1,44 @@
+import logging
+
 import socketio
 from fastapi import FastAPI
+from jose import JWTError, jwt
+
+from ...database import AsyncSessionLocal
+from ...users.Config import UsersConfig
+from ...users.user_cache import user_cache
+from ...users.user_handler_utils import get_user_by_username_async
+from ..sync_config import SyncConfig
+
+logger = logging.getLogger(__name__)
 
 
 class SocketManager:
-    def __init__(self) -> None:
+    """
+    socket.io server pushing sync changes to connected clients.
+
+    Clients connect with `auth={"token": <bearer token>}` and join a room
+    named after their user id. The client manager relays every emit through
+    Redis pub/sub, so an event raised on one uvicorn worker reaches sockets
+    held by any other.
+    """
+
+    CHANGE_EVENT = "sync:change"
+
+    def __init__(self, redis_url: str = SyncConfig.REDIS_URL) -> None:
+        self.redis_url = redis_url
         self.server = socketio.AsyncServer(
+            async_mode="asgi",
+            client_manager=socketio.AsyncRedisManager(
+                redis_url, channel=SyncConfig.SOCKET_CHANNEL
+            ),
+            cors_allowed_origins="*",
             async_handlers=True,
             logger=True,
         )
         self.app = socketio.ASGIApp(self.server)
+        self._external = None
+        self.server.on("connect", self.authenticate)
 
     @property
     def on(self):
@@ -23,3 +53,70 @@ class SocketManager:
 
     def send_files(self, sid, files):
         self.send(sid, files)
+
+    async def authenticate(self, sid, environ, auth=None):
+        token = (auth or {}).get("token")
+        if not token:
+            return False
+        try:
+            payload = jwt.decode(
+                token, UsersConfig.SECRET_KEY, algorithms=[UsersConfig.ALGORITHM]
+            )
+        except JWTError:
+            return False
+        username = payload.get("sub")
+        if username is None:
+            return False
+        if (user := user_cache.get(username)) is None:
+            async with AsyncSessionLocal() as db:
+                user = await get_user_by_username_async(db, username=username)
+            if not user:
+                return False
+            user_cache.set(user)
+        # a deactivated account's token may not have expired yet
+        if not user.is_active:
+            return False
+        await self.server.enter_room(sid, str(user.id))
+
+    async def publish_change(self, user_id, operation: str, files: list[dict]):
+        """Tells every socket of `user_id` that files were added or deleted."""
+        try:
+            await self.server.emit(
+                self.CHANGE_EVENT,
+                {"operation": operation, "files": files},
+                room=str(user_id),
+            )
+        except Exception as e:
+            logger.warning(f"could not publish sync change for {user_id}: {e}")
+
+    def publish_change_sync(self, user_id, operation: str, files: list[dict]):
+        """publish_change for threads and sync routes, straight onto Redis."""
+        if self._external is None:
+            self._external = socketio.RedisManager(
+                self.redis_url, channel=SyncConfig.SOCKET_CHANNEL, write_only=True
+            )
+        try:
+            self._external.emit(
+                self.CHANGE_EVENT,
+                {"operation": operation, "files": files},
+                room=str(user_id),
+                namespace="/",
+            )
+        except Exception as e:
+            logger.warning(f"could not publish sync change for {user_id}: {e}")
+
+
+def change_entry(record, data: bytes | None = None) -> dict:
+    """Event payload for one DataStorage record, inlining small file bodies."""
+    entry = {
+        "id": record.id,
+        "file_name": record.download_name,
+        "file_cid": record.file_cid,
+        "file_size": record.file_size,
+    }
+    if data is not None and len(data) <= SyncConfig.SOCKET_INLINE_MAX_BYTES:
+        entry["data"] = bytes(data)
+    return entry
+
+
+socket_manager = SocketManager()
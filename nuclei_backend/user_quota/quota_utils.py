@@ -1,3 +1,5 @@
+from sqlalchemy import select
+
 from .quota_models import UserQuota
 import datetime
 
@@ -28,17 +30,52 @@ def increase_quota(user_id, db, increase_amount, files_being_committed):
 def decrease_quota(user_id, db, decrease_amount, files_being_deleted):
     current_quota = get_current_quota(user_id, db)
 
-    decreasing_query = UserQuota(
-        user_quota=current_quota.user_quota - decrease_amount,
-        last_update=str(datetime.datetime.now()),
-        amount_of_files=current_quota.amount_of_files - files_being_deleted,
-        owner_id=user_id,
-    )
-
-    db.add(decreasing_query)
+    current_quota.user_quota = current_quota.user_quota - decrease_amount
+    current_quota.last_update = str(datetime.datetime.now())
+    current_quota.amount_of_files = current_quota.amount_of_files - files_being_deleted
     db.commit()
 
 
 def get_current_quota(user_id, db):
     query = db.query(UserQuota).filter(UserQuota.owner_id == user_id).first()
     return query
+
+
+# AsyncSession variants for routes on get_async_db; asyncpg wants a real
+# datetime for last_update, not the string the sync helpers store
+
+
+async def initialise_quota_async(user_id, db):
+    quota_init = UserQuota(
+        user_quota=0,
+        last_update=datetime.datetime.now(),
+        amount_of_files=0,
+        owner_id=user_id,
+    )
+    db.add(quota_init)
+    await db.commit()
+
+
+async def increase_quota_async(user_id, db, increase_amount, files_being_committed):
+    current_quota = await get_current_quota_async(user_id, db)
+
+    current_quota.user_quota = current_quota.user_quota + increase_amount
+    current_quota.last_update = datetime.datetime.now()
+    current_quota.amount_of_files = (
+        current_quota.amount_of_files + files_being_committed
+    )
+    await db.commit()
+
+
+async def decrease_quota_async(user_id, db, decrease_amount, files_being_deleted):
+    current_quota = await get_current_quota_async(user_id, db)
+
+    current_quota.user_quota = current_quota.user_quota - decrease_amount
+    current_quota.last_update = datetime.datetime.now()
+    current_quota.amount_of_files = current_quota.amount_of_files - files_being_deleted
+    await db.commit()
+
+
+async def get_current_quota_async(user_id, db):
+    result = await db.execute(select(UserQuota).filter(UserQuota.owner_id == user_id))
+    return result.scalars().first()
@@ -1,5 +1,6 @@
 # It's a class that contains constants.
 # Importing the routes from the auth_routes and user_handler files.
+import os
 from typing import Final
 
 
@@ -9,3 +10,24 @@ class UsersConfig(object):
     )
     ALGORITHM: Final = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: Final = 30
+
+    # usernames allowed on cross-tenant endpoints, comma separated
+    ADMIN_USERNAMES: Final = frozenset(
+        name.strip()
+        for name in os.environ.get("ADMIN_USERNAMES", "").split(",")
+        if name.strip()
+    )
+
+    # authenticated users are cached by token subject for this long
+    USER_CACHE_TTL_SECONDS: Final = float(os.environ.get("USER_CACHE_TTL_SECONDS", 30))
+    USER_CACHE_MAX_SIZE: Final = int(os.environ.get("USER_CACHE_MAX_SIZE", 10_000))
+    # optional, shares cached users between workers when set
+    USER_CACHE_REDIS_URL: Final = os.environ.get("USER_CACHE_REDIS_URL")
+
+    # password KDF work runs on its own bounded executor, off the event loop
+    PASSWORD_WORKERS: Final = int(os.environ.get("PASSWORD_WORKERS", 4))
+    PASSWORD_USE_PROCESSES: Final = os.environ.get(
+        "PASSWORD_USE_PROCESSES", "false"
+    ).lower() in ("1", "true", "yes")
+    # requests waiting for a KDF slot beyond this are refused with a 503, 0 = no cap
+    PASSWORD_MAX_QUEUE: Final = int(os.environ.get("PASSWORD_MAX_QUEUE", 0))
@@ -6,7 +6,13 @@ from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from nuclei_backend.users import user_handler_utils
 from jose import JWTError, jwt
 
-from .auth_utils import authenticate_user, create_access_token, get_current_user
+from .auth_utils import (
+    authenticate_user,
+    authenticate_user_async,
+    create_access_token,
+    get_current_admin,
+    get_current_user,
+)
 from .main import users_router
 from .user_models import User, AuthData
 from .Config import UsersConfig
@@ -21,13 +27,15 @@ from io import BytesIO
 
 
 @users_router.post("/register")
-def create_user(
+async def create_user(
     user: user_handler_utils.user_schemas.UserCreate = Depends(),
-    db: user_handler_utils.Session = Depends(user_handler_utils.get_db),
+    db: user_handler_utils.AsyncSession = Depends(user_handler_utils.get_async_db),
 ):
     print(user)
 
-    if db_user := user_handler_utils.get_user_by_username(db, username=user.username):
+    if db_user := await user_handler_utils.get_user_by_username_async(
+        db, username=user.username
+    ):
         return {
             "status_code": 400,
             "detail": "User with this email already exists",
@@ -35,9 +43,9 @@ def create_user(
         }
 
     try:
-        db_user = user_handler_utils.create_user(db=db, user=user)
+        db_user = await user_handler_utils.create_user_async(db=db, user=user)
         otp_secret_key = pyotp.random_base32()
-        user_handler_utils.create_auth_data(
+        await user_handler_utils.create_auth_data_async(
             db=db, user_id=db_user.id, otp_secret_key=otp_secret_key
         )
 
@@ -47,11 +55,11 @@ def create_user(
 
 
 @users_router.post("/token")
-def login_for_access_token(
+async def login_for_access_token(
     form_data: OAuth2PasswordRequestForm = Depends(),
-    db=Depends(user_handler_utils.get_db),
+    db=Depends(user_handler_utils.get_async_db),
 ):
-    user = authenticate_user(
+    user = await authenticate_user_async(
         username=form_data.username,
         password=form_data.password,
         db=db,
@@ -107,3 +115,14 @@ def login_for_access_token(
         return {"error": e, "status": 500}
 
     return {"access_token": access_token, "token_type": "bearer", "status": 200}
+
+
+@users_router.get("/kdf/stats")
+async def password_kdf_stats(current_user: User = Depends(get_current_admin)):
+    # queue depth and timings would help time or load probe logins, admins only
+    return user_handler_utils.password_hasher.stats()
+
+
+@users_router.on_event("shutdown")
+def shutdown_password_hasher():
+    user_handler_utils.password_hasher.shutdown()
@@ -19,7 +19,8 @@ from fastapi import Request
 
 from nuclei_backend.users import user_handler_utils
 
-from .user_handler_utils import get_user_by_username
+from .user_cache import user_cache
+from .user_handler_utils import get_user_by_username, get_user_by_username_async
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/users/token")
 
@@ -107,9 +108,26 @@ def authenticate_user(
         return False
 
 
+async def authenticate_user_async(
+    username: str,
+    password: str,
+    db: user_handler_utils.AsyncSession,
+):
+    if user := await get_user_by_username_async(db, username=username):
+        return (
+            user
+            if await user_handler_utils.verify_password_async(
+                password, user.hashed_password
+            )
+            else False
+        )
+    else:
+        return False
+
+
 async def get_current_user(
     token: str = Depends(oauth2_scheme),
-    db: user_handler_utils.Session = Depends(user_handler_utils.get_db),
+    db: user_handler_utils.AsyncSession = Depends(user_handler_utils.get_async_db),
 ):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -126,7 +144,19 @@ async def get_current_user(
         token_data = TokenData(username=username)
     except JWTError as e:
         raise credentials_exception from e
-    user = get_user_by_username(db, username=token_data.username)
-    if user is None:
+    if (user := user_cache.get(token_data.username)) is not None:
+        return user
+    user = await get_user_by_username_async(db, username=token_data.username)
+    if not user:
         raise credentials_exception
+    user_cache.set(user)
+    return user
+
+
+async def get_current_admin(user=Depends(get_current_user)):
+    """get_current_user, limited to the accounts in ADMIN_USERNAMES."""
+    if user.username not in UsersConfig.ADMIN_USERNAMES or not user.is_active:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN, detail="Admin access required"
+        )
     return user
@@ -0,0 +1,108 @@
+import asyncio
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+
+from fastapi import HTTPException, status
+from passlib.context import CryptContext
+
+from .Config import UsersConfig
+
+password_context = CryptContext(schemes=["pbkdf2_sha256"], deprecated="auto")
+
+
+def hash_password(password):
+    return password_context.hash(password)
+
+
+def verify_password(raw_password, hashed_password):
+    return password_context.verify(raw_password, hashed_password)
+
+
+class PasswordHasher:
+    """
+    Runs pbkdf2 hashing and verification on a dedicated executor.
+
+    At most `workers` KDF calls run at once; further callers wait on a
+    semaphore (that wait is the queue depth reported by `stats`) and, when
+    `max_queue` is set, are turned away with a 503 instead of piling up.
+    """
+
+    def __init__(
+        self,
+        workers: int = UsersConfig.PASSWORD_WORKERS,
+        use_processes: bool = UsersConfig.PASSWORD_USE_PROCESSES,
+        max_queue: int = UsersConfig.PASSWORD_MAX_QUEUE,
+    ):
+        self.workers = workers
+        self.use_processes = use_processes
+        self.max_queue = max_queue
+        self._executor: Executor | None = None
+        self._slots = asyncio.Semaphore(workers)
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.rejected = 0
+        self.total_seconds = 0.0
+
+    @property
+    def executor(self) -> Executor:
+        if self._executor is None:
+            self._executor = (
+                ProcessPoolExecutor(max_workers=self.workers)
+                if self.use_processes
+                else ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix="password-kdf"
+                )
+            )
+        return self._executor
+
+    async def _run(self, func, *args):
+        if self.max_queue and self.queued >= self.max_queue:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Too many concurrent logins, try again shortly",
+            )
+        self.queued += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.queued -= 1
+        self.running += 1
+        start = time.perf_counter()
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, func, *args)
+        finally:
+            self.running -= 1
+            self._slots.release()
+            self.completed += 1
+            self.total_seconds += time.perf_counter() - start
+
+    async def hash(self, password: str) -> str:
+        return await self._run(hash_password, password)
+
+    async def verify(self, raw_password: str, hashed_password: str) -> bool:
+        return await self._run(verify_password, raw_password, hashed_password)
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "processes": self.use_processes,
+            "running": self.running,
+            "queued": self.queued,
+            "max_queue": self.max_queue,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "avg_ms": round(self.total_seconds / self.completed * 1000, 3)
+            if self.completed
+            else 0.0,
+        }
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+
+password_hasher = PasswordHasher()
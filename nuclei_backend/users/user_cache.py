@@ -0,0 +1,157 @@
+import json
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import redis
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import make_transient_to_detached
+
+from .Config import UsersConfig
+from .user_models import User
+
+logger = logging.getLogger(__name__)
+
+
+class UserCache:
+    """
+    Short lived cache of authenticated users keyed by token subject.
+
+    Entries are dicts of the FIELDS authenticated routes read, never the
+    password hash, and every hit builds a fresh detached `User` so
+    concurrent requests never share an ORM instance. When a Redis URL is
+    configured Redis is the only layer, so an invalidation from any worker
+    is seen by all of them. Without one each process keeps its own LRU and
+    other workers may serve a changed user until the TTL runs out.
+    """
+
+    FIELDS = ("id", "email", "username", "is_active")
+
+    def __init__(
+        self,
+        ttl: float = UsersConfig.USER_CACHE_TTL_SECONDS,
+        maxsize: int = UsersConfig.USER_CACHE_MAX_SIZE,
+        redis_url: str | None = UsersConfig.USER_CACHE_REDIS_URL,
+    ):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._entries: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._redis = (
+            redis.Redis.from_url(redis_url, decode_responses=True)
+            if redis_url
+            else None
+        )
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(username: str) -> str:
+        return f"user_cache:{username}"
+
+    @classmethod
+    def _columns(cls, user: User) -> dict:
+        return {field: getattr(user, field) for field in cls.FIELDS}
+
+    @staticmethod
+    def _build(columns: dict) -> User:
+        user = User(**columns)
+        make_transient_to_detached(user)
+        return user
+
+    def get(self, username: str) -> User | None:
+        if self._redis is not None:
+            columns = self._get_shared(username)
+            with self._lock:
+                if columns is None:
+                    self.misses += 1
+                    return None
+                self.hits += 1
+            return self._build(columns)
+
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(username)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(username)
+                self.hits += 1
+                return self._build(entry[1])
+            if entry is not None:
+                del self._entries[username]
+
+            self.misses += 1
+        return None
+
+    def set(self, user: User) -> None:
+        columns = self._columns(user)
+        if self._redis is None:
+            self._store_local(user.username, columns)
+            return
+        payload = dict(columns, id=str(columns["id"]))
+        try:
+            self._redis.set(
+                self._key(user.username),
+                json.dumps(payload),
+                px=max(int(self.ttl * 1000), 1),
+            )
+        except redis.RedisError as e:
+            logger.warning(f"user cache write failed: {e}")
+
+    def invalidate(self, username: str) -> None:
+        with self._lock:
+            self._entries.pop(username, None)
+        if self._redis is not None:
+            try:
+                self._redis.delete(self._key(username))
+            except redis.RedisError as e:
+                logger.warning(f"user cache invalidation failed: {e}")
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "shared": self._redis is not None,
+            }
+
+    def _store_local(self, username: str, columns: dict) -> None:
+        with self._lock:
+            self._entries[username] = (time.monotonic() + self.ttl, columns)
+            self._entries.move_to_end(username)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def _get_shared(self, username: str) -> dict | None:
+        if self._redis is None:
+            return None
+        try:
+            payload = self._redis.get(self._key(username))
+        except redis.RedisError as e:
+            logger.warning(f"user cache read failed: {e}")
+            return None
+        if payload is None:
+            return None
+        stored = json.loads(payload)
+        # entries written by older versions may carry more than FIELDS
+        columns = {field: stored.get(field) for field in self.FIELDS}
+        columns["id"] = uuid.UUID(columns["id"])
+        return columns
+
+
+user_cache = UserCache()
+
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _invalidate_changed_user(mapper, connection, target):
+    # a renamed user must also drop the entry under the old subject
+    renamed_from = inspect(target).attrs.username.history.deleted
+    for username in {target.username, *renamed_from}:
+        user_cache.invalidate(username)
@@ -2,13 +2,19 @@ from email.utils import parseaddr
 from uuid import UUID
 
 from fastapi import HTTPException
-from passlib.context import CryptContext
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
-from ..database import SessionLocal
+from ..database import AsyncSessionLocal, SessionLocal
 from . import user_models, user_schemas
-
-password_context = CryptContext(schemes=["pbkdf2_sha256"], deprecated="auto")
+from .password_hashing import (  # noqa: F401
+    hash_password,
+    password_context,
+    password_hasher,
+    verify_password,
+)
+from .user_cache import user_cache
 
 
 def get_user(db: Session, user_id: int):
@@ -23,12 +29,28 @@ def get_user_by_username(db: Session, username: str):
     return False
 
 
-def hash_password(password):
-    return password_context.hash(password)
+async def get_user_async(db: AsyncSession, user_id):
+    result = await db.execute(
+        select(user_models.User).filter(user_models.User.id == user_id)
+    )
+    return result.scalars().first()
+
+
+async def get_user_by_username_async(db: AsyncSession, username: str):
+    result = await db.execute(
+        select(user_models.User).filter(user_models.User.username == username)
+    )
+    if check_records := result.scalars().first():
+        return check_records
+    return False
+
 
+async def hash_password_async(password):
+    return await password_hasher.hash(password)
 
-def verify_password(raw_password, hashed_password):
-    return password_context.verify(raw_password, hashed_password)
+
+async def verify_password_async(raw_password, hashed_password):
+    return await password_hasher.verify(raw_password, hashed_password)
 
 
 def get_users(db: Session, skip: int = 0, limit: int = 100):
@@ -53,6 +75,25 @@ def create_user(db: Session, user: user_schemas.UserCreate):
     db.add(db_user)
     db.commit()
     db.refresh(db_user)
+    user_cache.invalidate(db_user.username)
+    return db_user
+
+
+async def create_user_async(db: AsyncSession, user: user_schemas.UserCreate):
+    email: str = check_email(user.email)
+    if await get_user_by_username_async(db, user.username):
+        raise HTTPException(
+            status_code=400, detail="User with this username already exists"
+        )
+
+    hashed_password: str = await hash_password_async(user.password)
+    db_user = user_models.User(
+        email=email, hashed_password=hashed_password, username=user.username
+    )
+    db.add(db_user)
+    await db.commit()
+    await db.refresh(db_user)
+    user_cache.invalidate(db_user.username)
     return db_user
 
 
@@ -64,9 +105,22 @@ def create_auth_data(db: Session, user_id: str, otp_secret_key: str):
     return auth_data
 
 
+async def create_auth_data_async(db: AsyncSession, user_id: str, otp_secret_key: str):
+    auth_data = user_models.AuthData(otp_secret_key=otp_secret_key, user_id=user_id)
+    db.add(auth_data)
+    await db.commit()
+    await db.refresh(auth_data)
+    return auth_data
+
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
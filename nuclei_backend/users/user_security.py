@@ -132,7 +132,7 @@ def setup_otp(
     otp_secret_key = totp.secret
 
     # Save the OTP secret key for the user
-    auth_data = AuthData(otp_secret_key=otp_secret_key, user=current_user)
+    auth_data = AuthData(otp_secret_key=otp_secret_key, user_id=current_user.id)
     db.add(auth_data)
     db.commit()
     db.refresh(auth_data)
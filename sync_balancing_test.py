@@ -0,0 +1,76 @@
+import itertools
+import random
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+try:
+    # importing the package builds the app, which needs its database up
+    from nuclei_backend.syncing_service.utils.balancing import assign_lpt
+    from nuclei_backend.syncing_service.utils.bytes_utils import BytePairing
+except Exception as e:  # noqa: BLE001
+    pytest.skip(f"nuclei_backend not importable here: {e}", allow_module_level=True)
+
+
+def sizes_of(count: int) -> list[int]:
+    rng = random.Random(count)
+    return [rng.randint(1, 10_000) for _ in range(count)]
+
+
+def optimal_makespan(sizes: list[int], workers: int) -> int:
+    best = sum(sizes)
+    for owners in itertools.product(range(workers), repeat=len(sizes)):
+        loads = [0] * workers
+        for size, owner in zip(sizes, owners):
+            loads[owner] += size
+        best = min(best, max(loads))
+    return best
+
+
+@pytest.mark.parametrize("count", [0, 1, 7, 100])
+@pytest.mark.parametrize("workers", [1, 3, 4, 8])
+def test_assign_lpt_assigns_every_item_once(count, workers):
+    sizes = sizes_of(count)
+    plan = assign_lpt(sizes, workers)
+
+    assert len(plan.bins) == workers
+    assigned = sorted(int(index) for indices in plan.bins for index in indices)
+    assert assigned == list(range(count))
+    for indices, load in zip(plan.bins, plan.loads):
+        assert int(load) == sum(sizes[index] for index in indices)
+        # each worker starts on its largest file
+        assert [sizes[i] for i in indices] == sorted(
+            (sizes[i] for i in indices), reverse=True
+        )
+
+    # no worker carries more than an even share plus one file
+    if count:
+        assert plan.makespan <= sum(sizes) / workers + max(sizes)
+    else:
+        assert plan.makespan == 0
+
+
+@pytest.mark.parametrize("workers", [2, 3])
+def test_assign_lpt_stays_within_four_thirds_of_optimal(workers):
+    sizes = sizes_of(7)
+    assert assign_lpt(sizes, workers).makespan <= 4 / 3 * optimal_makespan(
+        sizes, workers
+    )
+
+
+def test_assign_lpt_needs_a_worker():
+    with pytest.raises(ValueError):
+        assign_lpt([1, 2, 3], 0)
+
+
+@pytest.mark.parametrize("count", [0, 1, 7, 100])
+def test_parallelize_keeps_every_size(count):
+    sizes = sizes_of(count)
+    paired = BytePairing(sizes).parallelize()
+
+    assert sorted(paired) == sorted(sizes)
+    ordered = sorted(sizes)
+    half = (count + 1) // 2
+    assert paired[0::2] == ordered[:half]
+    assert paired[1::2] == ordered[half:][::-1]
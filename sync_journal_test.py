@@ -0,0 +1,80 @@
+import threading
+import uuid
+
+import pytest
+
+try:
+    # importing the package builds the app, which needs its database up
+    from nuclei_backend.database import SessionLocal, engine
+    from nuclei_backend.storage_service.ipfs_model import DataChange, DataStorage
+    from nuclei_backend.syncing_service.sync_journal import get_change_cursor
+    from nuclei_backend.users.user_models import User
+
+    with engine.connect():
+        pass
+except Exception as e:  # noqa: BLE001
+    pytest.skip(f"no database to run against here: {e}", allow_module_level=True)
+
+
+def record(owner_id, name: str) -> DataStorage:
+    return DataStorage(
+        file_name=name, file_cid=f"cid-{name}", file_size=1, owner_id=owner_id
+    )
+
+
+@pytest.fixture
+def owner_id():
+    owner_id = uuid.uuid4()
+    with SessionLocal() as db:
+        db.add(
+            User(
+                id=owner_id,
+                username=f"journal-{owner_id}",
+                email=f"journal-{owner_id}@example.com",
+                hashed_password="-",
+            )
+        )
+        db.commit()
+    yield owner_id
+    with SessionLocal() as db:
+        db.query(DataChange).filter(DataChange.owner_id == owner_id).delete()
+        db.query(DataStorage).filter(DataStorage.owner_id == owner_id).delete()
+        db.query(User).filter(User.id == owner_id).delete()
+        db.commit()
+
+
+def test_cursor_never_passes_a_change_that_commits_later(owner_id):
+    # the first writer takes its journal id and holds its transaction open
+    first = SessionLocal()
+    first.add(record(owner_id, "first"))
+    first.flush()
+
+    second_done = threading.Event()
+
+    def second():
+        with SessionLocal() as db:
+            db.add(record(owner_id, "second"))
+            db.commit()
+        second_done.set()
+
+    writer = threading.Thread(target=second)
+    writer.start()
+    try:
+        # without the journal lock the second writer takes the next id and
+        # commits first, and the cursor read below jumps past "first"
+        assert not second_done.wait(0.5)
+        with SessionLocal() as reader:
+            cursor = get_change_cursor(reader, owner_id)
+        first.commit()
+    finally:
+        first.close()
+        writer.join(10)
+
+    with SessionLocal() as reader:
+        seen = {
+            change.file_name
+            for change in reader.query(DataChange).filter(
+                DataChange.owner_id == owner_id, DataChange.id > cursor
+            )
+        }
+    assert seen == {"first", "second"}
@@ -0,0 +1,193 @@
+import asyncio
+import contextlib
+import functools
+import hashlib
+import json
+import os
+import random
+from types import SimpleNamespace
+
+import pytest
+
+aiohttp = pytest.importorskip("aiohttp")
+zstd = pytest.importorskip("zstandard")
+from aiohttp import web  # noqa: E402
+from aiohttp.test_utils import TestServer  # noqa: E402
+
+try:
+    # importing the package builds the app, which needs its database up
+    from nuclei_backend.syncing_service import sync_stream, sync_utils
+    from nuclei_backend.syncing_service.fetch_engine import IpfsFetchEngine
+except Exception as e:  # noqa: BLE001
+    pytest.skip(f"nuclei_backend not importable here: {e}", allow_module_level=True)
+
+SESSIONS = 8
+FILES_PER_SESSION = 5
+
+
+def make_records(session: int) -> tuple[list, dict]:
+    records, blobs = [], {}
+    for index in range(FILES_PER_SESSION):
+        data = os.urandom(random.randint(1, 64 * 1024))
+        cid = f"cid-{session}-{index}"
+        blobs[cid] = data
+        records.append(
+            SimpleNamespace(
+                id=session * 100 + index,
+                # every session uses the same names to catch cross-talk
+                file_name=f"photo_{index}.jpg",
+                file_cid=cid,
+                file_size=len(data),
+                file_hash=hashlib.sha256(data).hexdigest(),
+                compression=None,
+                download_name=f"photo_{index}.jpg",
+            )
+        )
+    return records, blobs
+
+
+def make_compressed_records() -> tuple[list, dict, dict]:
+    """Records stored by /compress/misc without a dictionary."""
+    records, blobs, originals = [], {}, {}
+    for index in range(FILES_PER_SESSION):
+        original = b'{"note": %d, "text": "%s"}' % (index, b"la " * 200)
+        frame = zstd.ZstdCompressor().compress(original)
+        cid = f"cid-zstd-{index}"
+        blobs[cid] = frame
+        originals[cid] = original
+        records.append(
+            SimpleNamespace(
+                id=index,
+                file_name=f"note_{index}.json.zst",
+                file_cid=cid,
+                file_size=len(frame),
+                file_hash=hashlib.sha256(frame).hexdigest(),
+                compression="zstd",
+                compression_dict_id=None,
+                download_name=f"note_{index}.json",
+            )
+        )
+    return records, blobs, originals
+
+
+@contextlib.asynccontextmanager
+async def kubo(monkeypatch, module, blobs: dict):
+    """Serves `blobs` by cid as kubo's cat, for `module`'s fetch engine."""
+
+    async def cat(request):
+        # stagger responses so concurrent downloads interleave
+        await asyncio.sleep(random.random() / 50)
+        return web.Response(body=blobs[request.query["arg"]])
+
+    app = web.Application()
+    app.router.add_post("/api/v0/cat", cat)
+    async with TestServer(app) as server:
+        monkeypatch.setattr(
+            module,
+            "IpfsFetchEngine",
+            functools.partial(
+                IpfsFetchEngine, base_url=str(server.make_url("")), concurrency=4
+            ),
+        )
+        yield
+
+
+async def run_sessions(tmp_path, monkeypatch):
+    blobs = {}
+    sessions = []
+    for session in range(SESSIONS):
+        records, session_blobs = make_records(session)
+        blobs.update(session_blobs)
+        sessions.append(
+            sync_utils.UserDataExtraction(
+                f"user-{session}", None, records, staging_dir=tmp_path
+            )
+        )
+
+    async with kubo(monkeypatch, sync_utils, blobs):
+        await asyncio.gather(*(s.download_file_ipfs() for s in sessions))
+    return sessions, blobs
+
+
+def test_concurrent_sync_sessions_stay_isolated(tmp_path, monkeypatch):
+    cwd = os.getcwd()
+    sessions, blobs = asyncio.run(run_sessions(tmp_path, monkeypatch))
+
+    assert os.getcwd() == cwd
+    assert len({s.new_folder for s in sessions}) == SESSIONS
+    for session in sessions:
+        assert not session.failed
+        summary = json.loads(session.summary_path.read_text())
+        assert len(summary) == FILES_PER_SESSION
+        for path, entry in summary.items():
+            assert os.path.dirname(path) == str(session.new_folder)
+            with open(path, "rb") as f:
+                assert f.read() == blobs[entry["file_cid"]]
+
+        session.cleanup()
+        assert not session.new_folder.exists()
+
+
+def test_sync_download_decompresses_records_without_a_dictionary(
+    tmp_path, monkeypatch
+):
+    records, blobs, originals = make_compressed_records()
+    session = sync_utils.UserDataExtraction("user", None, records, tmp_path)
+
+    async def download():
+        async with kubo(monkeypatch, sync_utils, blobs):
+            await session.download_file_ipfs()
+
+    asyncio.run(download())
+
+    assert not session.failed
+    summary = json.loads(session.summary_path.read_text())
+    assert len(summary) == FILES_PER_SESSION
+    for path, entry in summary.items():
+        original = originals[entry["file_cid"]]
+        with open(path, "rb") as f:
+            assert f.read() == original
+        assert entry["file_size"] == len(original)
+        assert not entry["file_name"].endswith(".zst")
+    session.cleanup()
+
+
+class NoSession:
+    async def __aenter__(self):
+        return None
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+def test_stream_decompresses_records_without_a_dictionary(monkeypatch):
+    records, blobs, originals = make_compressed_records()
+
+    async def get_change_cursor_async(db, user_id):
+        return 42
+
+    async def iter_records(user_id, since=None):
+        for record in records:
+            yield record
+
+    monkeypatch.setattr(sync_stream, "AsyncSessionLocal", NoSession)
+    monkeypatch.setattr(sync_stream, "get_change_cursor_async", get_change_cursor_async)
+    monkeypatch.setattr(sync_stream, "iter_records", iter_records)
+
+    async def stream() -> bytes:
+        async with kubo(monkeypatch, sync_stream, blobs):
+            return b"".join(
+                [chunk async for chunk in sync_stream.stream_library("user", "b0")]
+            )
+
+    parts = asyncio.run(stream()).split(b"--b0")[1:-1]
+    # a file part then its status part per record, then the summary
+    assert len(parts) == 2 * FILES_PER_SESSION + 1
+    for record, file_part, status_part in zip(records, parts[0::2], parts[1::2]):
+        head, body = file_part.split(b"\r\n\r\n", 1)
+        assert body[: -len(b"\r\n")] == originals[record.file_cid]
+        assert f'filename="{record.download_name}"'.encode() in head
+        status = json.loads(status_part.split(b"\r\n\r\n", 1)[1])
+        assert status == {"id": record.id, "ok": True, "size": len(body) - 2}
+    summary = json.loads(parts[-1].split(b"\r\n\r\n", 1)[1])
+    assert summary == {"files": FILES_PER_SESSION, "failed": [], "cursor": 42}